@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import StripeModel, BillingAddress, OrderModel
+from .models import StripeModel, BillingAddress, OrderModel, OrderItem, DailySales, DailyUserSales
 
 class StripeModelAdmin(admin.ModelAdmin):
     list_display = ("id", "email", "card_number", "user", "exp_month", "exp_year", "customer_id", "card_id")
@@ -10,6 +10,18 @@ class BillingAddressModelAdmin(admin.ModelAdmin):
 class OrderModelAdmin(admin.ModelAdmin):
     list_display = ("id", "name", "card_number", "address", "ordered_item", "paid_status", "paid_at", "total_price", "is_delivered", "delivered_at", "user")
 
+class OrderItemAdmin(admin.ModelAdmin):
+    list_display = ("id", "order", "product", "quantity", "unit_price")
+
+class DailySalesAdmin(admin.ModelAdmin):
+    list_display = ("day", "orders", "revenue", "delivered")
+
+class DailyUserSalesAdmin(admin.ModelAdmin):
+    list_display = ("day", "user", "orders", "revenue", "delivered")
+
 admin.site.register(StripeModel, StripeModelAdmin)
 admin.site.register(BillingAddress, BillingAddressModelAdmin)
-admin.site.register(OrderModel, OrderModelAdmin)
\ No newline at end of file
+admin.site.register(OrderModel, OrderModelAdmin)
+admin.site.register(OrderItem, OrderItemAdmin)
+admin.site.register(DailySales, DailySalesAdmin)
+admin.site.register(DailyUserSales, DailyUserSalesAdmin)
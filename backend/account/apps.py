@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class AccountConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'account'
+
+    def ready(self):
+        from .authentication import invalidate_user
+        from .users import create_user_email_index
+
+        # unique email of the users, raw sql on auth_user (see users.py)
+        post_migrate.connect(create_user_email_index, sender=self)
+
+        # the users cached by the JWT authentication (see authentication.py)
+        post_save.connect(invalidate_user, sender="auth.User")
+        post_delete.connect(invalidate_user, sender="auth.User")
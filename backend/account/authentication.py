@@ -0,0 +1,77 @@
+import copy
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTTokenUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from my_project.cache import LocalLRUCache
+
+
+# JWT authentication without a query per request: the token's signature and
+# claims are checked in memory and the user it names is read from a per-process
+# LRU, the database is only asked on a miss. Saving or deleting a user drops it
+# from the LRU of the process doing it (post_save / post_delete), the other
+# processes see the change within USER_CACHE_TTL seconds.
+
+user_cache = LocalLRUCache(settings.USER_CACHE_SIZE)
+
+
+def _token_user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(_("Token contained no recognizable user identification"))
+
+
+def cached_user(user_id):
+    """The cached user record of user_id: (True, user or None when deleted), (False, None) when not cached."""
+    entry = user_cache.get(user_id)
+    if entry is None or time.monotonic() >= entry["until"]:
+        return False, None
+    return True, entry["user"]
+
+
+def cache_user(user_id, user):
+    user_cache.set(user_id, {"user": user, "until": time.monotonic() + settings.USER_CACHE_TTL})
+
+
+def invalidate_user(sender, instance, **kwargs):
+    """Drop a user from the LRU (connected to User post_save / post_delete)."""
+    user_cache.delete(instance.pk)
+    # again once the write is visible, a request that read the old row before
+    # the commit could have cached it
+    transaction.on_commit(lambda: user_cache.delete(instance.pk))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """simplejwt's JWTAuthentication with the users read through the per-process LRU."""
+
+    def get_user(self, validated_token):
+        user_id = _token_user_id(validated_token)
+        found, user = cached_user(user_id)
+        if not found:
+            user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+            cache_user(user_id, user)
+
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        # every request gets its own copy, views may change request.user
+        return copy.copy(user)
+
+
+class TokenOnlyJWTAuthentication(JWTTokenUserAuthentication):
+    """
+    Never queries: the user is built from the token's claims (a TokenUser), users the LRU knows
+    to be deleted or inactive are refused. For views that only need to know the token is valid.
+    """
+
+    def get_user(self, validated_token):
+        found, user = cached_user(_token_user_id(validated_token))
+        if found and (user is None or not user.is_active):
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        return super().get_user(validated_token)
@@ -0,0 +1,35 @@
+from django.db import connections, router, transaction
+from .models import OrderModel
+from .rollups import record_deliveries
+
+
+# Set based updates of many orders at once (the warehouse marks hundreds of
+# orders delivered at a time).
+
+MAX_BATCH_ORDERS = 10000
+
+
+def update_delivery_status(ids, is_delivered, delivered_at):
+    """
+    Set is_delivered / delivered_at of the orders with the given ids, with one UPDATE per
+    batch of ids in a single transaction. Returns (ids of the updated orders, ids not found).
+    """
+    db = router.db_for_write(OrderModel)
+    ids = list(dict.fromkeys(ids))
+    batch_size = connections[db].ops.bulk_batch_size(["id"], ids)
+    found = []
+    with transaction.atomic(using=db):
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            orders = OrderModel.objects.using(db).filter(id__in=batch)
+            # the orders whose status flips (locked until the commit) change the sales rollups
+            rows = list(orders.select_for_update().values_list("id", "is_delivered", "paid_at", "user_id"))
+            orders.update(is_delivered=is_delivered, delivered_at=delivered_at)
+            record_deliveries(
+                [(paid_at, user_id) for _, delivered, paid_at, user_id in rows if delivered != is_delivered],
+                is_delivered,
+            )
+            found += [id for id, _, _, _ in rows]
+
+    missing = sorted(set(ids) - set(found))
+    return found, missing
@@ -0,0 +1,73 @@
+from datetime import datetime, time, timedelta
+from django.db.models import Q, Value
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from .items import orders_of_product
+
+
+# Server side search of the orders list (staff order queue and users' own orders).
+# The filters are backed by the indexes declared on OrderModel.
+
+FILTER_PARAMS = ("paid", "delivered", "paid_from", "paid_to", "user", "product", "q", "cursor", "page_size")
+TRUE_VALUES, FALSE_VALUES = ("true", "1"), ("false", "0")
+
+
+def _boolean(value):
+    value = value.lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(value)
+
+
+def _day_start(value):
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def parse_order_filters(query_params, staff=False):
+    """
+    Return the Q of an orders list request, raising ValidationError (400) for bad values.
+    ?paid= &delivered= (true / false), ?paid_from= &paid_to= (YYYY-MM-DD, both days included),
+    ?user= (staff only), ?product= (orders with an item of the product)
+    and ?q= (text in the name, address or ordered item).
+    """
+    q, errors = Q(), {}
+    # booleans are compared as "col = %s" (not a bare column) so sqlite can use the indexes too
+    for name, field in (("paid", "paid_status"), ("delivered", "is_delivered")):
+        if query_params.get(name):
+            try:
+                q &= Q(**{field: Value(_boolean(query_params[name]))})
+            except ValueError:
+                errors[name] = ["Must be true or false."]
+
+    for name, lookup, days in (("paid_from", "paid_at__gte", 0), ("paid_to", "paid_at__lt", 1)):
+        if query_params.get(name):
+            try:
+                q &= Q(**{lookup: _day_start(query_params[name]) + timedelta(days=days)})
+            except ValueError:
+                errors[name] = ["A valid date (YYYY-MM-DD) is required."]
+
+    if query_params.get("user") and staff:
+        try:
+            q &= Q(user_id=int(query_params["user"]))
+        except ValueError:
+            errors["user"] = ["A valid integer is required."]
+
+    if query_params.get("product"):
+        try:
+            q &= Q(id__in=orders_of_product(int(query_params["product"])))
+        except ValueError:
+            errors["product"] = ["A valid integer is required."]
+
+    terms = query_params.get("q", "").strip()
+    if terms:
+        q &= Q(name__icontains=terms) | Q(address__icontains=terms) | Q(ordered_item__icontains=terms)
+
+    if errors:
+        raise ValidationError(errors)
+    return q
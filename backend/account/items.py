@@ -0,0 +1,75 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
+from product.models import Product
+from .models import OrderItem, OrderModel
+
+
+# The products of the orders as OrderItem rows, so "orders of product X" and
+# "units sold per product" are read from order_item_product_idx instead of
+# searching the ordered_item text. New orders get their items in the transaction
+# that creates them (record_items), orders placed before that are given theirs
+# by backfill_items (the backfill_order_items command).
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def record_items(order, product_id, quantity):
+    """Save the item of an order of quantity units of a product, at the product's current price."""
+    unit_price = Product.objects.values_list("price", flat=True).get(id=product_id)
+    return OrderItem.objects.create(order=order, product_id=product_id, quantity=quantity, unit_price=unit_price)
+
+
+def orders_of_product(product_id):
+    """The ids of the orders with an item of product_id (a subquery, for OrderModel.objects.filter(id__in=...))."""
+    return OrderItem.objects.filter(product_id=product_id).values("order_id")
+
+
+def product_sales(product_ids=None, orders=None):
+    """
+    Units sold and revenue per product, as {product_id: {"units", "revenue"}}, of every product
+    (or of product_ids) over every order (or over the orders queryset, e.g. a range of paid_at).
+    """
+    items = OrderItem.objects.filter(product__isnull=False)
+    if product_ids is not None:
+        items = items.filter(product_id__in=product_ids)
+    if orders is not None:
+        items = items.filter(order__in=orders.values("id"))
+    line_total = ExpressionWrapper(F("quantity") * F("unit_price"), output_field=DecimalField(max_digits=14, decimal_places=2))
+    rows = (
+        items.values("product_id")
+        .annotate(units=Sum("quantity"), revenue=Coalesce(Sum(line_total), Decimal(0)))
+        .order_by("product_id")
+    )
+    return {row["product_id"]: {"units": row["units"], "revenue": row["revenue"]} for row in rows}
+
+
+def backfill_items(batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Give the orders without items one item, of the product named by their ordered_item (one unit
+    at the order's total price, the quantity was never stored), batch_size orders per transaction.
+    Yields (last order id of the batch, items created, orders left without item) per batch.
+    """
+    products = {}
+    for id, name in Product.objects.order_by("-id").values_list("id", "name").iterator():
+        # when names repeat, the oldest product wins
+        products[name] = id
+
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            orders = list(
+                OrderModel.objects.filter(id__gt=last_id, items__isnull=True)
+                .order_by("id").values_list("id", "ordered_item", "total_price")[:batch_size]
+            )
+            if not orders:
+                return
+            items = [
+                OrderItem(order_id=id, product_id=products[name], quantity=1, unit_price=total_price or 0)
+                for id, name, total_price in orders
+                if name in products
+            ]
+            OrderItem.objects.bulk_create(items, batch_size=batch_size)
+        last_id = orders[-1][0]
+        yield last_id, len(items), len(orders) - len(items)
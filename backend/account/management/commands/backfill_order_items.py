@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from account.items import BACKFILL_BATCH_SIZE, backfill_items
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the items of the orders placed before orders had items, matching their ordered_item "
+        "to a product name, a batch of orders per transaction. Safe to run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        created = unmatched = 0
+        for last_id, items, left in backfill_items(batch_size=options["batch_size"]):
+            created += items
+            unmatched += left
+            self.stdout.write(f"up to order {last_id}: {items} items created, {left} orders without a matching product")
+        self.stdout.write(f"done, {created} items created, {unmatched} orders without a matching product")
@@ -0,0 +1,74 @@
+import time
+import threading
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark a burst of logins: threads log in over and over while other threads request "
+        "another endpoint, then report the login throughput and the latency of both. Compare runs "
+        "with PASSWORD_HASHING_WORKERS set to different sizes (in the environment)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=10)
+        parser.add_argument("--login-threads", type=int, default=32)
+        parser.add_argument("--other-threads", type=int, default=4)
+        parser.add_argument("--other-url", default="/api/products/", help="endpoint requested during the logins")
+
+    def handle(self, *args, **options):
+        password = "benchmark-password-1234"
+        user = User.objects.create_user(username="benchmark-login", email="benchmark-login@example.com", password=password)
+        login_url = reverse("login-page")
+        credentials = {"username": user.username, "password": password}
+        lock = threading.Lock()
+        stats = {"login": [], "other": [], "errors": 0}
+        deadline = time.perf_counter() + options["seconds"]
+
+        def run(kind, request):
+            client, latencies, errors = Client(), [], 0
+            try:
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    response = request(client)
+                    if response.status_code == 200:
+                        latencies.append(time.perf_counter() - start)
+                    else:
+                        errors += 1
+            finally:
+                with lock:
+                    stats[kind] += latencies
+                    stats["errors"] += errors
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=run, args=("login", lambda client: client.post(login_url, credentials)))
+            for _ in range(options["login_threads"])
+        ] + [
+            threading.Thread(target=run, args=("other", lambda client: client.get(options["other_url"])))
+            for _ in range(options["other_threads"])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        user.delete()
+
+        for kind, name in (("login", "logins"), ("other", options["other_url"])):
+            latencies = sorted(stats[kind])
+            count = len(latencies)
+
+            def percentile(p):
+                return latencies[min(count - 1, int(count * p))] * 1000 if count else 0
+
+            self.stdout.write(
+                f"{name}: {count} in {elapsed:.2f}s ({count / elapsed:.0f}/s), "
+                f"latency ms p50: {percentile(0.5):.2f}, p95: {percentile(0.95):.2f}, p99: {percentile(0.99):.2f}"
+            )
+        self.stdout.write(f"errors: {stats['errors']}")
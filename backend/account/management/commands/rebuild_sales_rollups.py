@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from account.models import OrderModel
+from account.rollups import BACKFILL_DAYS, order_day, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily sales rollups from the orders, a chunk of days per transaction "
+        "(by default every day that has orders). Best run while few orders are being placed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="first day to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--until", help="last day to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--chunk-days", type=int, default=BACKFILL_DAYS)
+
+    def handle(self, *args, **options):
+        bounds = OrderModel.objects.aggregate(first=Min("paid_at"), last=Max("paid_at"))
+        if bounds["first"] is None and not (options["since"] and options["until"]):
+            self.stdout.write("no paid orders, nothing to rebuild")
+            return
+
+        since = parse_date(options["since"]) if options["since"] else order_day(bounds["first"])
+        until = parse_date(options["until"]) if options["until"] else max(order_day(bounds["last"]), timezone.localdate())
+        if since is None or until is None or since > until:
+            raise CommandError("--since and --until must be dates (YYYY-MM-DD), since not after until")
+
+        for start, end in rebuild_rollups(since, until, chunk_days=options["chunk_days"]):
+            self.stdout.write(f"{start} - {end}: done")
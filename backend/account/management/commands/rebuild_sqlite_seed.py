@@ -0,0 +1,115 @@
+import os
+import sqlite3
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+
+# The seed data (db.sqlite3) was made with the models of its time, and the
+# migrations are generated when the image is built, so its migration history
+# says they are applied whatever its tables look like. Instead of migrating it
+# in place, a new database is migrated (tables, indexes and the rows the
+# post_migrate handlers add: content types, permissions) and the rows of the
+# seed are copied into it. Columns the seed doesn't have get the default of
+# their field, references to content types and permissions are matched by name.
+
+
+def _table_columns(old, table):
+    return {row[1] for row in old.execute(f'PRAGMA table_info("{table}")')}
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the SQLite seed data with the tables of the current models and the rows it has, "
+        "before it is dumped into the main database (see start_app.sh)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="sqlite", help="alias of the seed database")
+
+    def handle(self, *args, **options):
+        db = options["database"]
+        path = str(settings.DATABASES[db]["NAME"])
+        if not os.path.exists(path):
+            raise CommandError(f"no seed data at {path}")
+
+        connections[db].close()
+        previous = f"{path}.previous"
+        os.replace(path, previous)
+        try:
+            call_command("migrate", database=db, interactive=False, verbosity=0)
+            old = sqlite3.connect(previous)
+            try:
+                copied = self.copy_rows(old, db)
+            finally:
+                old.close()
+        except BaseException:
+            connections[db].close()
+            os.replace(previous, path)
+            raise
+        os.remove(previous)
+        self.stdout.write(f"copied {copied} rows into the rebuilt seed data")
+
+    def copy_rows(self, old, db):
+        connection = connections[db]
+        tables = {name for (name,) in old.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+        # the ids of the content types and permissions the new database got
+        content_types = {
+            (app_label, model): id for id, app_label, model in ContentType.objects.using(db).values_list("id", "app_label", "model")
+        }
+        content_type_ids = {
+            id: content_types.get((app_label, model))
+            for id, app_label, model in old.execute("SELECT id, app_label, model FROM django_content_type")
+        }
+        permissions = {
+            (content_type_id, codename): id
+            for id, content_type_id, codename in Permission.objects.using(db).values_list("id", "content_type_id", "codename")
+        }
+        permission_ids = {
+            id: permissions.get((content_type_ids.get(content_type_id), codename))
+            for id, content_type_id, codename in old.execute("SELECT id, content_type_id, codename FROM auth_permission")
+        }
+        renumbered = {ContentType: content_type_ids, Permission: permission_ids}
+
+        copied = 0
+        # the foreign keys are checked at the commit (sqlite's are deferred), the order of the tables doesn't matter
+        with transaction.atomic(using=db):
+            for model in apps.get_models(include_auto_created=True):
+                table = model._meta.db_table
+                if model in renumbered or not model._meta.managed or model._meta.proxy or table not in tables:
+                    continue
+                columns = _table_columns(old, table)
+                fields = model._meta.local_concrete_fields
+                for field in fields:
+                    if field.column not in columns and not field.null and not field.has_default():
+                        raise CommandError(f"{table}.{field.column} is missing from the seed data and has no default")
+
+                kept = [field for field in fields if field.column in columns]
+                select = ", ".join(connection.ops.quote_name(field.column) for field in kept)
+                insert = (
+                    f"INSERT INTO {connection.ops.quote_name(table)} "
+                    f"({', '.join(connection.ops.quote_name(field.column) for field in fields)}) "
+                    f"VALUES ({', '.join(['%s'] * len(fields))})"
+                )
+                rows = []
+                for values in old.execute(f"SELECT {select} FROM {connection.ops.quote_name(table)}"):
+                    values = dict(zip([field.column for field in kept], values))
+                    row = []
+                    for field in fields:
+                        if field.column not in values:
+                            value = field.get_db_prep_save(field.get_default(), connection) if field.has_default() else None
+                        elif field.is_relation and field.related_model in renumbered:
+                            value = renumbered[field.related_model].get(values[field.column])
+                        else:
+                            value = values[field.column]
+                        row.append(value)
+                    rows.append(row)
+                with connection.cursor() as cursor:
+                    cursor.executemany(insert, rows)
+                copied += len(rows)
+        return copied
@@ -17,6 +17,8 @@ class StripeModel(models.Model):
     address_country = models.CharField(max_length=120, null=True, blank=True)
     address_state = models.CharField(max_length=120, null=True, blank=True)
     address_zip = models.CharField(max_length=6, validators=[RegexValidator(r'^\d{0,9}$')], null=True, blank=True)
+    # the card as stripe last returned it, served by the card details view (see payments/cards.py)
+    stripe_card = models.JSONField(null=True, blank=True)
 
     def __str__(self):
         return self.email
@@ -46,4 +48,60 @@ class OrderModel(models.Model):
     total_price = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
     is_delivered = models.BooleanField(default=False)
     delivered_at = models.CharField(max_length=200, null=True, blank=True)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True) 
+    # indexed by order_user_idx below (it also serves the foreign key lookups)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_index=False)
+
+    class Meta:
+        # the order search (see filters.py) pages newest first by id, every index ends
+        # with id so a filtered page is read in index order without a sort
+        indexes = [
+            models.Index(fields=["user", "id"], name="order_user_idx"),
+            models.Index(fields=["paid_at", "id"], name="order_paid_at_idx"),
+            models.Index(fields=["is_delivered", "paid_status", "id"], name="order_delivery_queue_idx"),
+        ]
+
+
+
+# the products of an order (ordered_item is only the text shown to the customer)
+class OrderItem(models.Model):
+    order = models.ForeignKey(OrderModel, related_name="items", on_delete=models.CASCADE)
+    # indexed by order_item_product_idx below, kept (as null) when the product is deleted
+    product = models.ForeignKey(
+        "product.Product", related_name="orderitems", on_delete=models.SET_NULL, null=True, blank=True, db_index=False
+    )
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2)
+
+    class Meta:
+        # the orders of a product and its units / revenue (see items.py) are read from
+        # this index alone, without visiting the table
+        indexes = [
+            models.Index(fields=["product", "order", "quantity", "unit_price"], name="order_item_product_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.order_id} {self.product_id} x {self.quantity}"
+
+# SALES ROLLUPS (kept up to date by rollups.py as orders are placed and delivered)
+class DailySales(models.Model):
+    day = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    delivered = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.day)
+
+
+class DailyUserSales(models.Model):
+    day = models.DateField()
+    user = models.ForeignKey(User, related_name="dailysales", on_delete=models.CASCADE)
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    delivered = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "day"], name="daily_user_sales_unique")]
+
+    def __str__(self):
+        return f"{self.day} {self.user_id}"
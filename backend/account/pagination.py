@@ -0,0 +1,10 @@
+from rest_framework.pagination import CursorPagination
+
+
+# keyset (cursor) pagination for the orders list, newest first, so paging deep into
+# millions of orders costs the same as the first page
+class OrderCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = "-id"
@@ -0,0 +1,124 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+from .models import DailySales, DailyUserSales, OrderModel
+
+
+# Sales per day (and per day per user) kept in rollup tables, so analytics read a
+# row per day instead of scanning the orders. Orders count on the day they were
+# paid, orders without paid_at are not counted. The rollups are changed in the
+# same transaction as the order (record_order / record_delivery) and can be
+# rebuilt from the orders with rebuild_rollups (the rebuild_sales_rollups command).
+
+BACKFILL_DAYS = 31
+
+
+def order_day(paid_at):
+    return timezone.localdate(paid_at) if timezone.is_aware(paid_at) else paid_at.date()
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _add(model, lookup, deltas, create=True):
+    # increment the row of lookup, creating it the first time (another transaction
+    # may create it at the same moment, then the increment is retried)
+    # never below zero (orders from before the rollups were built aren't counted)
+    changes = {name: F(name) + value if value >= 0 else Greatest(F(name) + value, 0) for name, value in deltas.items()}
+    rows = model.objects.filter(**lookup)
+    for _ in range(2):
+        if rows.update(**changes) or not create:
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **deltas)
+            return
+        except IntegrityError:
+            pass
+    raise IntegrityError(f"could not update the {model.__name__} row of {lookup}")
+
+
+def record_order(order):
+    """Count a new order in the rollups, call it in the transaction that creates the order."""
+    if order.paid_at is None:
+        return
+    day = order_day(order.paid_at)
+    deltas = {
+        "orders": 1,
+        "revenue": Decimal(str(order.total_price or 0)),
+        "delivered": 1 if order.is_delivered else 0,
+    }
+    _add(DailySales, {"day": day}, deltas)
+    if order.user_id is not None:
+        _add(DailyUserSales, {"day": day, "user_id": order.user_id}, deltas)
+
+
+def record_delivery(order, delivered):
+    """Count an order's change of delivery status, call it in the transaction that saves the change."""
+    record_deliveries([(order.paid_at, order.user_id)], delivered)
+
+
+def record_deliveries(orders, delivered):
+    """
+    Count the change of delivery status of many orders, given as (paid_at, user_id) pairs,
+    with one update per day (and per day and user) they were paid on.
+    """
+    sign = 1 if delivered else -1
+    days, user_days = {}, {}
+    for paid_at, user_id in orders:
+        if paid_at is None:
+            continue
+        day = order_day(paid_at)
+        days[day] = days.get(day, 0) + 1
+        if user_id is not None:
+            user_days[day, user_id] = user_days.get((day, user_id), 0) + 1
+
+    # the day of an order without a row predates the rollups, the backfill counts it
+    for day, count in days.items():
+        _add(DailySales, {"day": day}, {"delivered": sign * count}, create=False)
+    for (day, user_id), count in user_days.items():
+        _add(DailyUserSales, {"day": day, "user_id": user_id}, {"delivered": sign * count}, create=False)
+
+
+def _aggregate(orders, *group_by):
+    return (
+        orders.annotate(day=TruncDate("paid_at"))
+        .values("day", *group_by)
+        .annotate(
+            count=Count("id"),
+            total=Coalesce(Sum("total_price"), Decimal(0)),
+            delivered_count=Count("id", filter=Q(is_delivered=True)),
+        )
+        .order_by()
+    )
+
+
+def rebuild_rollups(since, until, chunk_days=BACKFILL_DAYS):
+    """
+    Recompute the rollups of the days since..until (dates, both included) from the orders,
+    chunk_days days per transaction. Yields each chunk's (first day, last day) once it is done.
+    """
+    start = since
+    while start <= until:
+        end = min(until, start + timedelta(days=chunk_days - 1))
+        orders = OrderModel.objects.filter(paid_at__gte=day_start(start), paid_at__lt=day_start(end + timedelta(days=1)))
+        with transaction.atomic():
+            DailySales.objects.filter(day__range=(start, end)).delete()
+            DailyUserSales.objects.filter(day__range=(start, end)).delete()
+            DailySales.objects.bulk_create([
+                DailySales(day=row["day"], orders=row["count"], revenue=row["total"], delivered=row["delivered_count"])
+                for row in _aggregate(orders)
+            ], batch_size=1000)
+            DailyUserSales.objects.bulk_create([
+                DailyUserSales(
+                    day=row["day"], user_id=row["user"], orders=row["count"],
+                    revenue=row["total"], delivered=row["delivered_count"],
+                )
+                for row in _aggregate(orders.filter(user__isnull=False), "user")
+            ], batch_size=1000)
+        yield start, end
+        start = end + timedelta(days=1)
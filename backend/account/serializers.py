@@ -1,4 +1,4 @@
-from .models import StripeModel, BillingAddress, OrderModel
+from .models import StripeModel, BillingAddress, OrderModel, DailySales
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -49,4 +49,11 @@ class AllOrdersListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = OrderModel
-        fields = "__all__"
\ No newline at end of file
+        fields = "__all__"
+
+# sales of a day (from the rollups)
+class DailySalesSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = DailySales
+        fields = ["day", "orders", "revenue", "delivered"]
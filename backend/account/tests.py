@@ -1,14 +1,36 @@
+import io
+import json
+import threading
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
 from account import views
 from django.http import response
-from django.test import TestCase, Client
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.db.models import Sum
+from django.http import QueryDict
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, Client
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from my_project.hashers import PooledPBKDF2PasswordHasher
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework.test import force_authenticate
 from rest_framework.test import APIRequestFactory
 from django.contrib.auth.models import User
 from rest_framework.test import force_authenticate
-from .models import BillingAddress, OrderModel, StripeModel
+from rest_framework.renderers import JSONRenderer
+from my_project.streaming import stream_json_array
+from product.models import Product
+from .models import BillingAddress, DailySales, DailyUserSales, OrderItem, OrderModel, StripeModel
+from .authentication import user_cache
+from .items import orders_of_product, product_sales, record_items
+from .rollups import record_order
+from .filters import parse_order_filters
+from .serializers import AllOrdersListSerializer
 from .views import CardsListView, ChangeOrderStatus, CreateUserAddressView, DeleteUserAddressView, OrdersListView, UpdateUserAddressView, UserAccountDeleteView, UserAccountDetailsView, UserAccountUpdateView, UserAddressDetailsView, UserAddressesListView
 
 
@@ -389,3 +411,468 @@ class AccountApisAuthTest(AccountApisSetUp):
     def test_fetching_of_user_stripe_card_when_logged_out(self):
         response = self.client.get('/account/stripe-cards/')
         self.assertEqual(response.status_code, 401) # Unauthorized
+
+
+class OrdersListStreamingTest(AccountApisSetUp):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(4):
+            OrderModel.objects.create(
+                name = "admin",
+                ordered_item = f"item  {i}",
+                total_price = "10.00",
+                user = self.admin_user
+            )
+
+    def test_staff_orders_list_is_streamed(self):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(reverse("all-orders-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        # same body as the serializer rendered in one piece
+        expected = JSONRenderer().render(AllOrdersListSerializer(OrderModel.objects.order_by("id"), many=True).data)
+        self.assertEqual(b"".join(response.streaming_content), expected)
+
+    def test_user_only_gets_own_orders(self):
+        self.client.force_authenticate(user=self.normal_user)
+        response = self.client.get(reverse("all-orders-list"))
+        orders = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([order["id"] for order in orders], [self.dummy_order.id])
+
+    def test_rows_are_sent_in_chunks(self):
+        chunks = list(stream_json_array(OrderModel.objects.order_by("id"), AllOrdersListSerializer, chunk_size=2))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(json.loads(b"".join(chunks))), 5)
+
+    def test_array_is_closed_for_any_row_count(self):
+        self.assertEqual(b"".join(stream_json_array(OrderModel.objects.none(), AllOrdersListSerializer)), b"[]")
+        # rows filling the last chunk exactly
+        chunks = stream_json_array(OrderModel.objects.order_by("id")[:2], AllOrdersListSerializer, chunk_size=2)
+        self.assertEqual(len(json.loads(b"".join(chunks))), 2)
+
+
+class OrderSearchTest(AccountApisSetUp):
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        for i in range(6):
+            OrderModel.objects.create(
+                name = "admin",
+                ordered_item = "office desk" if i % 2 else "lamp",
+                address = "new york",
+                paid_status = True,
+                paid_at = now - timedelta(days=i),
+                total_price = "10.00",
+                is_delivered = i < 2,
+                user = self.admin_user
+            )
+        self.client.force_authenticate(user=self.admin_user)
+
+    def search(self, query):
+        response = self.client.get(f"{reverse('all-orders-list')}?{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_filter_on_status_and_text(self):
+        page = self.search("delivered=false&q=desk")
+        self.assertEqual([order["ordered_item"] for order in page["results"]], ["office desk", "office desk"])
+        self.assertFalse(any(order["is_delivered"] for order in page["results"]))
+
+    def test_filter_on_paid_date_range(self):
+        today = timezone.localdate()
+        page = self.search(f"paid_from={today - timedelta(days=2)}&paid_to={today}")
+        # the three admin orders of the last days, plus testuser's order placed today
+        self.assertEqual(len(page["results"]), 4)
+
+    def test_filter_on_user(self):
+        page = self.search(f"user={self.normal_user.id}")
+        self.assertEqual([order["id"] for order in page["results"]], [self.dummy_order.id])
+
+    def test_users_only_search_their_own_orders(self):
+        self.client.force_authenticate(user=self.normal_user)
+        page = self.search(f"user={self.admin_user.id}")
+        self.assertEqual([order["id"] for order in page["results"]], [self.dummy_order.id])
+
+    def test_cursor_pages_newest_first(self):
+        ids, url = [], f"{reverse('all-orders-list')}?page_size=2"
+        while url:
+            page = self.client.get(url).json()
+            ids += [order["id"] for order in page["results"]]
+            url = page["next"]
+        self.assertEqual(ids, list(OrderModel.objects.order_by("-id").values_list("id", flat=True)))
+
+    def test_invalid_filters(self):
+        url = reverse("all-orders-list")
+        self.assertEqual(self.client.get(f"{url}?paid=maybe").status_code, 400)
+        self.assertEqual(self.client.get(f"{url}?paid_from=yesterday").status_code, 400)
+        self.assertEqual(self.client.get(f"{url}?user=admin").status_code, 400)
+
+
+class OrderQueryPlanTest(TestCase):
+
+    def assertUsesIndex(self, queryset, index, sorted=True):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf"USING (COVERING )?INDEX {index}\b")
+        self.assertNotRegex(plan, r"SCAN (TABLE )?account_ordermodel(?! USING)")
+        if sorted:
+            self.assertNotIn("TEMP B-TREE", plan)
+
+    def setUp(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("the plans below are sqlite's")
+
+    def orders(self, query):
+        return OrderModel.objects.filter(parse_order_filters(QueryDict(query), staff=True)).order_by("-id")
+
+    def test_delivery_queue_uses_index(self):
+        self.assertUsesIndex(self.orders("delivered=false&paid=true"), "order_delivery_queue_idx")
+
+    def test_user_orders_use_index(self):
+        self.assertUsesIndex(self.orders("user=1"), "order_user_idx")
+
+    def test_paid_date_range_uses_index(self):
+        self.assertUsesIndex(self.orders("paid_from=2021-01-01&paid_to=2021-01-31"), "order_paid_at_idx", sorted=False)
+
+    def test_orders_of_product_use_index(self):
+        self.assertUsesIndex(orders_of_product(1), "order_item_product_idx")
+
+    def test_product_sales_use_index(self):
+        plan = OrderItem.objects.filter(product_id__in=[1, 2]).values("product_id").annotate(units=Sum("quantity")).order_by("product_id").explain()
+        self.assertRegex(plan, r"USING COVERING INDEX order_item_product_idx\b")
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+class SalesRollupTest(AccountApisSetUp):
+
+    def setUp(self):
+        super().setUp()
+        # the order created by AccountApisSetUp predates the rollups
+        call_command("rebuild_sales_rollups", stdout=io.StringIO())
+        self.today = timezone.localdate()
+
+    def place_order(self, user, total_price, days_ago=0):
+        order = OrderModel.objects.create(
+            name = user.username,
+            ordered_item = "lamp",
+            paid_status = True,
+            paid_at = timezone.now() - timedelta(days=days_ago),
+            total_price = total_price,
+            user = user
+        )
+        record_order(order)
+        return order
+
+    def analytics(self, query=""):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(f"{reverse('sales-analytics')}?{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_orders_are_counted_incrementally(self):
+        self.place_order(self.admin_user, "10.50")
+        self.place_order(self.admin_user, "20.00", days_ago=1)
+
+        data = self.analytics()
+        self.assertEqual(len(data["days"]), 30)
+        self.assertEqual(data["days"][-1], {"day": str(self.today), "orders": 2, "revenue": "6010.49", "delivered": 0})
+        self.assertEqual(data["totals"], {"orders": 3, "revenue": "6030.49", "delivered": 0})
+
+    def test_per_user_sales(self):
+        self.place_order(self.admin_user, "10.50")
+        data = self.analytics(f"user={self.normal_user.id}")
+        self.assertEqual(data["totals"], {"orders": 1, "revenue": "5999.99", "delivered": 0})
+
+    def test_delivery_changes_are_counted(self):
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse("change-order-status", args=[self.dummy_order.id])
+        self.client.put(url, {"is_delivered": True, "delivered_at": "today"}, format="json")
+        self.client.put(url, {"is_delivered": True, "delivered_at": "today"}, format="json")
+        self.assertEqual(self.analytics()["totals"]["delivered"], 1)
+        self.client.put(url, {"is_delivered": False, "delivered_at": "Not Delivered"}, format="json")
+        self.assertEqual(self.analytics()["totals"]["delivered"], 0)
+
+    def test_invalid_delivery_change_is_refused(self):
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse("change-order-status", args=[self.dummy_order.id])
+        self.assertEqual(self.client.put(url, {"is_delivered": "maybe", "delivered_at": "today"}, format="json").status_code, 400)
+        self.assertEqual(self.client.put(url, {"delivered_at": "today"}, format="json").status_code, 400)
+        self.assertEqual(self.analytics()["totals"]["delivered"], 0)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        for days_ago in (0, 0, 3, 40):
+            self.place_order(self.normal_user, "5.00", days_ago=days_ago)
+        incremental = list(DailyUserSales.objects.order_by("day").values("day", "user", "orders", "revenue", "delivered"))
+
+        DailySales.objects.all().delete()
+        DailyUserSales.objects.all().delete()
+        call_command("rebuild_sales_rollups", chunk_days=7, stdout=io.StringIO())
+        rebuilt = list(DailyUserSales.objects.order_by("day").values("day", "user", "orders", "revenue", "delivered"))
+        self.assertEqual(rebuilt, incremental)
+        self.assertEqual(DailySales.objects.get(day=self.today).orders, 3)
+
+    def test_analytics_for_staff_only(self):
+        self.client.force_authenticate(user=self.normal_user)
+        self.assertEqual(self.client.get(reverse("sales-analytics")).status_code, 403)
+
+    def test_analytics_with_invalid_range(self):
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse("sales-analytics")
+        self.assertEqual(self.client.get(f"{url}?from=2021-02-30").status_code, 400)
+        self.assertEqual(self.client.get(f"{url}?from=2021-02-01&to=2021-01-01").status_code, 400)
+        self.assertEqual(self.client.get(f"{url}?from=2020-01-01&to=2021-12-31").status_code, 400)
+
+
+class BulkOrderStatusTest(AccountApisSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.orders = [self.dummy_order] + [
+            OrderModel.objects.create(
+                name = "testuser",
+                ordered_item = "lamp",
+                paid_status = True,
+                paid_at = timezone.now() - timedelta(days=i),
+                total_price = "10.00",
+                user = self.normal_user
+            )
+            for i in range(3)
+        ]
+        call_command("rebuild_sales_rollups", stdout=io.StringIO())
+        self.url = reverse("change-orders-status")
+        self.client.force_authenticate(user=self.admin_user)
+
+    def change(self, ids, is_delivered=True):
+        return self.client.put(self.url, {"ids": ids, "is_delivered": is_delivered, "delivered_at": "today"}, format="json")
+
+    def test_updates_the_orders_and_reports_unknown_ids(self):
+        ids = [order.id for order in self.orders]
+        response = self.change(ids + [9999, ids[0]])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order["id"] for order in response.data["updated"]], ids)
+        self.assertTrue(all(order["is_delivered"] and order["delivered_at"] == "today" for order in response.data["updated"]))
+        self.assertEqual(response.data["not_found"], [9999])
+        self.assertEqual(OrderModel.objects.filter(is_delivered=True).count(), 4)
+
+    def test_one_update_for_the_batch(self):
+        ids = [order.id for order in self.orders]
+        # lock and read the rows, update them, rollups of 3 days and users, then read them back
+        with self.assertNumQueries(2 + 6 + 1 + 2):
+            self.change(ids)
+
+    def test_delivery_changes_are_counted(self):
+        ids = [order.id for order in self.orders]
+        self.change(ids[:2])
+        self.change(ids)
+        self.assertEqual(DailySales.objects.aggregate(total=Sum("delivered"))["total"], 4)
+        self.assertEqual(DailyUserSales.objects.aggregate(total=Sum("delivered"))["total"], 4)
+        self.change(ids[1:], is_delivered=False)
+        self.assertEqual(DailySales.objects.aggregate(total=Sum("delivered"))["total"], 1)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.change("1,2").status_code, 400)
+        self.assertEqual(self.change(["1"]).status_code, 400)
+        self.assertEqual(self.change([self.dummy_order.id], is_delivered="maybe").status_code, 400)
+        self.assertFalse(OrderModel.objects.filter(is_delivered=True).exists())
+
+    def test_for_staff_only(self):
+        self.client.force_authenticate(user=self.normal_user)
+        self.assertEqual(self.change([self.dummy_order.id]).status_code, 403)
+
+
+class OrderItemTest(AccountApisSetUp):
+
+    def setUp(self):
+        super().setUp()
+        self.chair = Product.objects.create(name="computer chair", price="5999.99", stock=True)
+        self.lamp = Product.objects.create(name="lamp", price="10.00", stock=True)
+        self.client.force_authenticate(user=self.admin_user)
+
+    def place_order(self, product, quantity, days_ago=0):
+        order = OrderModel.objects.create(
+            name = "testuser",
+            ordered_item = product.name,
+            paid_status = True,
+            paid_at = timezone.now() - timedelta(days=days_ago),
+            total_price = Decimal(product.price) * quantity,
+            user = self.normal_user
+        )
+        record_items(order, product.id, quantity)
+        return order
+
+    def test_product_sales(self):
+        self.place_order(self.lamp, 3)
+        self.place_order(self.lamp, 2, days_ago=10)
+        self.place_order(self.chair, 1)
+        self.assertEqual(product_sales(), {
+            self.chair.id: {"units": 1, "revenue": Decimal("5999.99")},
+            self.lamp.id: {"units": 5, "revenue": Decimal("50.00")},
+        })
+
+        url = reverse("product-sales-analytics")
+        response = self.client.get(f"{url}?product={self.lamp.id}&from={timezone.localdate() - timedelta(days=1)}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{"product": self.lamp.id, "name": "lamp", "units": 3, "revenue": "30.00"}])
+        self.assertEqual(self.client.get(f"{url}?from=yesterday").status_code, 400)
+
+    def test_orders_of_product(self):
+        order = self.place_order(self.lamp, 1)
+        self.place_order(self.chair, 1)
+        page = self.client.get(f"{reverse('all-orders-list')}?product={self.lamp.id}").json()
+        self.assertEqual([row["id"] for row in page["results"]], [order.id])
+
+    def test_sales_are_kept_when_the_product_is_deleted(self):
+        order = self.place_order(self.lamp, 1)
+        self.lamp.delete()
+        self.assertEqual(order.items.get().unit_price, Decimal("10.00"))
+        self.assertEqual(product_sales(), {})
+
+    def test_backfill(self):
+        # the order created by AccountApisSetUp has no items, one without a matching product
+        OrderModel.objects.create(name="testuser", ordered_item="gone", total_price="1.00")
+        out = io.StringIO()
+        call_command("backfill_order_items", batch_size=1, stdout=out)
+        item = self.dummy_order.items.get()
+        self.assertEqual((item.product_id, item.quantity, item.unit_price), (self.chair.id, 1, Decimal("5999.99")))
+        self.assertIn("done, 1 items created, 1 orders without a matching product", out.getvalue())
+
+        # again, nothing is created twice
+        call_command("backfill_order_items", stdout=io.StringIO())
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+
+class RegistrationTest(AccountApisSetUp):
+
+    def register(self, username, email):
+        return self.client.post(self.register_url, {"username": username, "email": email, "password": "pass1234"}, format="json")
+
+    def test_registration_is_a_single_insert(self):
+        # the insert, nothing counted beforehand (the savepoint is the test's transaction)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.register("newuser", "newuser@gmail.com").status_code, 200)
+        statements = [query["sql"] for query in queries if "SAVEPOINT" not in query["sql"]]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('INSERT INTO "auth_user"'))
+        self.assertTrue(User.objects.get(username="newuser").check_password("pass1234"))
+
+    def test_taken_username_or_email(self):
+        response = self.register("testuser", "other@gmail.com")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data["detail"], "A user with that username already exist!")
+        response = self.register("other", "testuser@gmail.com")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data["detail"], "A user with that email address already exist!")
+        self.assertEqual(User.objects.count(), 2)
+
+    def test_users_without_email_are_not_unique(self):
+        User.objects.create_user(username="first")
+        User.objects.create_user(username="second")
+
+    def test_update_to_a_taken_email(self):
+        self.client.force_authenticate(user=self.normal_user)
+        response = self.client.put(
+            reverse("user-update", args=[self.normal_user.id]),
+            {"username": "testuser", "email": "admin@gmail.com", "password": ""},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 403)
+        self.normal_user.refresh_from_db()
+        self.assertEqual(self.normal_user.email, "testuser@gmail.com")
+
+    def test_passwords_are_hashed_on_the_pool(self):
+        with mock.patch.object(PBKDF2PasswordHasher, "encode", side_effect=lambda *args: threading.current_thread().name):
+            self.assertTrue(PooledPBKDF2PasswordHasher().encode("secret", "salt").startswith("password-hashing"))
+        # same hashes as django's PBKDF2
+        self.assertEqual(
+            PooledPBKDF2PasswordHasher().encode("secret", "salt", 1000),
+            PBKDF2PasswordHasher().encode("secret", "salt", 1000),
+        )
+
+
+# the benchmark's threads need to see the committed user
+class LoginBenchmarkTest(TransactionTestCase):
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command(
+            "benchmark_logins", seconds=0.5, login_threads=1, other_threads=1,
+            other_url="/account/analytics/", stdout=out,
+        )
+        self.assertRegex(out.getvalue(), r"logins: [1-9]\d* in")
+        self.assertFalse(User.objects.exists())
+
+
+class CachedJWTAuthenticationTest(AccountApisSetUp):
+
+    def setUp(self):
+        super().setUp()
+        user_cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.normal_user)}")
+
+    def test_users_are_read_once(self):
+        # the user, then the cards
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get("/account/stripe-cards/").status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get("/account/stripe-cards/").status_code, 200)
+
+    def test_check_token_without_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/payments/check-token/").status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(self.client.get("/payments/check-token/").status_code, 401)
+
+    def test_update_drops_the_cached_user(self):
+        self.client.get("/account/stripe-cards/")
+        response = self.client.put(
+            reverse("user-update", args=[self.normal_user.id]),
+            {"username": "renamed", "email": "testuser@gmail.com", "password": ""},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(2):
+            self.client.get("/account/stripe-cards/")
+
+    def test_deleted_user_is_refused(self):
+        self.client.get("/account/stripe-cards/")
+        response = self.client.post(reverse("user-delete", args=[self.normal_user.id]), {"password": "testuser1234"}, format="json")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get("/account/stripe-cards/").status_code, 401)
+        self.assertEqual(self.client.get("/payments/check-token/").status_code, 401)
+
+    def test_inactive_user_is_refused(self):
+        User.objects.filter(id=self.normal_user.id).update(is_active=False)
+        self.assertEqual(self.client.get("/account/stripe-cards/").status_code, 401)
+
+
+class AccountDashboardTest(AccountApisSetUp):
+
+    def test_dashboard(self):
+        self.client.force_authenticate(user=self.normal_user)
+        response = self.client.get(reverse("account-dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["user"]["username"], "testuser")
+        self.assertEqual([address["id"] for address in response.data["addresses"]], [self.dummy_address.id])
+        self.assertEqual([card["id"] for card in response.data["cards"]], [self.testuser_stripe_card.id])
+        self.assertEqual([order["id"] for order in response.data["orders"]], [self.dummy_order.id])
+
+    def test_fixed_number_of_queries(self):
+        for i in range(15):
+            OrderModel.objects.create(name="testuser", ordered_item=f"item {i}", user=self.normal_user)
+            BillingAddress.objects.create(
+                name="testuser", user=self.normal_user, phone_number="9123456789", pin_code="110000",
+                house_no=f"house {i}", landmark="near shop", city="new delhi", state="delhi",
+            )
+        self.client.force_authenticate(user=self.normal_user)
+        # addresses, cards and the latest orders
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("account-dashboard"))
+        self.assertEqual(len(response.data["addresses"]), 16)
+        self.assertEqual(len(response.data["orders"]), 10)
+        self.assertEqual(response.data["orders"][0]["ordered_item"], "item 14")
+
+    def test_dashboard_when_logged_out(self):
+        self.assertEqual(self.client.get(reverse("account-dashboard")).status_code, 401)
+
@@ -11,6 +11,7 @@ urlpatterns = [
     path('user/<int:pk>/', views.UserAccountDetailsView.as_view(), name="user-details"),
     path('user_update/<int:pk>/', views.UserAccountUpdateView.as_view(), name="user-update"),
     path('user_delete/<int:pk>/', views.UserAccountDeleteView.as_view(), name="user-delete"),
+    path('dashboard/', views.AccountDashboardView.as_view(), name="account-dashboard"),
 
     # user address
     path('all-address-details/', views.UserAddressesListView.as_view(), name="all-address-details"),
@@ -22,6 +23,9 @@ urlpatterns = [
     # order
     path('all-orders-list/', views.OrdersListView.as_view(), name="all-orders-list"),
     path('change-order-status/<int:pk>/', views.ChangeOrderStatus.as_view(), name="change-order-status"),
+    path('change-orders-status/', views.BulkChangeOrderStatus.as_view(), name="change-orders-status"),
+    path('analytics/', views.SalesAnalyticsView.as_view(), name="sales-analytics"),
+    path('analytics/products/', views.ProductSalesAnalyticsView.as_view(), name="product-sales-analytics"),
 
     # stripe
     path('stripe-cards/', views.CardsListView.as_view(), name="stripe-cards-list-page"),
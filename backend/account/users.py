@@ -0,0 +1,42 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+
+
+# Registration is one INSERT: auth_user.username is unique already and the email
+# is made unique by the index below, so two signups with the same username or
+# email can't both get in and nothing is counted beforehand. The index is raw
+# sql on a table of django.contrib.auth, so it is created after migrate instead
+# of living in the generated migrations. Users without email (createsuperuser)
+# are left out of it.
+
+USER_EMAIL_INDEX = "account_user_email_unique"
+
+
+class UserExists(Exception):
+    pass
+
+
+def create_user_email_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Create the unique index of the users' email addresses (connected to post_migrate)."""
+    connection = connections[using]
+    if User._meta.db_table not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {USER_EMAIL_INDEX} ON {User._meta.db_table} (email) WHERE email <> ''"
+        )
+
+
+def register_user(username, email, password):
+    """Create a user, raises UserExists (with the message for the client) when the username or email is taken."""
+    # hashed before the insert, no transaction is open while it runs
+    password = make_password(password)
+    try:
+        with transaction.atomic():
+            return User.objects.create(username=username, email=email, password=password)
+    except IntegrityError:
+        # only on a conflict, find out which of the two it was
+        if User.objects.filter(username=username).exists():
+            raise UserExists("A user with that username already exist!")
+        raise UserExists("A user with that email address already exist!")
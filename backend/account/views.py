@@ -1,5 +1,11 @@
-from .models import StripeModel, BillingAddress, OrderModel
+from .models import StripeModel, BillingAddress, OrderModel, DailySales, DailyUserSales
 from django.http import Http404
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, Sum, prefetch_related_objects
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
 from rest_framework import status
 from rest_framework.views import APIView
 from django.contrib.auth.models import User
@@ -11,12 +17,21 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView # for login page
 from django.contrib.auth.hashers import check_password
 from django.shortcuts import get_object_or_404
+from my_project.streaming import StreamingJSONResponse
+from product.models import Product
+from .bulk import MAX_BATCH_ORDERS, update_delivery_status
+from .filters import FILTER_PARAMS, parse_order_filters
+from .items import product_sales
+from .pagination import OrderCursorPagination
+from .rollups import record_delivery
+from .users import UserExists, register_user
 from .serializers import (
     UserSerializer, 
     UserRegisterTokenSerializer, 
     CardsListSerializer, 
     BillingAddressSerializer,
-    AllOrdersListSerializer
+    AllOrdersListSerializer,
+    DailySalesSerializer
 )
 
 
@@ -33,23 +48,12 @@ class UserRegisterView(APIView):
             return Response({"detial": "username or email cannot be empty"}, status=status.HTTP_400_BAD_REQUEST)
 
         else:
-            check_username = User.objects.filter(username=username).count()
-            check_email =  User.objects.filter(email=email).count()
-
-            if check_username:
-                message = "A user with that username already exist!"
-                return Response({"detail": message}, status=status.HTTP_403_FORBIDDEN)
-            if check_email:
-                message = "A user with that email address already exist!"
-                return Response({"detail": message}, status=status.HTTP_403_FORBIDDEN)
-            else:
-                user = User.objects.create(
-                    username=username,
-                    email=email,
-                    password=make_password(data["password"]),
-                )
-                serializer = UserRegisterTokenSerializer(user, many=False)
-                return Response(serializer.data)
+            try:
+                user = register_user(username, email, data["password"])
+            except UserExists as e:
+                return Response({"detail": str(e)}, status=status.HTTP_403_FORBIDDEN)
+            serializer = UserRegisterTokenSerializer(user, many=False)
+            return Response(serializer.data)
 
 # login user (customizing it so that we can see fields like username, email etc as a response 
 # from server, otherwise it will only provide access and refresh token)
@@ -113,7 +117,11 @@ class UserAccountUpdateView(APIView):
                 if data["password"] != "":
                     user.password = make_password(data["password"])
 
-                user.save()
+                try:
+                    with transaction.atomic():
+                        user.save()
+                except IntegrityError:
+                    return Response({"details": "Username or email address already in use."}, status=status.HTTP_403_FORBIDDEN)
                 serializer = UserSerializer(user, many=False)
                 message = {"details": "User Successfully Updated.", "user": serializer.data}
                 return Response(message, status=status.HTTP_200_OK)
@@ -146,6 +154,31 @@ class UserAccountDeleteView(APIView):
             return Response({"details": "User not found."}, status=status.HTTP_404_NOT_FOUND)
 
 
+# everything the account page shows (user, addresses, saved cards and latest orders)
+# in one response, a fixed number of queries whatever the number of rows
+class AccountDashboardView(APIView):
+
+    permission_classes = [permissions.IsAuthenticated]
+    recent_orders = 10
+
+    def get(self, request):
+        user = request.user
+        prefetch_related_objects(
+            [user],
+            Prefetch("billingmodel", queryset=BillingAddress.objects.order_by("id")),
+            Prefetch("stripemodel", queryset=StripeModel.objects.order_by("id")),
+        )
+        # a prefetch can't be sliced (django < 4.2), the latest orders are read from order_user_idx
+        orders = OrderModel.objects.filter(user=user).order_by("-id")[:self.recent_orders]
+
+        return Response({
+            "user": UserSerializer(user, many=False).data,
+            "addresses": BillingAddressSerializer(user.billingmodel.all(), many=True).data,
+            "cards": CardsListSerializer(user.stripemodel.all(), many=True).data,
+            "orders": AllOrdersListSerializer(orders, many=True).data,
+        }, status=status.HTTP_200_OK)
+
+
 # get billing address (details of user address, all addresses)
 class UserAddressesListView(APIView):
 
@@ -250,6 +283,7 @@ class DeleteUserAddressView(APIView):
 class OrdersListView(APIView):
 
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OrderCursorPagination
 
     def get(self, request):
 
@@ -257,12 +291,19 @@ class OrdersListView(APIView):
         
         if user_staff_status:
             all_users_orders = OrderModel.objects.all()
-            serializer = AllOrdersListSerializer(all_users_orders, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
         else:
-            all_orders = OrderModel.objects.filter(user=request.user)
-            serializer = AllOrdersListSerializer(all_orders, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            all_users_orders = OrderModel.objects.filter(user=request.user)
+
+        # searched / paged: ?paid= &delivered= &paid_from= &paid_to= &user= &q= &cursor= &page_size=
+        if any(name in request.query_params for name in FILTER_PARAMS):
+            orders = all_users_orders.filter(parse_order_filters(request.query_params, staff=user_staff_status))
+            paginator = self.pagination_class()
+            page = paginator.paginate_queryset(orders, request, view=self)
+            serializer = AllOrdersListSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
+        # the whole list, streamed a chunk of rows at a time
+        return StreamingJSONResponse(all_users_orders.order_by("id"), AllOrdersListSerializer, status=status.HTTP_200_OK)
 
 # change order delivered status
 class ChangeOrderStatus(APIView):
@@ -271,13 +312,123 @@ class ChangeOrderStatus(APIView):
 
     def put(self, request, pk):
         data = request.data       
-        order = OrderModel.objects.get(id=pk)
+        if "is_delivered" not in data or "delivered_at" not in data:
+            return Response({"details": "is_delivered and delivered_at are required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            is_delivered = OrderModel._meta.get_field("is_delivered").to_python(data["is_delivered"])
+        except ValidationError:
+            return Response({"details": "is_delivered must be true or false."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # only update this
-        order.is_delivered = data["is_delivered"]
-        order.delivered_at = data["delivered_at"]
-        order.save()
-        
+        with transaction.atomic():
+            order = OrderModel.objects.select_for_update().get(id=pk)
+            was_delivered = order.is_delivered
+
+            # only update this
+            order.is_delivered = is_delivered
+            order.delivered_at = data["delivered_at"]
+            order.save()
+
+            if order.is_delivered != was_delivered:
+                record_delivery(order, order.is_delivered)
         
         serializer = AllOrdersListSerializer(order, many=False)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+# change the delivered status of many orders at once
+# {"ids": [...], "is_delivered": true, "delivered_at": "..."}
+class BulkChangeOrderStatus(APIView):
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def put(self, request):
+        data = request.data
+        ids = data.get("ids")
+        if not isinstance(ids, list) or not all(isinstance(id, int) and not isinstance(id, bool) for id in ids):
+            return Response({"details": "ids must be a list of order ids."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > MAX_BATCH_ORDERS:
+            return Response({"details": f"at most {MAX_BATCH_ORDERS} orders per request."}, status=status.HTTP_400_BAD_REQUEST)
+        if "is_delivered" not in data or "delivered_at" not in data:
+            return Response({"details": "is_delivered and delivered_at are required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            is_delivered = OrderModel._meta.get_field("is_delivered").to_python(data["is_delivered"])
+        except ValidationError:
+            return Response({"details": "is_delivered must be true or false."}, status=status.HTTP_400_BAD_REQUEST)
+
+        updated, not_found = update_delivery_status(ids, is_delivered, data["delivered_at"])
+
+        serializer = AllOrdersListSerializer(OrderModel.objects.filter(id__in=updated).order_by("id"), many=True)
+        return Response({"updated": serializer.data, "not_found": not_found}, status=status.HTTP_200_OK)
+
+
+# sales per day for staff, read from the rollup tables (see rollups.py)
+# ?from= &to= (YYYY-MM-DD, default the last 30 days) &user= (one customer's sales)
+class SalesAnalyticsView(APIView):
+
+    permission_classes = [permissions.IsAdminUser]
+    max_days = 366
+
+    def get(self, request):
+        params, today = request.query_params, timezone.localdate()
+        try:
+            first = parse_date(params["from"]) if params.get("from") else today - timedelta(days=29)
+            last = parse_date(params["to"]) if params.get("to") else today
+        except ValueError:
+            first = last = None
+        if first is None or last is None or first > last:
+            return Response({"details": "from and to must be dates (YYYY-MM-DD), from not after to."}, status=status.HTTP_400_BAD_REQUEST)
+        if (last - first).days >= self.max_days:
+            return Response({"details": f"at most {self.max_days} days at a time."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if params.get("user"):
+            try:
+                rows = DailyUserSales.objects.filter(user_id=int(params["user"]))
+            except ValueError:
+                return Response({"details": "user must be a user id."}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            rows = DailySales.objects.all()
+        rows = rows.filter(day__range=(first, last))
+
+        # every day of the range, the ones without sales as zeros
+        sales = {row.day: row for row in rows}
+        days = [sales.get(first + timedelta(days=i), DailySales(day=first + timedelta(days=i))) for i in range((last - first).days + 1)]
+        totals = rows.aggregate(orders=Sum("orders"), revenue=Sum("revenue"), delivered=Sum("delivered"))
+
+        return Response({
+            "from": first,
+            "to": last,
+            "days": DailySalesSerializer(days, many=True).data,
+            "totals": {
+                "orders": totals["orders"] or 0,
+                "revenue": f"{totals['revenue'] or 0:.2f}",
+                "delivered": totals["delivered"] or 0,
+            },
+        }, status=status.HTTP_200_OK)
+
+
+# units sold and revenue per product for staff, from the order items (see items.py)
+# ?from= &to= (YYYY-MM-DD, orders paid on those days, default every order) &product= (one product)
+class ProductSalesAnalyticsView(APIView):
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        params = request.query_params
+        orders = None
+        if params.get("from") or params.get("to"):
+            # same date handling (and 400s) as the orders search
+            orders = OrderModel.objects.filter(parse_order_filters({"paid_from": params.get("from"), "paid_to": params.get("to")}))
+
+        product_ids = None
+        if params.get("product"):
+            try:
+                product_ids = [int(params["product"])]
+            except ValueError:
+                return Response({"details": "product must be a product id."}, status=status.HTTP_400_BAD_REQUEST)
+
+        sales = product_sales(product_ids, orders)
+        names = dict(Product.objects.filter(id__in=list(sales)).values_list("id", "name"))
+        return Response([
+            {"product": product_id, "name": names.get(product_id), "units": row["units"], "revenue": f"{row['revenue']:.2f}"}
+            for product_id, row in sales.items()
+        ], status=status.HTTP_200_OK)
@@ -0,0 +1,37 @@
+import threading
+from collections import OrderedDict
+
+
+# In-process caches shared by the apps: the product details (product/cache.py,
+# in front of the shared cache) and the users named by JWTs
+# (account/authentication.py).
+
+class LocalLRUCache:
+    """Thread safe, size bounded, in-process LRU."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,34 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+# PBKDF2 takes tens of milliseconds of CPU per password. Run inline on every
+# request thread, a burst of logins or signups uses every core and starves the
+# other endpoints. All hashing (make_password, check_password, so register,
+# login, account update and delete) goes through a pool of at most
+# PASSWORD_HASHING_WORKERS threads instead: hashlib releases the GIL while it
+# hashes, so the pool runs in parallel but never takes more cores than that, and
+# the other logins wait their turn.
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PASSWORD_HASHING_WORKERS, thread_name_prefix="password-hashing"
+                )
+    return _executor
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """Django's PBKDF2 (same algorithm and hashes), computed on the bounded hashing pool."""
+
+    def encode(self, password, salt, iterations=None):
+        return _pool().submit(super().encode, password, salt, iterations).result()
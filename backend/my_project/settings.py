@@ -97,6 +97,25 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# shared by every backend container (they all use the same RDS database),
+# the table is created with "python manage.py createcachetable"
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+    }
+}
+
+# pre-rendered product list memory mapped by every worker (see product/snapshot.py)
+CATALOG_SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH', BASE_DIR / 'catalog.snapshot')
+# seconds a process trusts its copy of the catalog version (the snapshot of the list and
+# the ETags of the product views), product changes made by other processes show after at most that
+CATALOG_VERSION_LOCAL_TTL = 5
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -115,6 +134,18 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# PBKDF2 hashes are computed on a bounded thread pool (see my_project/hashers.py),
+# the other hashers are there to check the passwords hashed with them before
+PASSWORD_HASHERS = [
+    'my_project.hashers.PooledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+# threads hashing passwords at once, the rest of the cores stay free for the other requests
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', max(1, (os.cpu_count() or 2) - 1)))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
@@ -160,14 +191,31 @@ SIMPLE_JWT = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'account.authentication.CachedJWTAuthentication',
     )
 }
 
+# per-process LRU of the users named by JWTs (see account/authentication.py),
+# other processes see a changed or deleted user after at most USER_CACHE_TTL seconds
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60
+
 
 # STRIPE
 STRIPE_TEST_PUBLISHABLE_KEY=os.environ.get('STRIPE_TEST_PUBLISHABLE_KEY')
 STRIPE_TEST_SECRET_KEY=os.environ.get('STRIPE_TEST_SECRET_KEY')
+# signing secret of the webhook endpoint (payments/webhook/), from the stripe dashboard,
+# the webhook refuses every event while it isn't set
+STRIPE_WEBHOOK_SECRET=os.environ.get('STRIPE_WEBHOOK_SECRET')
+
+# networking of the stripe client (see payments/gateway.py), timeouts in seconds
+STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE', 'https://api.stripe.com')
+STRIPE_CONNECT_TIMEOUT = 3.05
+STRIPE_READ_TIMEOUT = 20
+STRIPE_MAX_RETRIES = 2
+STRIPE_POOL_SIZE = 20
+# threads running the independent stripe calls of a request at the same time (see payments/fanout.py)
+STRIPE_FANOUT_WORKERS = 16
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
@@ -180,6 +228,12 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static'),] # new
 # user uploaded media or image gets uploaded at this media root (which is static/images folder)
 MEDIA_ROOT = 'static/images'
 
+# processes resizing uploaded product images (see product/images.py)
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# seconds units stay reserved for a checkout whose payment has not completed (see product/inventory.py)
+STOCK_RESERVATION_TTL = 15 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
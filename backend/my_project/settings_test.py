@@ -1,3 +1,4 @@
+import tempfile
 from .settings import *
 
 DATABASES = {
@@ -5,4 +6,14 @@ DATABASES = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
-}
\ No newline at end of file
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+CATALOG_SNAPSHOT_PATH = os.path.join(tempfile.gettempdir(), 'catalog_test.snapshot')
+# the tests clear the cache between them, a copy of the version would outlive it
+CATALOG_VERSION_LOCAL_TTL = 0
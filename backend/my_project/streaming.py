@@ -0,0 +1,39 @@
+from django.http import StreamingHttpResponse
+from rest_framework.utils import encoders
+
+
+# Large lists rendered as a JSON array while the rows are read: the queryset is
+# walked with iterator() (a server side cursor on postgres) and every chunk of
+# rows is encoded and sent before the next one is fetched, so memory stays flat
+# and the first byte goes out as soon as the first chunk is read.
+
+CHUNK_SIZE = 500
+
+
+def stream_json_array(queryset, serializer_class, chunk_size=CHUNK_SIZE):
+    """Yield the rows of queryset, serialized with serializer_class, as a JSON array in chunks of bytes."""
+    # one serializer for every row, its fields are only set up once
+    serializer = serializer_class()
+    # the settings of DRF's JSONRenderer
+    encoder = encoders.JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+    separator = b"["
+    rows = []
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        row = encoder.encode(serializer.to_representation(instance))
+        rows.append(row.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029").encode())
+        if len(rows) == chunk_size:
+            yield separator + b",".join(rows)
+            separator = b","
+            rows.clear()
+    if rows:
+        yield separator + b",".join(rows) + b"]"
+    else:
+        yield b"[]" if separator == b"[" else b"]"
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """Same body as Response(serializer_class(queryset, many=True).data) (with DRF's JSONRenderer), streamed."""
+
+    def __init__(self, queryset, serializer_class, chunk_size=CHUNK_SIZE, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(stream_json_array(queryset, serializer_class, chunk_size), **kwargs)
@@ -1,3 +1,21 @@
 from django.contrib import admin
+from .models import ChargeJob, StripeCustomer, StripeEvent
 
-# Register your models here.
+class StripeCustomerAdmin(admin.ModelAdmin):
+    list_display = ("customer_id", "email", "card_id", "last4", "exp_month", "exp_year", "updated_at")
+
+admin.site.register(StripeCustomer, StripeCustomerAdmin)
+
+
+class ChargeJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "status", "attempts", "error", "needs_refund", "order", "run_after", "created_at")
+    list_filter = ("status", "needs_refund")
+
+admin.site.register(ChargeJob, ChargeJobAdmin)
+
+
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ("event_id", "type", "received_at", "processed_at", "error")
+    list_filter = ("type",)
+
+admin.site.register(StripeEvent, StripeEventAdmin)
@@ -0,0 +1,38 @@
+from django.db import transaction
+from account.models import StripeModel
+from product.cache import TwoTierCache
+from .gateway import StripeGateway
+
+
+# Card details (RetrieveCardView) read through a cache keyed by customer and card
+# id. A miss is filled from the saved card (StripeModel keeps the card stripe
+# returned when it was saved, updated or sent in an event) when there is one,
+# other cards are retrieved from stripe, so both come in stripe's shape.
+# Updating or deleting a card (the views, or stripe's events) drops its entry.
+
+card_details_cache = TwoTierCache("card", ttl=10 * 60, stale_ttl=60, local_ttl=5)
+
+
+def _key(customer_id, card_id):
+    return f"{customer_id}:{card_id}"
+
+
+def _load(customer_id, card_id, gateway):
+    saved = StripeModel.objects.filter(customer_id=customer_id, card_id=card_id).values_list("stripe_card", flat=True).first()
+    if saved:
+        return saved
+    # not saved, or saved before the cards were kept
+    return (gateway or StripeGateway()).retrieve_source(customer_id, card_id).to_dict_recursive()
+
+
+def card_details(customer_id, card_id, gateway=None):
+    """The details of a card, from the cache, the saved card or stripe (in this order)."""
+    return card_details_cache.get(_key(customer_id, card_id), lambda: _load(customer_id, card_id, gateway))
+
+
+def forget_card_details(customer_id, card_id):
+    """Drop the cached details of a card, call it when the card is changed or deleted."""
+    key = _key(customer_id, card_id)
+    card_details_cache.delete(key)
+    # again once the write is visible, a read before the commit could cache the old card
+    transaction.on_commit(lambda: card_details_cache.delete(key))
@@ -0,0 +1,222 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from account.items import record_items
+from account.models import OrderModel
+from account.rollups import record_order
+from product.inventory import confirm, release
+from product.models import StockReservation
+from .customers import customer_id_for_email
+from .gateway import StripeGateway
+from .models import ChargeJob
+import stripe
+
+
+# Charges are made by a worker (process_charge_jobs), not in the checkout request:
+# the view holds the units, saves a ChargeJob and answers 202 with its id, so a
+# checkout costs two inserts however slow stripe is, and the client polls the
+# job's status. The worker claims due jobs with SELECT ... FOR UPDATE SKIP LOCKED
+# (any number of workers, a job is run by one of them), charges the customer
+# with the job's Idempotency-Key and saves the order. The jobs of a batch run one
+# after the other, the lease of each starts again when its turn comes (a job
+# whose lease ended while it waited was claimed by another worker and is
+# skipped). A job whose worker died is claimed again once its lease ends, stripe replays its charge instead of making
+# a second one. Network and stripe errors are retried with a backoff, a declined
+# card fails the job at once; a failed job gives its units back. A job whose
+# reservation expired (and whose units were sold to another checkout) while it
+# waited is charged for nothing: it fails and its charge is refunded, a refund
+# stripe refuses leaves the job marked needs_refund for the staff.
+
+MAX_ATTEMPTS = 5
+# the longest a stripe call takes: every try of the client times out, with the
+# client's backoff (at most 2 seconds) between them
+STRIPE_CALL_TIME = (settings.STRIPE_CONNECT_TIMEOUT + settings.STRIPE_READ_TIMEOUT + 2) * (settings.STRIPE_MAX_RETRIES + 1)
+# seconds a job is left to its worker: its stripe calls (customer lookup, charge, refund) and the database work
+JOB_LEASE = 3 * STRIPE_CALL_TIME + 30
+CLAIM_BATCH_SIZE = 10
+ORDER_FIELDS = (
+    "email", "amount", "name", "card_number", "address", "ordered_item",
+    "paid_status", "total_price", "is_delivered", "delivered_at",
+)
+
+SOLD_OUT = "The product sold out before your payment went through, it will be refunded."
+REFUNDED = "The product sold out before your payment went through, it was refunded."
+
+RETRIED_ERRORS = (stripe.error.APIConnectionError, stripe.error.APIError, stripe.error.RateLimitError)
+
+
+def enqueue_charge(user, data, reservation=None, product_id=None, quantity=1):
+    """Queue the charge of a checkout (data has every ORDER_FIELDS), the reservation holds its units."""
+    return ChargeJob.objects.create(
+        user=user,
+        order_data={field: data[field] for field in ORDER_FIELDS},
+        product_id=product_id,
+        quantity=quantity,
+        reservation_id=reservation.id if reservation is not None else None,
+    )
+
+
+def claim_jobs(batch_size=CLAIM_BATCH_SIZE):
+    """Lease up to batch_size due jobs (queued, or running with an ended lease) to the caller."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            ChargeJob.objects.select_for_update(skip_locked=True)
+            .filter(status__in=(ChargeJob.QUEUED, ChargeJob.RUNNING), run_after__lte=now)
+            .order_by("run_after")[:batch_size]
+        )
+        for job in jobs:
+            job.status = ChargeJob.RUNNING
+            job.attempts += 1
+            job.run_after = now + timedelta(seconds=JOB_LEASE)
+            job.save(update_fields=["status", "attempts", "run_after", "updated_at"])
+    return jobs
+
+
+def _reservation(job):
+    # confirm / release only need these
+    return StockReservation(id=job.reservation_id, product_id=job.product_id, quantity=job.quantity)
+
+
+def _renew(job):
+    # the lease starts when the worker comes to the job, not when it claimed the batch
+    run_after = timezone.now() + timedelta(seconds=JOB_LEASE)
+    renewed = ChargeJob.objects.filter(id=job.id, status=ChargeJob.RUNNING, run_after=job.run_after).update(run_after=run_after)
+    if renewed:
+        job.run_after = run_after
+    return bool(renewed)
+
+
+def _leased(job):
+    # locks the job, False when the lease of this worker ended while stripe was
+    # called: the job was claimed again, and may be done already
+    current = ChargeJob.objects.select_for_update().filter(id=job.id).values_list("status", "run_after").first()
+    return current == (ChargeJob.RUNNING, job.run_after)
+
+
+def _fail(job, error):
+    with transaction.atomic():
+        if not _leased(job):
+            return job
+        if job.reservation_id is not None:
+            release(_reservation(job))
+        job.status = ChargeJob.FAILED
+        job.error = error[:300]
+        job.save(update_fields=["status", "error", "updated_at"])
+    return job
+
+
+def _retry(job, error):
+    if job.attempts >= MAX_ATTEMPTS:
+        return _fail(job, error)
+    with transaction.atomic():
+        if not _leased(job):
+            return job
+        job.status = ChargeJob.QUEUED
+        job.error = error[:300]
+        job.run_after = timezone.now() + timedelta(seconds=2 ** job.attempts)
+        job.save(update_fields=["status", "error", "run_after", "updated_at"])
+    return job
+
+
+def _refund(job, gateway):
+    try:
+        gateway.create_refund(charge=job.charge_id, idempotency_key=f"refund-job-{job.idempotency_key}")
+    except stripe.error.StripeError:
+        # needs_refund stays set
+        return job
+    job.needs_refund = False
+    job.error = REFUNDED
+    job.save(update_fields=["needs_refund", "error", "updated_at"])
+    return job
+
+
+def _sold_out(job, charge_id):
+    job.status = ChargeJob.FAILED
+    job.charge_id = charge_id
+    job.needs_refund = True
+    job.error = SOLD_OUT
+    job.save(update_fields=["status", "charge_id", "needs_refund", "error", "updated_at"])
+    return job
+
+
+def _save_order(job, charge_id):
+    data = job.order_data
+    # saving order and its item in django database (and counting it in the sales rollups)
+    new_order = OrderModel.objects.create(
+        name = data["name"],
+        card_number = data["card_number"],
+        address = data["address"],
+        ordered_item = data["ordered_item"],
+        paid_status = data["paid_status"],
+        paid_at = timezone.now(),
+        total_price = data["total_price"],
+        is_delivered = data["is_delivered"],
+        delivered_at = data["delivered_at"],
+        user_id = job.user_id
+    )
+    if job.product_id is not None:
+        record_items(new_order, job.product_id, job.quantity)
+    record_order(new_order)
+
+    job.status = ChargeJob.SUCCEEDED
+    job.order = new_order
+    job.charge_id = charge_id
+    job.error = ""
+    job.save(update_fields=["status", "order", "charge_id", "error", "updated_at"])
+
+
+def _succeed(job, charge_id, gateway):
+    # in one transaction with the order: a worker dying before the commit leaves
+    # the reservation for the next attempt, which replays the same charge
+    with transaction.atomic():
+        job = ChargeJob.objects.select_for_update().get(id=job.id)
+        if job.status == ChargeJob.SUCCEEDED:
+            return job
+        if job.reservation_id is None or confirm(_reservation(job)):
+            _save_order(job, charge_id)
+            return job
+        # the hold expired and its units were sold meanwhile, no order
+        _sold_out(job, charge_id)
+    # once the job is saved, it stays marked if stripe refuses the refund
+    return _refund(job, gateway)
+
+
+def run_job(job, gateway=None):
+    """Charge a claimed job and save its order, or queue it again / fail it. A job no longer leased to the caller is left alone."""
+    if not _renew(job):
+        return job
+    gateway = gateway or StripeGateway()
+    data = job.order_data
+    try:
+        # from the local index of the stripe customers
+        customer_id = customer_id_for_email(data["email"], gateway)
+        if customer_id is None:
+            return _fail(job, "No card found for this email address.")
+
+        # make stripe payment (charge the customer)
+        charge = gateway.create_charge(
+            customer=customer_id,
+            amount=int(float(data["amount"])*100),
+            currency="inr",
+            description='Software development services',  # required for Indian transactions
+            idempotency_key=f"charge-job-{job.idempotency_key}",
+        )
+    except stripe.error.CardError as e:
+        return _fail(job, e.user_message or "Your card was declined.")
+    except RETRIED_ERRORS:
+        return _retry(job, "Network error, the payment will be retried.")
+    except stripe.error.StripeError as e:
+        return _fail(job, e.user_message or "Payment failed.")
+    return _succeed(job, charge.id, gateway)
+
+
+def process_jobs(batch_size=CLAIM_BATCH_SIZE, gateway=None):
+    """Claim and run one batch of jobs, returns how many were run."""
+    jobs = claim_jobs(batch_size)
+    gateway = gateway or StripeGateway()
+    for job in jobs:
+        run_job(job, gateway)
+    return len(jobs)
+
@@ -0,0 +1,102 @@
+from django.db import transaction
+from .models import StripeCustomer
+
+
+# Index of the stripe customers (customer id, email and first card) kept in our
+# database, so checking a card or finding a customer is an indexed lookup rather
+# than stripe.Customer.list() (one network round trip, and only its first page).
+# It is updated by our own writes to stripe (create / update / delete card) and
+# by the customer events stripe sends to the webhook (changes made elsewhere,
+# e.g. the dashboard). sync_stripe_customers fills it from stripe once.
+
+CUSTOMER_EVENTS = (
+    "customer.created", "customer.updated", "customer.deleted",
+    "customer.source.created", "customer.source.updated", "customer.source.expiring", "customer.source.deleted",
+)
+
+
+def _card_fields(card):
+    if not card:
+        return {"card_id": None, "last4": None, "fingerprint": None, "exp_month": None, "exp_year": None}
+    return {
+        "card_id": card.get("id"),
+        "last4": card.get("last4"),
+        "fingerprint": card.get("fingerprint"),
+        "exp_month": str(card["exp_month"]) if card.get("exp_month") is not None else None,
+        "exp_year": str(card["exp_year"]) if card.get("exp_year") is not None else None,
+    }
+
+
+def index_customer(customer):
+    """Save a stripe customer (as returned by the api, with its sources) in the index."""
+    sources = customer.get("sources") or {}
+    cards = [source for source in sources.get("data") or [] if source.get("object", "card") == "card"]
+    row, _ = StripeCustomer.objects.update_or_create(
+        customer_id=customer["id"],
+        defaults={"email": customer.get("email"), **_card_fields(cards[0] if cards else None)},
+    )
+    return row
+
+
+def index_card(customer_id, card):
+    """A card was added to (or changed on) a customer, it is the one checked when the customer has none yet."""
+    if not customer_id:
+        return
+    with transaction.atomic():
+        # the card's event may come before the customer's
+        row, created = StripeCustomer.objects.select_for_update().get_or_create(
+            customer_id=customer_id, defaults=_card_fields(card)
+        )
+        if not created and row.card_id in (None, card.get("id")):
+            StripeCustomer.objects.filter(id=row.id).update(**_card_fields(card))
+
+
+def forget_card(customer_id, card_id):
+    StripeCustomer.objects.filter(customer_id=customer_id, card_id=card_id).update(**_card_fields(None))
+
+
+def forget_customer(customer_id):
+    StripeCustomer.objects.filter(customer_id=customer_id).delete()
+
+
+def card_of_another_email(last4, email):
+    """True when a customer with another email has a card ending in last4."""
+    return StripeCustomer.objects.filter(last4=last4).exclude(email=email).exists()
+
+
+def customer_by_email(email):
+    """The latest customer with this email (like the first customer stripe lists), None when there is none."""
+    return StripeCustomer.objects.filter(email=email).order_by("-id").first()
+
+
+def customer_id_for_email(email, gateway):
+    """
+    The id of the latest customer with this email. A customer the index doesn't know yet
+    (created before it was filled) is looked up on stripe once, and indexed.
+    """
+    row = customer_by_email(email)
+    if row is None:
+        customers = gateway.list_customers(email=email, limit=1).data
+        if not customers:
+            return None
+        row = index_customer(customers[0])
+    return row.customer_id
+
+
+def apply_event(event):
+    """Update the index from a stripe event, events of other types are ignored."""
+    kind, obj = event["type"], event["data"]["object"]
+    if kind not in CUSTOMER_EVENTS:
+        return
+    if kind == "customer.deleted":
+        forget_customer(obj["id"])
+    elif kind.startswith("customer.source."):
+        if kind == "customer.source.deleted":
+            forget_card(obj.get("customer"), obj["id"])
+        else:
+            index_card(obj.get("customer"), obj)
+    elif "sources" in obj:
+        index_customer(obj)
+    else:
+        # newer api versions don't include the sources, the card comes with its own event
+        StripeCustomer.objects.update_or_create(customer_id=obj["id"], defaults={"email": obj.get("email")})
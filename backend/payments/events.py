@@ -0,0 +1,85 @@
+from django.db import transaction
+from django.utils import timezone
+from account.models import OrderModel, StripeModel
+from .cards import forget_card_details
+from .customers import apply_event
+from .models import StripeEvent
+
+
+# Events stripe sends to the webhook are saved and acknowledged at once (one
+# INSERT ... ON CONFLICT DO NOTHING, stripe delivers an event more than once and
+# the unique event id keeps one copy), the event worker (process_stripe_events)
+# applies them later in batches, in the order they were received, one
+# transaction per batch:
+# - customer and card events update the index of the stripe customers and the
+#   saved cards (StripeModel) and drop the cached card details (see cards.py),
+#   so changes made outside this app (the dashboard, expiring cards) are seen
+#   without asking stripe
+# - a refunded charge marks its order as not paid
+# An event that can't be applied is kept with its error and skipped.
+
+EVENT_BATCH_SIZE = 100
+
+CARD_FIELDS = {
+    "exp_month": "exp_month", "exp_year": "exp_year", "name": "name_on_card",
+    "address_city": "address_city", "address_country": "address_country",
+    "address_state": "address_state", "address_zip": "address_zip",
+}
+
+
+def record_event(event):
+    """Save an event received by the webhook, an event received before is ignored."""
+    StripeEvent.objects.bulk_create(
+        [StripeEvent(event_id=event["id"], type=event["type"], payload=event)], ignore_conflicts=True
+    )
+
+
+def _apply_to_saved_cards(kind, obj):
+    if kind == "customer.deleted":
+        cards = StripeModel.objects.filter(customer_id=obj["id"])
+        for card_id in cards.values_list("card_id", flat=True):
+            forget_card_details(obj["id"], card_id)
+        cards.delete()
+    elif kind == "customer.updated" and obj.get("email"):
+        StripeModel.objects.filter(customer_id=obj["id"]).update(email=obj["email"])
+    elif kind == "customer.source.deleted":
+        forget_card_details(obj.get("customer"), obj["id"])
+        StripeModel.objects.filter(card_id=obj["id"]).delete()
+    elif kind in ("customer.source.updated", "customer.source.expiring"):
+        forget_card_details(obj.get("customer"), obj["id"])
+        changes = {field: str(obj[name]) for name, field in CARD_FIELDS.items() if obj.get(name) is not None}
+        StripeModel.objects.filter(card_id=obj["id"]).update(stripe_card=obj, **changes)
+
+
+def _apply_to_orders(kind, obj):
+    if kind == "charge.refunded" and obj.get("refunded"):
+        OrderModel.objects.filter(chargejob__charge_id=obj["id"]).update(paid_status=False)
+
+
+def apply_stripe_event(event):
+    kind, obj = event["type"], event["data"]["object"]
+    apply_event(event)
+    _apply_to_saved_cards(kind, obj)
+    _apply_to_orders(kind, obj)
+
+
+def process_events(batch_size=EVENT_BATCH_SIZE):
+    """Apply one batch of the events not applied yet, returns how many were processed."""
+    with transaction.atomic():
+        # skip_locked: concurrent workers take different batches
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True).order_by("id")[:batch_size]
+        )
+        failed = []
+        for event in events:
+            try:
+                with transaction.atomic():
+                    apply_stripe_event(event.payload)
+            except (KeyError, TypeError, ValueError) as e:
+                event.error = f"{type(e).__name__}: {e}"[:300]
+                failed.append(event)
+        StripeEvent.objects.filter(id__in=[event.id for event in events]).update(processed_at=timezone.now())
+        if failed:
+            StripeEvent.objects.bulk_update(failed, ["error"])
+    return len(events)
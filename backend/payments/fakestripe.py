@@ -0,0 +1,228 @@
+import json
+import time
+import random
+import uuid
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+# A local stand-in for the parts of the stripe api the payments views use
+# (customers, card tokens and sources, charges), kept in memory. Point a
+# StripeGateway at its url to test the gateway's networking for real: kept-alive
+# connections, timeouts (delay), retries (fail_next) and idempotency keys.
+# The fake_stripe command serves it on its own, for the benchmark_payments load
+# test (or a runserver pointed at it with STRIPE_API_BASE).
+
+DECLINED_CARD = "4000000000000002"
+RECORDED_REQUESTS = 1000  # the last requests kept in FakeStripe.requests
+
+
+def _id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:14]}"
+
+
+def _list(url, data, has_more=False):
+    return {"object": "list", "url": url, "has_more": has_more, "data": data}
+
+
+def _error(status, message, type="invalid_request_error", code=None):
+    return status, {"error": {"type": type, "message": message, "code": code}}
+
+
+class FakeStripe:
+    """Start with start() (returns the url to use as api_base), stop with stop()."""
+
+    def __init__(self, delay=0, fail_rate=0):
+        self.delay = delay  # seconds every response waits, to trip read timeouts
+        self.fail_rate = fail_rate  # share of the requests answered with a 500
+        self.customers = {}
+        self.charges = {}
+        self.tokens = {}
+        self.requests = deque(maxlen=RECORDED_REQUESTS)  # (method, path, headers) of the last requests received
+        self.request_count = 0  # requests received
+        self.connections = 0  # TCP connections accepted
+        self._faults = []
+        self._replies = {}  # idempotency key -> response, replayed like stripe does
+        self._lock = threading.Lock()
+        self._server = None
+
+    def fail_next(self, count=1, status=500):
+        """Answer the next count requests with status (after recording them)."""
+        with self._lock:
+            self._faults += [status] * count
+
+    def start(self, host="127.0.0.1", port=0):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out in separate writes, with Nagle the body would
+            # wait for the client's delayed ACK of the headers
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode() if length else ""
+                url = urlsplit(self.path)
+                params = dict(parse_qsl(url.query or body, keep_blank_values=True))
+                status, payload = fake.handle(method, url.path, params, dict(self.headers))
+                data = json.dumps(payload).encode()
+                if fake.delay:
+                    time.sleep(fake.delay)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Request-Id", _id("req"))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle("get")
+
+            def do_POST(self):
+                self._handle("post")
+
+            def do_DELETE(self):
+                self._handle("delete")
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, method, path, params, headers):
+        with self._lock:
+            self.requests.append((method, path, headers))
+            self.request_count += 1
+            if self._faults:
+                return _error(self._faults.pop(0), "Injected failure.", type="api_error")
+            if self.fail_rate and random.random() < self.fail_rate:
+                return _error(500, "Injected failure.", type="api_error")
+
+            key = headers.get("Idempotency-Key")
+            if method == "post" and key in self._replies:
+                return self._replies[key]
+            response = self._route(method, path.rstrip("/").split("/")[2:], params)
+            if method == "post" and key:
+                self._replies[key] = response
+            return response
+
+    def _route(self, method, parts, params):
+        if parts == ["customers"]:
+            return self._list_customers(params) if method == "get" else self._create_customer(params)
+        if parts == ["tokens"] and method == "post":
+            return self._create_token(params)
+        if parts == ["charges"] and method == "post":
+            return self._create_charge(params)
+        if parts == ["refunds"] and method == "post":
+            return self._create_refund(params)
+        if parts == ["payment_intents"] and method == "post":
+            return 200, {"id": _id("pi"), "object": "payment_intent", "amount": int(params.get("amount", 0)), "status": "requires_payment_method"}
+
+        if len(parts) >= 2 and parts[0] == "customers":
+            customer = self.customers.get(parts[1])
+            if customer is None:
+                return _error(404, f"No such customer: '{parts[1]}'", code="resource_missing")
+            if len(parts) == 2:
+                if method == "delete":
+                    del self.customers[parts[1]]
+                    return 200, {"id": parts[1], "object": "customer", "deleted": True}
+                return 200, customer
+            if parts[2] == "sources":
+                return self._source(method, customer, parts[3] if len(parts) > 3 else None, params)
+        return _error(404, "Unrecognized request URL.")
+
+    def _list_customers(self, params):
+        customers = sorted(self.customers.values(), key=lambda customer: customer["created"], reverse=True)
+        if params.get("email"):
+            customers = [customer for customer in customers if customer["email"] == params["email"]]
+        if params.get("starting_after"):
+            ids = [customer["id"] for customer in customers]
+            customers = customers[ids.index(params["starting_after"]) + 1:] if params["starting_after"] in ids else []
+        limit = int(params.get("limit", 10))
+        return 200, _list("/v1/customers", customers[:limit], has_more=len(customers) > limit)
+
+    def _create_customer(self, params):
+        customer_id = _id("cus")
+        customer = {
+            "id": customer_id, "object": "customer", "email": params.get("email"),
+            "description": params.get("description"), "created": time.time(),
+            "sources": _list(f"/v1/customers/{customer_id}/sources", []),
+        }
+        self.customers[customer_id] = customer
+        return 200, customer
+
+    def _create_token(self, params):
+        number = params.get("card[number]", "")
+        if number == DECLINED_CARD:
+            return _error(402, "Your card was declined.", type="card_error", code="card_declined")
+        if len(number) < 12:
+            return _error(402, "Your card number is incorrect.", type="card_error", code="incorrect_number")
+        card = {
+            "id": _id("card"), "object": "card", "last4": number[-4:], "fingerprint": f"fp_{number[-8:]}",
+            "exp_month": int(params.get("card[exp_month]") or 1), "exp_year": int(params.get("card[exp_year]") or 2030),
+        }
+        token = {"id": _id("tok"), "object": "token", "card": card, "used": False}
+        self.tokens[token["id"]] = token
+        return 200, token
+
+    def _source(self, method, customer, card_id, params):
+        cards = customer["sources"]["data"]
+        if card_id is None:
+            token = self.tokens.get(params.get("source"))
+            if token is None or token["used"]:
+                return _error(400, "Invalid source token.")
+            token["used"] = True
+            card = dict(token["card"], customer=customer["id"])
+            cards.append(card)
+            return 200, card
+
+        card = next((card for card in cards if card["id"] == card_id), None)
+        if card is None:
+            return _error(404, f"No such source: '{card_id}'", code="resource_missing")
+        if method == "delete":
+            cards.remove(card)
+            return 200, {"id": card_id, "object": "card", "deleted": True}
+        if method == "post":
+            card.update({name: value for name, value in params.items() if value != ""})
+            for name in ("exp_month", "exp_year"):
+                card[name] = int(card[name])
+        return 200, card
+
+    def _create_charge(self, params):
+        if params.get("customer") not in self.customers:
+            return _error(404, f"No such customer: '{params.get('customer')}'", code="resource_missing")
+        charge = {
+            "id": _id("ch"), "object": "charge", "amount": int(params.get("amount", 0)),
+            "currency": params.get("currency"), "customer": params["customer"], "paid": True, "status": "succeeded",
+        }
+        self.charges[charge["id"]] = charge
+        return 200, charge
+
+    def _create_refund(self, params):
+        charge = self.charges.get(params.get("charge"))
+        if charge is None:
+            return _error(404, f"No such charge: '{params.get('charge')}'", code="resource_missing")
+        if charge.get("refunded"):
+            return _error(400, f"Charge {charge['id']} has already been refunded.", code="charge_already_refunded")
+        charge["refunded"] = True
+        return 200, {"id": _id("re"), "object": "refund", "charge": charge["id"], "amount": charge["amount"], "status": "succeeded"}
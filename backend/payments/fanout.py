@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from django.conf import settings
+
+
+# A view making stripe calls that don't depend on each other (creating the card
+# token and the customer, deleting the card and the customer) runs them at the
+# same time on a bounded pool, so it waits for the slowest call rather than for
+# their sum. Only network calls go to the pool, the database work stays on the
+# request thread (and its connection). When a call fails the calls not started
+# yet are cancelled, the ones running are waited for (no work outlives the
+# request) and every error is raised together.
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class FanOutError(Exception):
+    """
+    Calls of a fan_out failed: errors holds their exceptions in call order, results the
+    results of every call (None for the calls that failed or were cancelled).
+    """
+
+    def __init__(self, errors, results):
+        super().__init__("; ".join(f"{type(error).__name__}: {error}" for error in errors))
+        self.errors = errors
+        self.results = results
+
+    def find(self, kind):
+        """The first error that is an instance of kind, None when there is none."""
+        return next((error for error in self.errors if isinstance(error, kind)), None)
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.STRIPE_FANOUT_WORKERS, thread_name_prefix="stripe-fanout"
+                )
+    return _executor
+
+
+def fan_out(*calls):
+    """Run the calls (functions without arguments) concurrently, returns their results in call order."""
+    if len(calls) == 1:
+        try:
+            return [calls[0]()]
+        except Exception as e:
+            raise FanOutError([e], [None]) from e
+
+    futures = [_pool().submit(call) for call in calls]
+    wait(futures, return_when=FIRST_EXCEPTION)
+    if any(future.done() and future.exception() for future in futures):
+        for future in futures:
+            future.cancel()
+    wait(futures)
+
+    failed = [future.cancelled() or future.exception() is not None for future in futures]
+    if any(failed):
+        errors = [future.exception() for future in futures if not future.cancelled() and future.exception()]
+        results = [None if lost else future.result() for future, lost in zip(futures, failed)]
+        raise FanOutError(errors, results) from errors[0]
+    return [future.result() for future in futures]
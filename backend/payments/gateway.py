@@ -0,0 +1,120 @@
+import threading
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from stripe.api_requestor import APIRequestor
+from stripe.http_client import RequestsClient
+from stripe.util import convert_to_stripe_object
+
+
+# Every call to stripe goes through a StripeGateway:
+# - one HTTP session per process with a pool of kept-alive connections, instead
+#   of a new TLS handshake per call
+# - explicit connect / read timeouts (STRIPE_CONNECT_TIMEOUT / STRIPE_READ_TIMEOUT)
+# - retries with exponential backoff (STRIPE_MAX_RETRIES) on connection errors,
+#   timeouts, 409s and 5xx. They are safe for every call: lookups and deletes are
+#   idempotent and stripe sends each POST with an Idempotency-Key that the
+#   retries reuse, so a charge is never made twice
+# - within a gateway (one per request) identical lookups are sent once, any
+#   write forgets what was looked up
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class PooledRequestsClient(RequestsClient):
+    """stripe's requests client on one pooled session shared by every thread, with its own retry count."""
+
+    def __init__(self, timeout, max_retries, pool_size):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        super().__init__(timeout=timeout, session=session)
+        self.max_retries = max_retries
+
+    def _max_network_retries(self):
+        return self.max_retries
+
+    def close(self):
+        self._session.close()
+
+
+def default_client():
+    """The pooled client of this process."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PooledRequestsClient(
+                    timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+                    max_retries=settings.STRIPE_MAX_RETRIES,
+                    pool_size=settings.STRIPE_POOL_SIZE,
+                )
+    return _client
+
+
+class StripeGateway:
+    """The stripe calls of one request. Raises stripe's errors (stripe.error.CardError, APIConnectionError...)."""
+
+    def __init__(self, api_key=None, api_base=None, client=None):
+        self.api_key = api_key or stripe.api_key
+        self.requestor = APIRequestor(
+            key=self.api_key, client=client or default_client(), api_base=api_base or settings.STRIPE_API_BASE
+        )
+        self._lookups = {}
+
+    def _request(self, method, url, params=None, headers=None):
+        response, api_key = self.requestor.request(method, url, params, headers)
+        return convert_to_stripe_object(response, api_key)
+
+    def _lookup(self, url, params=None):
+        key = (url, tuple(sorted((params or {}).items())))
+        if key not in self._lookups:
+            self._lookups[key] = self._request("get", url, params)
+        return self._lookups[key]
+
+    def _write(self, method, url, params=None, idempotency_key=None):
+        self._lookups.clear()
+        return self._request(method, url, params, {"Idempotency-Key": idempotency_key} if idempotency_key else None)
+
+    # customers
+    def list_customers(self, **params):
+        return self._lookup("/v1/customers", params)
+
+    def create_customer(self, **params):
+        return self._write("post", "/v1/customers", params)
+
+    def delete_customer(self, customer_id):
+        return self._write("delete", f"/v1/customers/{customer_id}")
+
+    # cards
+    def create_token(self, **params):
+        return self._write("post", "/v1/tokens", params)
+
+    def retrieve_source(self, customer_id, card_id):
+        return self._lookup(f"/v1/customers/{customer_id}/sources/{card_id}")
+
+    def create_source(self, customer_id, **params):
+        return self._write("post", f"/v1/customers/{customer_id}/sources", params)
+
+    def modify_source(self, customer_id, card_id, **params):
+        return self._write("post", f"/v1/customers/{customer_id}/sources/{card_id}", params)
+
+    def delete_source(self, customer_id, card_id):
+        return self._write("delete", f"/v1/customers/{customer_id}/sources/{card_id}")
+
+    # payments
+    def create_charge(self, idempotency_key=None, **params):
+        """
+        Charge a customer. Calls with the same idempotency_key (e.g. a job retried after a crash)
+        make one charge, stripe answers the repeats with the first result.
+        """
+        return self._write("post", "/v1/charges", params, idempotency_key)
+
+    def create_refund(self, idempotency_key=None, **params):
+        return self._write("post", "/v1/refunds", params, idempotency_key)
+
+    def create_payment_intent(self, **params):
+        return self._write("post", "/v1/payment_intents", params)
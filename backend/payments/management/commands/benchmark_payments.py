@@ -0,0 +1,166 @@
+import time
+import threading
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+from django.test import override_settings
+from rest_framework.test import APIClient
+from payments.charges import process_jobs
+from payments.fakestripe import FakeStripe
+from payments.models import ChargeJob, StripeCustomer
+
+ENDPOINTS = ("create-card", "card-details", "update-card", "charge-customer", "delete-card")
+JOB_WAIT = 60  # seconds a checkout still waits for its charge after the end of the run
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the payment endpoints against the fake stripe api: every thread saves a card, "
+        "reads it, updates it, pays with it (polling the charge until the worker threads ran it) and "
+        "deletes it, over and over. Reports the throughput and p50 / p95 / p99 latency of each endpoint and "
+        "of the charges. --delay and --fail-rate make stripe slow or flaky."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=10)
+        parser.add_argument("--threads", type=int, default=8, help="checkouts at the same time")
+        parser.add_argument("--worker-threads", type=int, default=2, help="threads running the charges")
+        parser.add_argument("--delay", type=float, default=0.05, help="seconds every stripe response waits")
+        parser.add_argument("--fail-rate", type=float, default=0, help="share of the stripe requests failing")
+        parser.add_argument("--stripe-url", help="stripe api to use instead of starting a fake one")
+
+    def handle(self, *args, **options):
+        fake = None
+        stripe_url = options["stripe_url"]
+        if not stripe_url:
+            fake = FakeStripe(delay=options["delay"], fail_rate=options["fail_rate"])
+            stripe_url = fake.start()
+
+        users = [
+            User.objects.create_user(username=f"benchmark-payments-{i}", email=f"benchmark-payments-{i}@example.com")
+            for i in range(options["threads"])
+        ]
+        lock = threading.Lock()
+        stats = {endpoint: [] for endpoint in ENDPOINTS}
+        stats["errors"] = {endpoint: 0 for endpoint in ENDPOINTS}
+        done = threading.Event()
+
+        def checkout(index, user):
+            client = APIClient()
+            client.force_authenticate(user=user)
+            latencies = {endpoint: [] for endpoint in ENDPOINTS}
+            errors = dict.fromkeys(ENDPOINTS, 0)
+            # a card number of its own, the last 4 digits belong to this user's email
+            number = f"424242424242{index:04d}"
+
+            def call(endpoint, request, expected=200):
+                start = time.perf_counter()
+                try:
+                    response = request()
+                except Exception:
+                    # an error of the app (or the database) is counted, not fatal to the thread
+                    errors[endpoint] += 1
+                    return None
+                if response.status_code == expected:
+                    latencies[endpoint].append(time.perf_counter() - start)
+                    return response
+                errors[endpoint] += 1
+                return None
+
+            try:
+                while time.perf_counter() < deadline:
+                    card = {"email": user.email, "number": number, "exp_month": "08", "exp_year": "2030", "cvc": "123", "save_card": True}
+                    created = call("create-card", lambda: client.post("/payments/create-card/", card, format="json"))
+                    if created is None:
+                        continue
+                    customer_id, card_id = created.data["customer_id"], created.data["card_data"]["id"]
+                    call("card-details", lambda: client.get(
+                        "/payments/card-details/", HTTP_CUSTOMER_ID=customer_id, HTTP_CARD_ID=card_id
+                    ))
+                    call("update-card", lambda: client.post("/payments/update-card/", {
+                        "customer_id": customer_id, "card_id": card_id, "card_number": number,
+                        "exp_month": "09", "exp_year": "2031", "name_on_card": "Benchmark User", "address_city": "",
+                        "address_country": "", "address_state": "", "address_zip": "",
+                    }, format="json"))
+                    charged = call("charge-customer", lambda: client.post("/payments/charge-customer/", {
+                        "email": user.email, "amount": "10.00", "name": "Benchmark User", "card_number": number[-4:],
+                        "address": "Somewhere", "ordered_item": "Benchmark", "paid_status": True, "total_price": "10.00",
+                        "is_delivered": False, "delivered_at": "Not Delivered",
+                    }, format="json"), expected=202)
+                    # like the payment status page, until the charge is done (the card must be there for it)
+                    while charged is not None:
+                        try:
+                            job = client.get(f"/payments/charge-jobs/{charged.data['job_id']}/")
+                        except Exception:
+                            job = None
+                        if job is not None and (job.status_code != 200 or job.data["status"] not in (ChargeJob.QUEUED, ChargeJob.RUNNING)):
+                            break
+                        if time.perf_counter() > deadline + JOB_WAIT:
+                            break
+                        time.sleep(0.01)
+                    call("delete-card", lambda: client.post("/payments/delete-card/", {"card_number": number}, format="json"))
+            finally:
+                with lock:
+                    for endpoint in ENDPOINTS:
+                        stats[endpoint] += latencies[endpoint]
+                        stats["errors"][endpoint] += errors[endpoint]
+                connections.close_all()
+
+        def work():
+            try:
+                # until the checkouts are over and no job is due
+                while True:
+                    try:
+                        count = process_jobs()
+                    except DatabaseError:
+                        # lock timeouts and the like, a claimed job is run again after its lease
+                        count = 0
+                    if not count:
+                        if done.is_set():
+                            break
+                        time.sleep(0.01)
+            finally:
+                connections.close_all()
+
+        try:
+            with override_settings(STRIPE_API_BASE=stripe_url):
+                deadline = time.perf_counter() + options["seconds"]
+                threads = [threading.Thread(target=checkout, args=(i, user)) for i, user in enumerate(users)]
+                workers = [threading.Thread(target=work) for _ in range(options["worker_threads"])]
+                started = time.perf_counter()
+                for thread in threads + workers:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - started
+                done.set()
+                for thread in workers:
+                    thread.join()
+                charged = time.perf_counter() - started
+
+            jobs = ChargeJob.objects.filter(user__in=users)
+            stats["charge"] = [
+                (updated_at - created_at).total_seconds()
+                for created_at, updated_at in jobs.filter(status=ChargeJob.SUCCEEDED).values_list("created_at", "updated_at")
+            ]
+            failed_charges = jobs.exclude(status=ChargeJob.SUCCEEDED).count()
+        finally:
+            StripeCustomer.objects.filter(email__in=[user.email for user in users]).delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+            if fake is not None:
+                fake.stop()
+
+        for name, seconds in [(endpoint, elapsed) for endpoint in ENDPOINTS] + [("charge jobs", charged)]:
+            latencies = sorted(stats["charge" if name == "charge jobs" else name])
+            count = len(latencies)
+
+            def percentile(p):
+                return latencies[min(count - 1, int(count * p))] * 1000 if count else 0
+
+            errors = failed_charges if name == "charge jobs" else stats["errors"][name]
+            self.stdout.write(
+                f"{name}: {count} in {seconds:.2f}s ({count / seconds:.0f}/s), errors: {errors}, "
+                f"latency ms p50: {percentile(0.5):.2f}, p95: {percentile(0.95):.2f}, p99: {percentile(0.99):.2f}"
+            )
+        if fake is not None:
+            self.stdout.write(f"stripe requests: {fake.request_count}, connections: {fake.connections}")
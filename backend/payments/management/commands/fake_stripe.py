@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from payments.fakestripe import FakeStripe
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the fake stripe api (payments/fakestripe.py) until stopped. Start the app with "
+        "STRIPE_API_BASE set to its url to run the payment views without the real stripe."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=12111)
+        parser.add_argument("--delay", type=float, default=0, help="seconds every response waits")
+        parser.add_argument("--fail-rate", type=float, default=0, help="share of the requests answered with a 500")
+
+    def handle(self, *args, **options):
+        fake = FakeStripe(delay=options["delay"], fail_rate=options["fail_rate"])
+        url = fake.start(host=options["host"], port=options["port"])
+        self.stdout.write(f"fake stripe at {url} (STRIPE_API_BASE={url}), quit with CONTROL-C")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            fake.stop()
+        self.stdout.write(f"{fake.request_count} requests, {len(fake.charges)} charges")
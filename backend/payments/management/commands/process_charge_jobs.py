@@ -0,0 +1,48 @@
+import threading
+from django.core.management.base import BaseCommand
+from django.db import connections
+from payments.charges import CLAIM_BATCH_SIZE, process_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the queued charges (see payments/charges.py): threads claim due jobs, charge them on stripe "
+        "and save their orders. Run as many as needed, in as many processes as needed, until stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="run the due jobs and exit")
+        parser.add_argument("--batch-size", type=int, default=CLAIM_BATCH_SIZE, help="jobs claimed at once")
+        parser.add_argument("--threads", type=int, default=4, help="jobs charged at the same time")
+        parser.add_argument("--poll-interval", type=float, default=1, help="seconds to wait when no job is due")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {"jobs": 0}
+
+        def work():
+            try:
+                while not stop.is_set():
+                    count = process_jobs(options["batch_size"])
+                    with lock:
+                        stats["jobs"] += count
+                    if not count:
+                        if options["once"]:
+                            break
+                        stop.wait(options["poll_interval"])
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=work) for _ in range(options["threads"])]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            # the jobs being charged are finished first
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(f"ran {stats['jobs']} charge jobs")
@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from payments.events import EVENT_BATCH_SIZE, process_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply the events stripe sent to the webhook (see payments/events.py) in batches, "
+        "until stopped (or, with --once, until none is left)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="apply the pending events and exit")
+        parser.add_argument("--batch-size", type=int, default=EVENT_BATCH_SIZE, help="events applied per transaction")
+        parser.add_argument("--poll-interval", type=float, default=1, help="seconds to wait when no event is pending")
+
+    def handle(self, *args, **options):
+        processed = 0
+        try:
+            while True:
+                count = process_events(options["batch_size"])
+                processed += count
+                if count < options["batch_size"]:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"processed {processed} events")
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from payments.customers import index_customer
+from payments.gateway import StripeGateway
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the local index of the stripe customers from stripe (every page of customers). "
+        "Run it once when the index is introduced, the webhook and our own writes keep it up to date."
+    )
+
+    def handle(self, *args, **options):
+        gateway = StripeGateway(api_key=settings.STRIPE_TEST_SECRET_KEY)
+        count, params = 0, {"limit": 100}
+        while True:
+            page = gateway.list_customers(**params)
+            for customer in page.data:
+                index_customer(customer)
+            count += len(page.data)
+            if not page.has_more or not page.data:
+                break
+            params["starting_after"] = page.data[-1].id
+        self.stdout.write(f"{count} customers indexed")
@@ -1,3 +1,79 @@
+import uuid
 from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
 
-# Create your models here.
+
+# local copy of the stripe customers (see customers.py), looked up instead of
+# listing the customers on stripe
+class StripeCustomer(models.Model):
+    customer_id = models.CharField(max_length=200, unique=True)
+    email = models.EmailField(null=True, blank=True)
+    # the customer's first card, the one the checks are made against
+    card_id = models.CharField(max_length=200, null=True, blank=True)
+    last4 = models.CharField(max_length=4, null=True, blank=True)
+    fingerprint = models.CharField(max_length=100, null=True, blank=True)
+    exp_month = models.CharField(max_length=2, null=True, blank=True)
+    exp_year = models.CharField(max_length=4, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["email", "id"], name="stripe_customer_email_idx"),
+            models.Index(fields=["last4", "email"], name="stripe_customer_last4_idx"),
+        ]
+
+    def __str__(self):
+        return self.customer_id
+
+
+# a charge waiting for (or done by) the charge worker (see charges.py)
+class ChargeJob(models.Model):
+    QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+    STATUSES = [(QUEUED, "Queued"), (RUNNING, "Running"), (SUCCEEDED, "Succeeded"), (FAILED, "Failed")]
+
+    user = models.ForeignKey(User, related_name="chargejobs", on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    # the checkout form: email and amount for stripe, the rest for the order
+    order_data = models.JSONField()
+    # the units held for the order (see product/inventory.py)
+    product = models.ForeignKey("product.Product", on_delete=models.SET_NULL, null=True, blank=True, db_index=False)
+    quantity = models.PositiveIntegerField(default=1)
+    reservation_id = models.BigIntegerField(null=True, blank=True)
+    order = models.OneToOneField("account.OrderModel", related_name="chargejob", on_delete=models.SET_NULL, null=True, blank=True)
+    # the Idempotency-Key of its charge, unlike the id it is never reused by another
+    # database (a reset one, or the one of another environment using the same stripe account)
+    idempotency_key = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    # the charge made on stripe, its events (refunds) find the order with it
+    charge_id = models.CharField(max_length=200, null=True, blank=True, unique=True)
+    error = models.CharField(max_length=300, blank=True)
+    # charged but its units were sold meanwhile, set until the charge is refunded
+    needs_refund = models.BooleanField(default=False)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # when a queued job may run (retries wait), for a running job when its lease ends
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"], name="charge_job_queue_idx")]
+
+    def __str__(self):
+        return f"{self.id} {self.status}"
+
+
+# an event stripe sent to the webhook (see events.py), saved once per event id
+# and applied by the event worker
+class StripeEvent(models.Model):
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error = models.CharField(max_length=300, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["processed_at", "id"], name="stripe_event_queue_idx")]
+
+    def __str__(self):
+        return f"{self.event_id} {self.type}"
@@ -1,3 +1,603 @@
-from django.test import TestCase
+import io
+import json
+import time
+from datetime import timedelta
+from unittest import mock
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from account.models import DailySales, OrderItem, OrderModel, StripeModel
+from product.inventory import release_expired, reserve
+from product.models import Product, StockReservation
+from .events import process_events
+from .charges import MAX_ATTEMPTS, claim_jobs, enqueue_charge, process_jobs, run_job
+from .cards import card_details, card_details_cache
+from .fakestripe import DECLINED_CARD, FakeStripe
+from .fanout import FanOutError, fan_out
+from .gateway import PooledRequestsClient, StripeGateway
+from .models import ChargeJob, StripeCustomer, StripeEvent
+import stripe
 
-# Create your tests here.
+
+class ChargeCustomerReservationTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", email="testuser@gmail.com", password="testuser1234")
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(name="Hot Product", description="", price=10, stock=True, quantity=1)
+        StripeCustomer.objects.create(customer_id="cus_test", email="testuser@gmail.com", card_id="card_1", last4="4242")
+        self.order = {
+            "email": "testuser@gmail.com",
+            "amount": "10.00",
+            "name": "Test User",
+            "card_number": "4242",
+            "address": "Somewhere",
+            "ordered_item": "Hot Product",
+            "product_id": self.product.id,
+            "paid_status": True,
+            "total_price": "10.00",
+            "is_delivered": False,
+            "delivered_at": "Not Delivered",
+        }
+
+    def checkout(self, order=None):
+        response = self.client.post("/payments/charge-customer/", order or self.order, format="json")
+        self.assertEqual(response.status_code, 202)
+        return ChargeJob.objects.get(id=response.data["job_id"])
+
+    def job_status(self, job):
+        return self.client.get(reverse("charge-job-status", args=[job.id])).data
+
+    @mock.patch("payments.views.StripeGateway.create_charge")
+    @mock.patch("payments.views.StripeGateway.list_customers")
+    def test_charge_takes_the_units(self, customer_list, charge_create):
+        charge_create.return_value = stripe.util.convert_to_stripe_object({"id": "ch_1"})
+        job = self.checkout()
+        # held while the charge waits for the worker
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 0)
+        self.assertEqual(StockReservation.objects.count(), 1)
+        self.assertEqual(self.job_status(job), {"id": job.id, "status": "queued", "error": "", "order_id": None})
+        charge_create.assert_not_called()
+
+        self.assertEqual(process_jobs(), 1)
+        # the customer comes from the local index
+        customer_list.assert_not_called()
+        self.assertEqual(charge_create.call_args.kwargs["customer"], "cus_test")
+        self.assertEqual(charge_create.call_args.kwargs["idempotency_key"], f"charge-job-{job.idempotency_key}")
+        self.assertFalse(StockReservation.objects.exists())
+        order = OrderModel.objects.get()
+        self.assertEqual(order.user, self.user)
+        self.assertEqual(self.job_status(job), {"id": job.id, "status": "succeeded", "error": "", "order_id": order.id})
+        self.assertEqual(ChargeJob.objects.get().charge_id, "ch_1")
+        self.assertEqual(DailySales.objects.get().orders, 1)
+        item = OrderItem.objects.get()
+        self.assertEqual((item.order_id, item.product_id, item.quantity), (order.id, self.product.id, 1))
+
+        # the last unit is gone, the next checkout is refused before queueing
+        response = self.client.post("/payments/charge-customer/", self.order, format="json")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(ChargeJob.objects.count(), 1)
+        self.assertEqual(process_jobs(), 0)
+
+    @mock.patch("payments.views.StripeGateway.create_charge", side_effect=stripe.error.APIConnectionError("down"))
+    @mock.patch("payments.views.StripeGateway.list_customers")
+    def test_network_errors_are_retried(self, customer_list, charge_create):
+        job = self.checkout()
+        for attempt in range(1, MAX_ATTEMPTS):
+            self.assertEqual(process_jobs(), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ("queued", attempt))
+            self.assertGreater(job.run_after, timezone.now())
+            # not due before its backoff
+            self.assertEqual(process_jobs(), 0)
+            self.assertEqual(StockReservation.objects.count(), 1)
+            ChargeJob.objects.filter(id=job.id).update(run_after=timezone.now())
+
+        # out of attempts, the units go back
+        self.assertEqual(process_jobs(), 1)
+        self.assertEqual(charge_create.call_count, MAX_ATTEMPTS)
+        self.assertEqual(self.job_status(job)["status"], "failed")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 1)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertFalse(OrderModel.objects.exists())
+
+    @mock.patch(
+        "payments.views.StripeGateway.create_charge",
+        side_effect=stripe.error.CardError("Your card was declined.", None, "card_declined"),
+    )
+    @mock.patch("payments.views.StripeGateway.list_customers")
+    def test_declined_card_fails_at_once(self, customer_list, charge_create):
+        job = self.checkout()
+        process_jobs()
+        self.assertEqual(self.job_status(job)["status"], "failed")
+        self.assertEqual(self.job_status(job)["error"], "Your card was declined.")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 1)
+        self.assertFalse(OrderModel.objects.exists())
+
+    def sell_the_held_unit(self):
+        # the hold of the queued checkout expires and its unit goes to another checkout
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        release_expired()
+        reserve(self.product.id)
+
+    @mock.patch("payments.views.StripeGateway.create_refund")
+    @mock.patch("payments.views.StripeGateway.create_charge")
+    @mock.patch("payments.views.StripeGateway.list_customers")
+    def test_charge_of_an_expired_reservation_is_refunded(self, customer_list, charge_create, refund_create):
+        charge_create.return_value = stripe.util.convert_to_stripe_object({"id": "ch_1"})
+        job = self.checkout()
+        self.sell_the_held_unit()
+
+        process_jobs()
+        refund_create.assert_called_once_with(charge="ch_1", idempotency_key=f"refund-job-{job.idempotency_key}")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.needs_refund, job.charge_id), ("failed", False, "ch_1"))
+        self.assertIn("refunded", job.error)
+        self.assertFalse(OrderModel.objects.exists())
+        self.assertFalse(DailySales.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 0)
+
+    @mock.patch("payments.views.StripeGateway.create_refund", side_effect=stripe.error.APIConnectionError("down"))
+    @mock.patch("payments.views.StripeGateway.create_charge")
+    @mock.patch("payments.views.StripeGateway.list_customers")
+    def test_refund_refused_by_stripe_is_left_marked(self, customer_list, charge_create, refund_create):
+        charge_create.return_value = stripe.util.convert_to_stripe_object({"id": "ch_1"})
+        job = self.checkout()
+        self.sell_the_held_unit()
+
+        process_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.needs_refund), ("failed", True))
+        self.assertFalse(OrderModel.objects.exists())
+
+    def test_a_lost_job_is_claimed_again(self):
+        job = self.checkout()
+        self.assertEqual(len(claim_jobs()), 1)
+        # its worker died, the job waits for the end of its lease
+        self.assertEqual(claim_jobs(), [])
+        ChargeJob.objects.filter(id=job.id).update(run_after=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([job.attempts for job in claim_jobs()], [2])
+
+    @mock.patch("payments.views.StripeGateway.create_charge")
+    @mock.patch("payments.views.StripeGateway.list_customers")
+    def test_a_worker_past_its_lease_leaves_the_job(self, customer_list, charge_create):
+        job = self.checkout()
+        [stale] = claim_jobs()
+
+        def charge_after_the_lease(**params):
+            # the lease ended during the stripe call, another worker ran the job
+            ChargeJob.objects.filter(id=job.id).update(status=ChargeJob.SUCCEEDED, run_after=timezone.now())
+            raise stripe.error.CardError("Your card was declined.", None, "card_declined")
+
+        charge_create.side_effect = charge_after_the_lease
+        run_job(stale)
+        job.refresh_from_db()
+        self.assertEqual(job.status, "succeeded")
+        # the units stay sold
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    @mock.patch("payments.views.StripeGateway.create_charge")
+    @mock.patch("payments.views.StripeGateway.list_customers")
+    def test_jobs_of_a_batch_are_leased_when_their_turn_comes(self, customer_list, charge_create):
+        charge_create.side_effect = lambda **params: stripe.util.convert_to_stripe_object({"id": params["idempotency_key"]})
+        first, second = enqueue_charge(self.user, self.order), enqueue_charge(self.user, self.order)
+        batch = claim_jobs()
+        run_job(batch[0])
+        # the first charge took longer than the lease of the second, another worker took it
+        ChargeJob.objects.filter(id=second.id).update(run_after=timezone.now())
+        claim_jobs()
+        run_job(batch[1])
+        self.assertEqual(charge_create.call_count, 1)
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.attempts), ("running", 2))
+
+    def test_invalid_checkout_is_refused(self):
+        del self.order["address"]
+        response = self.client.post("/payments/charge-customer/", self.order, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 1)
+        self.assertFalse(ChargeJob.objects.exists())
+
+    def test_jobs_of_other_users_are_hidden(self):
+        job = self.checkout()
+        other = User.objects.create_user(username="other", email="other@gmail.com", password="other1234")
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(reverse("charge-job-status", args=[job.id])).status_code, 404)
+
+
+class ProcessChargeJobsCommandTest(TransactionTestCase):
+
+    @mock.patch("payments.charges.StripeGateway.create_charge")
+    def test_runs_the_due_jobs(self, charge_create):
+        charge_create.side_effect = lambda **params: stripe.util.convert_to_stripe_object({"id": params["idempotency_key"]})
+        user = User.objects.create_user(username="testuser", email="testuser@gmail.com", password="testuser1234")
+        StripeCustomer.objects.create(customer_id="cus_test", email="testuser@gmail.com")
+        order = {
+            "email": "testuser@gmail.com", "amount": "10.00", "name": "Test User", "card_number": "4242",
+            "address": "Somewhere", "ordered_item": "Lamp", "paid_status": True, "total_price": "10.00",
+            "is_delivered": False, "delivered_at": "Not Delivered",
+        }
+        for _ in range(3):
+            enqueue_charge(user, order)
+        out = io.StringIO()
+        call_command("process_charge_jobs", once=True, threads=1, batch_size=2, stdout=out)
+        self.assertIn("ran 3 charge jobs", out.getvalue())
+        self.assertEqual(OrderModel.objects.count(), 3)
+        self.assertFalse(ChargeJob.objects.exclude(status="succeeded").exists())
+
+
+class PaymentsBenchmarkTest(TransactionTestCase):
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        # one checkout next to the worker, more writers than that make sqlite answer "database is locked"
+        call_command("benchmark_payments", seconds=0.5, threads=1, worker_threads=1, delay=0, stdout=out)
+        for name in ("create-card", "card-details", "update-card", "charge-customer", "delete-card", "charge jobs"):
+            self.assertRegex(out.getvalue(), rf"{name}: [1-9]\d* in .* errors: 0, latency ms p50")
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(StripeCustomer.objects.exists())
+
+
+def stripe_card(id, last4, customer="cus_1", exp_month=8, exp_year=2030):
+    return {"id": id, "object": "card", "customer": customer, "last4": last4, "fingerprint": f"fp_{id}", "exp_month": exp_month, "exp_year": exp_year}
+
+
+class StripeCustomerIndexTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", email="testuser@gmail.com", password="testuser1234")
+        self.client.force_authenticate(user=self.user)
+        self.card = {
+            "email": "testuser@gmail.com",
+            "number": "4242424242424242",
+            "exp_month": "08",
+            "exp_year": "2030",
+            "cvc": "123",
+            "save_card": False,
+        }
+
+    @mock.patch("payments.views.StripeGateway.create_source")
+    @mock.patch("payments.views.StripeGateway.create_customer")
+    @mock.patch("payments.views.StripeGateway.create_token")
+    @mock.patch("payments.views.StripeGateway.list_customers")
+    def test_new_customer_is_indexed(self, customer_list, token_create, customer_create, create_source):
+        customer_create.return_value = {"id": "cus_1", "email": "testuser@gmail.com"}
+        create_source.return_value = stripe.Card.construct_from(stripe_card("card_1", "4242"), "key")
+        response = self.client.post("/payments/create-card/", self.card, format="json")
+        self.assertEqual(response.status_code, 200)
+        customer_list.assert_not_called()
+
+        customer = StripeCustomer.objects.get()
+        self.assertEqual(
+            (customer.customer_id, customer.email, customer.card_id, customer.last4, customer.exp_month),
+            ("cus_1", "testuser@gmail.com", "card_1", "4242", "8"),
+        )
+
+        # the same card again, checked against the index
+        create_source.return_value = stripe.Card.construct_from(stripe_card("card_2", "4242"), "key")
+        self.assertEqual(self.client.post("/payments/create-card/", self.card, format="json").status_code, 200)
+        self.assertEqual(customer_create.call_count, 1)
+        self.assertEqual(StripeCustomer.objects.get().card_id, "card_1")
+
+        # another card than the customer's
+        response = self.client.post("/payments/create-card/", dict(self.card, exp_month="09"), format="json")
+        self.assertEqual(response.status_code, 400)
+        customer_list.assert_not_called()
+
+    @mock.patch("payments.views.StripeGateway.create_token")
+    @mock.patch("payments.views.StripeGateway.list_customers")
+    def test_card_of_another_email(self, customer_list, token_create):
+        StripeCustomer.objects.create(customer_id="cus_2", email="other@gmail.com", card_id="card_9", last4="4242")
+        response = self.client.post("/payments/create-card/", self.card, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["detail"], "Your email address does not belong to the provided card.")
+        customer_list.assert_not_called()
+        token_create.assert_not_called()
+
+
+class CardDetailsCacheTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        card_details_cache.local.clear()
+        self.user = User.objects.create_user(username="testuser", email="a@gmail.com", password="testuser1234")
+        self.client.force_authenticate(user=self.user)
+        self.card = StripeModel.objects.create(email="a@gmail.com", customer_id="cus_1", card_number="4242424242424242",
+                                               exp_month="8", exp_year="2030", card_id="card_1", user=self.user,
+                                               stripe_card=stripe_card("card_1", "4242"))
+
+    def card_details(self, customer_id="cus_1", card_id="card_1"):
+        response = self.client.get("/payments/card-details/", HTTP_CUSTOMER_ID=customer_id, HTTP_CARD_ID=card_id)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    @mock.patch("payments.views.StripeGateway.retrieve_source")
+    def test_saved_card_is_read_from_the_database(self, retrieve_source):
+        with self.assertNumQueries(1):
+            card = self.card_details()
+        self.assertEqual(card, stripe_card("card_1", "4242"))
+        # then from the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(self.card_details(), card)
+        retrieve_source.assert_not_called()
+
+    @mock.patch("payments.views.StripeGateway.retrieve_source")
+    def test_other_cards_are_retrieved_once(self, retrieve_source):
+        retrieve_source.return_value = stripe.util.convert_to_stripe_object(stripe_card("card_2", "1111"))
+        for _ in range(3):
+            self.assertEqual(self.card_details(card_id="card_2")["last4"], "1111")
+        retrieve_source.assert_called_once_with("cus_1", "card_2")
+
+    @mock.patch("payments.views.StripeGateway.retrieve_source")
+    def test_saved_card_without_its_stripe_card_is_retrieved(self, retrieve_source):
+        StripeModel.objects.filter(id=self.card.id).update(stripe_card=None)
+        retrieve_source.return_value = stripe.util.convert_to_stripe_object(stripe_card("card_1", "4242"))
+        self.assertEqual(self.card_details(), stripe_card("card_1", "4242"))
+        retrieve_source.assert_called_once_with("cus_1", "card_1")
+
+    @mock.patch("payments.views.StripeGateway.modify_source")
+    def test_update_drops_the_cached_card(self, modify_source):
+        modify_source.return_value = stripe.util.convert_to_stripe_object(dict(stripe_card("card_1", "4242", exp_year=2031), name="A B"))
+        self.assertEqual(self.card_details()["exp_year"], 2030)
+        response = self.client.post("/payments/update-card/", {
+            "customer_id": "cus_1", "card_id": "card_1", "card_number": "4242424242424242", "exp_month": "",
+            "exp_year": "2031", "name_on_card": "A B", "address_city": "", "address_country": "",
+            "address_state": "", "address_zip": "",
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        card = self.card_details()
+        self.assertEqual((card["exp_year"], card["name"]), (2031, "A B"))
+
+    @mock.patch("payments.views.StripeGateway.retrieve_source")
+    @mock.patch("payments.views.StripeGateway.delete_customer")
+    @mock.patch("payments.views.StripeGateway.delete_source")
+    def test_delete_drops_the_cached_card(self, delete_source, delete_customer, retrieve_source):
+        self.card_details()
+        response = self.client.post("/payments/delete-card/", {"card_number": "4242424242424242"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        retrieve_source.side_effect = stripe.error.InvalidRequestError("No such source: 'card_1'", "id")
+        with self.assertRaises(stripe.error.InvalidRequestError):
+            self.card_details()
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class StripeWebhookTest(APITestCase):
+
+    def post_event(self, type, obj, secret="whsec_test", id=None):
+        self.events = getattr(self, "events", 0) + 1
+        payload = json.dumps({"id": id or f"evt_{self.events}", "object": "event", "type": type, "data": {"object": obj}})
+        timestamp = int(time.time())
+        signature = stripe.WebhookSignature._compute_signature(f"{timestamp}.{payload}", secret)
+        return self.client.post(
+            "/payments/webhook/", payload, content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+        )
+
+    def test_events_update_the_index(self):
+        customer = {"id": "cus_1", "object": "customer", "email": "a@gmail.com", "sources": {"data": [stripe_card("card_1", "1111")]}}
+        self.assertEqual(self.post_event("customer.created", customer).status_code, 200)
+        # saved, applied by the worker
+        self.assertFalse(StripeCustomer.objects.exists())
+        self.assertEqual(process_events(), 1)
+        self.assertEqual(StripeCustomer.objects.get().last4, "1111")
+
+        self.post_event("customer.updated", {"id": "cus_1", "object": "customer", "email": "b@gmail.com"})
+        self.post_event("customer.source.updated", stripe_card("card_1", "1111", exp_year=2031))
+        self.assertEqual(process_events(), 2)
+        customer = StripeCustomer.objects.get()
+        self.assertEqual((customer.email, customer.exp_year), ("b@gmail.com", "2031"))
+
+        self.post_event("customer.source.deleted", stripe_card("card_1", "1111"))
+        process_events()
+        self.assertIsNone(StripeCustomer.objects.get().last4)
+        self.post_event("customer.deleted", {"id": "cus_1", "object": "customer"})
+        process_events()
+        self.assertFalse(StripeCustomer.objects.exists())
+        self.assertFalse(StripeEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_card_event_before_the_customer(self):
+        self.post_event("customer.source.created", stripe_card("card_1", "1111", customer="cus_7"))
+        self.post_event("customer.created", {"id": "cus_7", "object": "customer", "email": "a@gmail.com"})
+        process_events()
+        customer = StripeCustomer.objects.get()
+        self.assertEqual((customer.email, customer.card_id), ("a@gmail.com", "card_1"))
+
+    def test_events_update_the_saved_cards(self):
+        user = User.objects.create_user(username="testuser", email="a@gmail.com", password="testuser1234")
+        StripeModel.objects.create(email="a@gmail.com", customer_id="cus_1", card_number="4242424242424242",
+                                   exp_month="8", exp_year="2030", card_id="card_1", user=user,
+                                   stripe_card=stripe_card("card_1", "4242"))
+        card_details_cache.local.clear()
+        self.assertEqual(card_details("cus_1", "card_1")["exp_year"], 2030)
+        self.post_event("customer.source.updated", dict(stripe_card("card_1", "4242", exp_year=2032), name="A B"))
+        process_events()
+        card = StripeModel.objects.get()
+        self.assertEqual((card.exp_year, card.name_on_card), ("2032", "A B"))
+        # the cached details are dropped
+        self.assertEqual(card_details("cus_1", "card_1")["exp_year"], 2032)
+
+        self.post_event("customer.source.deleted", stripe_card("card_1", "4242"))
+        process_events()
+        self.assertFalse(StripeModel.objects.exists())
+
+    def test_refund_marks_the_order_not_paid(self):
+        user = User.objects.create_user(username="testuser", email="a@gmail.com", password="testuser1234")
+        order = OrderModel.objects.create(name="A", paid_status=True, user=user)
+        ChargeJob.objects.create(user=user, order_data={}, status="succeeded", order=order, charge_id="ch_1")
+        self.post_event("charge.refunded", {"id": "ch_1", "object": "charge", "refunded": True})
+        process_events()
+        order.refresh_from_db()
+        self.assertFalse(order.paid_status)
+
+    def test_events_are_saved_once(self):
+        for _ in range(3):
+            self.assertEqual(self.post_event("customer.created", {"id": "cus_1", "email": "a@gmail.com"}, id="evt_same").status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        # a bad event is kept with its error and doesn't hold the others back
+        self.post_event("customer.deleted", {"object": "customer"})
+        self.assertEqual(process_events(), 2)
+        self.assertIn("KeyError", StripeEvent.objects.exclude(error="").get().error)
+        self.assertTrue(StripeCustomer.objects.filter(customer_id="cus_1").exists())
+
+    def test_bad_signature_is_refused(self):
+        response = self.post_event("customer.deleted", {"id": "cus_1", "object": "customer"}, secret="whsec_other")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    @override_settings(STRIPE_WEBHOOK_SECRET=None)
+    def test_events_are_refused_without_a_secret(self):
+        response = self.post_event("customer.deleted", {"id": "cus_1", "object": "customer"}, secret="")
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(StripeEvent.objects.exists())
+
+
+class FanOutTest(SimpleTestCase):
+
+    def test_calls_run_at_the_same_time(self):
+        started = time.perf_counter()
+        results = fan_out(*(lambda i=i: time.sleep(0.2) or i for i in range(3)))
+        self.assertEqual(results, [0, 1, 2])
+        self.assertLess(time.perf_counter() - started, 0.35)
+
+    def test_errors_are_raised_together(self):
+        def fail(error):
+            raise error
+
+        with self.assertRaises(FanOutError) as raised:
+            fan_out(lambda: "ok", lambda: fail(ValueError("a")), lambda: fail(KeyError("b")))
+        self.assertEqual([type(error) for error in raised.exception.errors], [ValueError, KeyError])
+        self.assertIsInstance(raised.exception.find(LookupError), KeyError)
+        self.assertEqual(raised.exception.results, ["ok", None, None])
+
+    def test_calls_not_started_are_cancelled(self):
+        ran = []
+        with override_settings(STRIPE_FANOUT_WORKERS=1), mock.patch("payments.fanout._executor", None):
+            with self.assertRaises(FanOutError) as raised:
+                fan_out(lambda: 1 / 0, lambda: ran.append(1))
+        self.assertEqual(ran, [])
+        self.assertEqual(raised.exception.results, [None, None])
+
+
+class StripeGatewayTest(APITestCase):
+
+    def setUp(self):
+        self.fake = FakeStripe()
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+        self.gateway = self.make_gateway()
+        # no backoff sleeps in the tests
+        patcher = mock.patch.object(PooledRequestsClient, "_sleep_time_seconds", return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_gateway(self, timeout=(1, 1), max_retries=2):
+        client = PooledRequestsClient(timeout=timeout, max_retries=max_retries, pool_size=2)
+        self.addCleanup(client.close)
+        return StripeGateway(api_key="sk_test", api_base=self.fake.url, client=client)
+
+    def test_connections_are_reused(self):
+        for i in range(5):
+            self.gateway.create_customer(email=f"user{i}@gmail.com")
+        self.assertEqual(len(self.fake.requests), 5)
+        self.assertEqual(self.fake.connections, 1)
+
+    def test_identical_lookups_are_sent_once(self):
+        customer = self.gateway.create_customer(email="a@gmail.com")
+        self.assertEqual(self.gateway.list_customers(email="a@gmail.com").data[0].id, customer.id)
+        self.gateway.list_customers(email="a@gmail.com")
+        self.assertEqual(len(self.fake.requests), 2)
+        # a write forgets the lookups
+        self.gateway.create_customer(email="a@gmail.com")
+        self.assertEqual(len(self.gateway.list_customers(email="a@gmail.com").data), 2)
+        self.assertEqual(len(self.fake.requests), 4)
+
+    def test_failed_calls_are_retried_once_only(self):
+        customer = self.gateway.create_customer(email="a@gmail.com")
+        self.fake.fail_next(2)
+        charge = self.gateway.create_charge(customer=customer.id, amount=1000, currency="inr")
+        self.assertTrue(charge.paid)
+        # the retries reuse the Idempotency-Key, the charge is made once
+        keys = {headers["Idempotency-Key"] for method, path, headers in self.fake.requests if path == "/v1/charges"}
+        self.assertEqual(len(keys), 1)
+        self.assertEqual(len(self.fake.charges), 1)
+
+        self.fake.fail_next(3)
+        with self.assertRaises(stripe.error.APIError):
+            self.gateway.list_customers(email="b@gmail.com")
+
+    def test_read_timeout(self):
+        gateway = self.make_gateway(timeout=(1, 0.2), max_retries=0)
+        self.fake.delay = 1
+        started = time.perf_counter()
+        with self.assertRaises(stripe.error.APIConnectionError):
+            gateway.list_customers()
+        self.assertLess(time.perf_counter() - started, 1)
+
+    def test_card_errors(self):
+        with self.assertRaises(stripe.error.CardError) as raised:
+            self.gateway.create_token(card={"number": DECLINED_CARD, "exp_month": 8, "exp_year": 2030, "cvc": "123"})
+        self.assertEqual(raised.exception.code, "card_declined")
+
+    def test_card_and_charge_views(self):
+        user = User.objects.create_user(username="testuser", email="testuser@gmail.com", password="testuser1234")
+        self.client.force_authenticate(user=user)
+        card = {"email": "testuser@gmail.com", "number": "4242424242424242", "exp_month": "08", "exp_year": "2030", "cvc": "123", "save_card": True}
+        order = {
+            "email": "testuser@gmail.com", "amount": "10.00", "name": "Test User", "card_number": "4242",
+            "address": "Somewhere", "ordered_item": "Lamp", "paid_status": True, "total_price": "10.00",
+            "is_delivered": False, "delivered_at": "Not Delivered",
+        }
+        with override_settings(STRIPE_API_BASE=self.fake.url):
+            response = self.client.post("/payments/create-card/", card, format="json")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.client.post("/payments/charge-customer/", order, format="json").status_code, 202)
+        self.assertEqual(self.fake.charges, {})
+        job, = claim_jobs()
+        run_job(job, self.gateway)
+        charge, = self.fake.charges.values()
+        self.assertEqual((charge["customer"], charge["amount"]), (response.data["customer_id"], 1000))
+        self.assertEqual(ChargeJob.objects.get().status, "succeeded")
+
+        # the job is run again (its worker died before saving): stripe replays the charge,
+        # the order is saved once
+        run_job(job, self.gateway)
+        self.assertEqual(len(self.fake.charges), 1)
+        self.assertEqual(OrderModel.objects.count(), 1)
+
+    def test_independent_calls_run_at_the_same_time(self):
+        user = User.objects.create_user(username="testuser", email="testuser@gmail.com", password="testuser1234")
+        self.client.force_authenticate(user=user)
+        card = {"email": "testuser@gmail.com", "number": "4242424242424242", "exp_month": "08", "exp_year": "2030", "cvc": "123", "save_card": True}
+        self.fake.delay = 0.3
+        with override_settings(STRIPE_API_BASE=self.fake.url):
+            # the token and the customer together, then the card
+            started = time.perf_counter()
+            self.assertEqual(self.client.post("/payments/create-card/", card, format="json").status_code, 200)
+            self.assertLess(time.perf_counter() - started, 0.8)
+
+            # the card and the customer together
+            started = time.perf_counter()
+            self.assertEqual(self.client.post("/payments/delete-card/", {"card_number": card["number"]}, format="json").status_code, 200)
+            self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(self.fake.customers, {})
+        self.assertFalse(StripeModel.objects.exists())
+
+    def test_customer_created_for_a_declined_card_is_kept(self):
+        user = User.objects.create_user(username="testuser", email="testuser@gmail.com", password="testuser1234")
+        self.client.force_authenticate(user=user)
+        card = {"email": "testuser@gmail.com", "number": DECLINED_CARD, "exp_month": "08", "exp_year": "2030", "cvc": "123", "save_card": True}
+        with override_settings(STRIPE_API_BASE=self.fake.url):
+            response = self.client.post("/payments/create-card/", card, format="json")
+        self.assertEqual((response.status_code, response.data["detail"]), (400, "Your card was declined."))
+        customer_id, = self.fake.customers
+        self.assertEqual(StripeCustomer.objects.get().customer_id, customer_id)
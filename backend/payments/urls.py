@@ -6,8 +6,10 @@ urlpatterns = [
     path('test-payment/', views.TestStripeImplementation.as_view()),
     path('create-card/', views.CreateCardTokenView.as_view()),
     path('charge-customer/', views.ChargeCustomerView.as_view()),
+    path('charge-jobs/<int:pk>/', views.ChargeJobStatusView.as_view(), name="charge-job-status"),
     path('update-card/', views.CardUpdateView.as_view()),    
     path('delete-card/', views.DeleteCardView.as_view()),    
     path('card-details/', views.RetrieveCardView.as_view()),
     path('check-token/', views.CheckTokenValidation.as_view()),
+    path('webhook/', views.StripeWebhookView.as_view(), name="stripe-webhook"),
 ]
\ No newline at end of file
@@ -3,16 +3,28 @@ from rest_framework import status
 from rest_framework import permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from account.models import StripeModel, OrderModel
+from account.models import StripeModel
+from account.authentication import TokenOnlyJWTAuthentication
+from product.inventory import OutOfStock, release, reserve
 from rest_framework.decorators import permission_classes
-from datetime import datetime
+from django.conf import settings
+from django.db import IntegrityError
+from .gateway import StripeGateway
+from .cards import card_details, forget_card_details
+from .charges import ORDER_FIELDS, enqueue_charge
+from .events import record_event
+from .fanout import FanOutError, fan_out
+from .customers import (
+    card_of_another_email, customer_by_email, forget_customer, index_card, index_customer,
+)
+from .models import ChargeJob
 
 
 # stripe secret test key
 stripe.api_key="your secret key here"
 
 
-def save_card_in_db(cardData, email, cardId, customer_id, user):
+def save_card_in_db(cardData, email, cardId, customer_id, user, stripe_card=None):
 
     # save card in django stripe model
     StripeModel.objects.create(
@@ -23,6 +35,7 @@ def save_card_in_db(cardData, email, cardId, customer_id, user):
         exp_year = cardData["exp_year"],
         card_id = cardId,
         user = user,
+        stripe_card = stripe_card,
     )
 
 
@@ -30,7 +43,7 @@ def save_card_in_db(cardData, email, cardId, customer_id, user):
 class TestStripeImplementation(APIView):
 
     def post(self, request):
-        test_payment_process = stripe.PaymentIntent.create(
+        test_payment_process = StripeGateway().create_payment_intent(
             amount=120,
             currency='inr',
             payment_method_types=['card'],
@@ -42,6 +55,8 @@ class TestStripeImplementation(APIView):
 # check token expired or not
 class CheckTokenValidation(APIView):
 
+    # answered from the token alone, without a query
+    authentication_classes = [TokenOnlyJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
@@ -62,62 +77,60 @@ class CreateCardTokenView(APIView):
         card_info = data["number"]
         client_card = card_info[slice(12, 16)] # only last 4 digits of card
 
-        # checking for valid user (email associated with card will be checked)
-        customer_data = stripe.Customer.list().data
-        user_data = []
-        for each in customer_data:
-            the_card = each.sources.data[0].last4
-            user_data.append({"user": {"card_num": the_card, "card_holder": each.email}})
-
-        for each in user_data:
-            user_info = each["user"]
-            user_card_info = user_info["card_num"]
-            user_email_info = user_info["card_holder"] 
-
-            if user_card_info == client_card:
-                if user_email_info != email:                
-                    return Response({ 
-                        "detail": "Your email address does not belong to the provided card." }, 
-                        status=status.HTTP_400_BAD_REQUEST)      
-
-        try:
-            stripeToken = stripe.Token.create(
-                card = {
-                "number": data["number"],
-                "exp_month": data["exp_month"],
-                "exp_year": data["exp_year"],
-                "cvc": data["cvc"]
-                },
-            )
-
-        except stripe.error.CardError as e:
-            errorMessage = e.user_message # as per stripe documentation
-            return Response({ "detail": errorMessage}, status=status.HTTP_400_BAD_REQUEST)
-
-        
-        except stripe.error.APIConnectionError:            
-            return Response({ "detail": "Network error, Failed to establish a new connection."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)              
-        
-        customer_data = stripe.Customer.list(email=email).data
-
-        if len(customer_data) == 0:
-            # create customer in stripe (will provide us customer id in response)
-            customer = stripe.Customer.create(
+        # checking for valid user (email associated with card will be checked), in the
+        # local index of the stripe customers
+        if card_of_another_email(client_card, email):
+            return Response({ 
+                "detail": "Your email address does not belong to the provided card." }, 
+                status=status.HTTP_400_BAD_REQUEST)      
+
+        gateway = StripeGateway()
+        customer = customer_by_email(email)
+        calls = [lambda: gateway.create_token(
+            card = {
+            "number": data["number"],
+            "exp_month": data["exp_month"],
+            "exp_year": data["exp_year"],
+            "cvc": data["cvc"]
+            },
+        )]
+        if customer is None:
+            # create customer in stripe (will provide us customer id in response), at the
+            # same time as the token
+            calls.append(lambda: gateway.create_customer(
                 email = request.data["email"],
                 description="My new customer"
-            )
-        else:
-            customer = customer_data[0]
+            ))
+
+        try:
+            stripeToken, *new_customer = fan_out(*calls)
+
+        except FanOutError as e:
+            # a customer created while the token failed is kept, the next try uses it
+            if customer is None and e.results[1] is not None:
+                index_customer(e.results[1])
+
+            card_error = e.find(stripe.error.CardError)
+            if card_error:
+                errorMessage = card_error.user_message # as per stripe documentation
+                return Response({ "detail": errorMessage}, status=status.HTTP_400_BAD_REQUEST)
+            if e.find(stripe.error.APIConnectionError):
+                return Response({ "detail": "Network error, Failed to establish a new connection."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            raise
+
+        if new_customer:
+            customer = index_customer(new_customer[0])
+        elif customer.card_id is not None:
             message = "Customer already exists"
 
-            actual_cn = customer.sources.data[0].last4 # holds card number (last four digits)
-            actual_em = customer.sources.data[0].exp_month
-            actual_ey = customer.sources.data[0].exp_year
+            actual_cn = customer.last4 # holds card number (last four digits)
+            actual_em = customer.exp_month
+            actual_ey = customer.exp_year
 
             recieved_cn = data["number"]
             last4_recieved_cn = recieved_cn[-4:]
-            recieved_em = data["exp_month"]
-            recieved_ey = data["exp_year"]
+            recieved_em = str(int(data["exp_month"]))
+            recieved_ey = str(int(data["exp_year"]))
 
             # comparing the last4 digits of card provided by the user with the last4 digits of card present on stripe
             if actual_cn != last4_recieved_cn or actual_em != recieved_em or actual_ey != recieved_ey:
@@ -128,91 +141,92 @@ class CreateCardTokenView(APIView):
 
         else:
             # creating a card on stripe (getting validated also by the stipe token)
-            create_user_card = stripe.Customer.create_source(
-                customer["id"],
+            create_user_card = gateway.create_source(
+                customer.customer_id,
                 source=stripeToken.id,
             )
+            index_card(customer.customer_id, create_user_card)
 
             # card id got generated at this point
 
             if cardStatus:
                 try:
-                    save_card_in_db(data, email, create_user_card.id, customer["id"], request.user)
-                    message = {"customer_id": customer["id"], "email": email, "card_data": create_user_card}
+                    save_card_in_db(data, email, create_user_card.id, customer.customer_id, request.user, create_user_card.to_dict_recursive())
+                    message = {"customer_id": customer.customer_id, "email": email, "card_data": create_user_card}
                     return Response(message, status=status.HTTP_200_OK)
-                except:
+                except IntegrityError:
                     return Response({ 
                         "detail": "Card already in use, please uncheck save card option or select a card from saved card list."},
                         status=status.HTTP_400_BAD_REQUEST)
             else:
                 try:
-                    message = {"customer_id": customer["id"], "email": email, "card_data": create_user_card}
+                    message = {"customer_id": customer.customer_id, "email": email, "card_data": create_user_card}
                     return Response(message, status=status.HTTP_200_OK)
                 except:
                     return Response({ "detail": "Network Error, please check your internet connection."})
 
-# Charge the customer card
+# Charge the customer card: the charge is queued for the worker (see charges.py),
+# the client polls ChargeJobStatusView
 class ChargeCustomerView(APIView):
 
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
+        data = request.data
         try:
-            data = request.data
-            email = request.data["email"]
-            customer_data = stripe.Customer.list(email=email).data
-            customer = customer_data[0]
-
-            customer_data = stripe.Customer.list(email=request.data["email"]).data
-
-            # make stripe payment (charge the customer) (either use charge api or paymentIntent api)
-            stripe.Charge.create(
-                customer=customer_data[0],
-                amount=int(float(request.data["amount"])*100),
-                currency="inr",
-                description='Software development services',  # required for Indian transactions
-            )
+            float(data["amount"])
+            missing = [field for field in ORDER_FIELDS if field not in data]
+        except (KeyError, TypeError, ValueError):
+            return Response({"detail": "Invalid amount."}, status=status.HTTP_400_BAD_REQUEST)
+        if missing:
+            return Response({"detail": f"Missing fields: {', '.join(missing)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # hold the ordered units before paying, no lock is kept while stripe is called
+        # and the units go back if the payment fails (or the checkout is abandoned)
+        reservation = product_id = None
+        quantity = 1
+        if data.get("product_id"):
+            try:
+                product_id, quantity = int(data["product_id"]), int(data.get("quantity", 1))
+                reservation = reserve(product_id, quantity)
+            except (TypeError, ValueError):
+                return Response({"detail": "Invalid product or quantity."}, status=status.HTTP_400_BAD_REQUEST)
+            except OutOfStock:
+                return Response({"detail": "Sorry, this product is out of stock."}, status=status.HTTP_409_CONFLICT)
 
-            # saving order in django database
-            new_order = OrderModel.objects.create(
-                name = data["name"],
-                card_number = data["card_number"],
-                address = data["address"],
-                ordered_item = data["ordered_item"],
-                paid_status = data["paid_status"],
-                paid_at = datetime.now(),
-                total_price = data["total_price"],
-                is_delivered = data["is_delivered"],
-                delivered_at = data["delivered_at"],
-                user = request.user
-            )
+        try:
+            job = enqueue_charge(request.user, data, reservation, product_id, quantity)
+        except BaseException:
+            if reservation is not None:
+                release(reservation)
+            raise
 
-            return Response(
-                data = {
-                    "data": {
-                        "customer_id": customer.id,
-                        "message": "Payment Successfull",
-                    }
-                }, status=status.HTTP_200_OK)
+        return Response({"job_id": job.id, "status": job.status}, status=status.HTTP_202_ACCEPTED)
 
-        except stripe.error.APIConnectionError:            
-            return Response({ 
-                "detail": "Network error, Failed to establish a new connection."}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+
+# state of a queued charge, polled by the client until it succeeded or failed
+class ChargeJobStatusView(APIView):
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        job = ChargeJob.objects.filter(id=pk, user=request.user).values("id", "status", "error", "order_id").first()
+        if job is None:
+            return Response({"detail": "Payment not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job, status=status.HTTP_200_OK)
 
 
-# retrieve card (to get user card details)
+# retrieve card (to get user card details), read through the card details cache
 class RetrieveCardView(APIView):
 
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request): 
-        card_details = stripe.Customer.retrieve_source(
+        details = card_details(
             request.headers["Customer-Id"],
             request.headers["Card-Id"]
         )
-        return Response(card_details, status=status.HTTP_200_OK)
+        return Response(details, status=status.HTTP_200_OK)
         
 
 # update a card
@@ -222,7 +236,7 @@ class CardUpdateView(APIView):
 
     def post(self, request):
         data = request.data
-        update_card = stripe.Customer.modify_source(
+        update_card = StripeGateway().modify_source(
             data["customer_id"],
             data["card_id"],
             exp_month = data["exp_month"] if data["exp_month"] else None,
@@ -234,6 +248,7 @@ class CardUpdateView(APIView):
             address_zip = data["address_zip"] if data["address_zip"] else None,
 
         )
+        index_card(data["customer_id"], update_card)
 
         # locating stripe object in django database
         obj = StripeModel.objects.get(card_number=request.data["card_number"])
@@ -247,9 +262,11 @@ class CardUpdateView(APIView):
             obj.address_country = data["address_country"] if data["address_country"] else obj.address_country
             obj.address_state = data["address_state"] if data["address_state"] else obj.address_state
             obj.address_zip = data["address_zip"] if data["address_zip"] else obj.address_zip
+            obj.stripe_card = update_card.to_dict_recursive()
             obj.save()
         else:
             pass
+        forget_card_details(data["customer_id"], data["card_id"])
 
         return Response(
             {
@@ -271,18 +288,47 @@ class DeleteCardView(APIView):
         customerId = obj_card.customer_id
         cardId = obj_card.card_id
 
-        # deleting card from stripe
-        stripe.Customer.delete_source(
-            customerId,
-            cardId
-        )
+        # deleting card and customer from stripe, at the same time
+        # as deleting the card will not change the default card number on stripe therefore
+        # we need to delete the customer (with a new card request customer will be recreated)
+        gateway = StripeGateway()
+
+        def delete_source():
+            try:
+                gateway.delete_source(customerId, cardId)
+            except stripe.error.InvalidRequestError as e:
+                # the customer was deleted first, its cards with it
+                if e.code != "resource_missing":
+                    raise
+
+        fan_out(delete_source, lambda: gateway.delete_customer(customerId))
 
         # deleting card from django database
         obj_card.delete()
-
-        # delete the customer
-        # as deleting the card will not change the default card number on stripe therefore
-        # we need to delete the customer (with a new card request customer will be recreated)
-        stripe.Customer.delete(customerId)
+        forget_card_details(customerId, cardId)
+        forget_customer(customerId)
         
-        return Response("Card deleted successfully.", status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response("Card deleted successfully.", status=status.HTTP_200_OK)
+
+
+# events sent by stripe (customers, cards and charges changed outside of this app),
+# the signature proves they come from stripe. They are saved and applied by the
+# event worker (see events.py), stripe only waits for the insert
+class StripeWebhookView(APIView):
+
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            # without the secret any signature would do
+            return Response({"detail": "The webhook is not configured."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        try:
+            event = stripe.Webhook.construct_event(
+                request.body, request.headers.get("Stripe-Signature", ""), settings.STRIPE_WEBHOOK_SECRET
+            )
+        except (ValueError, stripe.error.SignatureVerificationError):
+            return Response({"detail": "Invalid payload or signature."}, status=status.HTTP_400_BAD_REQUEST)
+
+        record_event(event)
+        return Response(status=status.HTTP_200_OK)
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Product
+from .models import Product, StockReservation
 
 
-admin.site.register(Product)
\ No newline at end of file
+admin.site.register(Product)
+admin.site.register(StockReservation)
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class ProductConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'product'
+
+    def ready(self):
+        from .cache import bump_catalog_version, invalidate_product_details
+        from .search import create_search_index
+
+        # the text index is raw sql (GIN expression index / FTS5 table), so it is
+        # created after migrate instead of living in the generated migrations
+        post_migrate.connect(create_search_index, sender=self)
+
+        # every write to the catalog invalidates the cached catalog reads
+        post_save.connect(bump_catalog_version, sender="product.Product")
+        post_delete.connect(bump_catalog_version, sender="product.Product")
+        post_save.connect(invalidate_product_details, sender="product.Product")
+        post_delete.connect(invalidate_product_details, sender="product.Product")
@@ -0,0 +1,273 @@
+import io
+import csv
+import json
+from itertools import islice
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+from django.db.models import Case, F, Value, When
+from .cache import bump_catalog_version, product_details_cache
+from .models import Product
+
+
+# Bulk import / export of the catalog as CSV or JSON lines. Rows are read as a
+# stream and validated with the model fields (no DRF serializer per row), each
+# chunk is written with bulk_create / bulk_update in its own transaction.
+
+FIELDS = ["id", "name", "description", "price", "stock", "quantity", "image"]
+FORMATS = ["csv", "jsonl"]
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+MAX_BATCH_CHANGES = 10000
+
+
+def read_rows(stream, file_format):
+    """
+    Yield the rows (dicts) of a text stream holding CSV (with a header line) or JSON lines.
+    A row that can't be parsed is yielded as the ValueError describing it.
+    """
+    if file_format == "csv":
+        try:
+            yield from csv.DictReader(stream)
+        except csv.Error as e:
+            # the rest of the file can't be read reliably
+            yield ValueError(str(e))
+    else:
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield e
+
+
+def clean_row(row):
+    """
+    Return (values, errors) for one row, values are ready to be set on a Product. Only the
+    fields present in the row have a value (see complete_row for a new product).
+    """
+    if isinstance(row, ValueError):
+        return {}, {"row": [str(row)]}
+    if not isinstance(row, dict):
+        return {}, {"row": ["Expected an object."]}
+
+    values, errors = {}, {}
+    for name in FIELDS[1:]:
+        if name not in row:
+            continue
+        field = Product._meta.get_field(name)
+        raw = row[name]
+        if raw in (None, "") and (field.blank or field.has_default()):
+            values[name] = field.get_default()
+            continue
+        try:
+            values[name] = field.clean(raw, None)
+        except ValidationError as e:
+            errors[name] = e.messages
+
+    if values.get("quantity") is not None:
+        # a tracked product is in stock while it has units
+        values["stock"] = values["quantity"] > 0
+
+    if row.get("id") not in (None, ""):
+        try:
+            values["id"] = int(row["id"])
+        except (TypeError, ValueError):
+            errors["id"] = ["A valid integer is required."]
+    return values, errors
+
+
+def complete_row(values):
+    """Give the fields a new product's row left out their default, returns the errors of the required ones."""
+    errors = {}
+    for name in FIELDS[1:]:
+        if name in values:
+            continue
+        field = Product._meta.get_field(name)
+        if field.blank or field.has_default():
+            values[name] = field.get_default()
+        else:
+            errors[name] = ["This field is required."]
+    return errors
+
+
+def _fail(report, line, errors):
+    report["failed"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"row": line, "errors": errors})
+
+
+def import_products(rows, chunk_size=CHUNK_SIZE):
+    """
+    Create (rows without id) or update (rows with the id of an existing product) products.
+    Rows with an unknown id are created with that id. An update only changes the fields
+    present in its row. Returns a report of the import.
+    """
+    report = {"created": 0, "updated": 0, "failed": 0, "errors": []}
+    db = router.db_for_write(Product)
+    fields = FIELDS[1:]
+    rows = iter(rows)
+    line = 0
+    created_with_id = False
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        valid = []
+        for row in chunk:
+            line += 1
+            values, errors = clean_row(row)
+            if errors:
+                _fail(report, line, errors)
+            else:
+                valid.append((line, values))
+
+        # the rows for one id are merged, the later ones win
+        with_id = {}
+        for row_line, values in valid:
+            if "id" in values:
+                with_id[values["id"]] = (row_line, {**with_id.get(values["id"], (0, {}))[1], **values})
+        valid = [(row_line, values) for row_line, values in valid if "id" not in values] + list(with_id.values())
+
+        with transaction.atomic(using=db):
+            existing = Product.objects.using(db).in_bulk(list(with_id))
+            created, updated = [], []
+            for row_line, values in valid:
+                product = existing.get(values.get("id"))
+                if product is None:
+                    errors = complete_row(values)
+                    if errors:
+                        _fail(report, row_line, errors)
+                        continue
+                    created.append(Product(**values))
+                    created_with_id |= "id" in values
+                else:
+                    for name in fields:
+                        if name in values:
+                            setattr(product, name, values[name])
+                    if product.quantity is not None:
+                        # a tracked product is in stock while it has units
+                        product.stock = product.quantity > 0
+                    updated.append(product)
+            Product.objects.using(db).bulk_create(created, batch_size=chunk_size)
+            Product.objects.using(db).bulk_update(updated, fields, batch_size=chunk_size)
+
+        report["created"] += len(created)
+        report["updated"] += len(updated)
+        for product in updated:
+            product_details_cache.delete(product.pk)
+
+    if created_with_id:
+        # explicit ids don't move the id sequence (postgres), move it past them
+        connection = connections[db]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Product]):
+                cursor.execute(sql)
+
+    if report["created"] or report["updated"]:
+        # bulk writes skip the model signals, start one new catalog version for all of them
+        bump_catalog_version(ids=None)
+    return report
+
+
+def export_products(file_format, chunk_size=CHUNK_SIZE):
+    """Yield the whole catalog as CSV or JSON lines, a line at a time."""
+    rows = Product.objects.order_by("id").values_list(*FIELDS).iterator(chunk_size=chunk_size)
+    if file_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(FIELDS)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    else:
+        for row in rows:
+            values = dict(zip(FIELDS, row))
+            values["price"] = str(values["price"])
+            yield json.dumps(values) + "\n"
+
+
+def update_prices_and_stock(changes):
+    """
+    Apply a batch of {"id", "price", "stock"} changes (price and stock are optional)
+    with set based UPDATEs in one transaction, without reading the products first. The
+    stock of a product with a tracked quantity follows its quantity, a change of it is invalid.
+    Returns one result per id: "updated", "not_found" or "invalid" (with the errors).
+    """
+    unidentified, results, valid = [], {}, {}
+    for change in changes:
+        values, errors = {}, {}
+        id = change.get("id") if isinstance(change, dict) else None
+        if not isinstance(id, int) or isinstance(id, bool):
+            unidentified.append({"id": id, "status": "invalid", "errors": {"id": ["A valid integer is required."]}})
+            continue
+        for name in ("price", "stock"):
+            if name in change:
+                try:
+                    values[name] = Product._meta.get_field(name).clean(change[name], None)
+                except ValidationError as e:
+                    errors[name] = e.messages
+        if not values and not errors:
+            errors["detail"] = ["Nothing to update, give a price and/or stock."]
+
+        # the last change for an id wins
+        if errors:
+            valid.pop(id, None)
+            results[id] = {"id": id, "status": "invalid", "errors": errors}
+        else:
+            valid[id] = values
+            results[id] = {"id": id, "status": "not_found"}
+
+    db = router.db_for_write(Product)
+    items = list(valid.items())
+    batch_size = connections[db].ops.bulk_batch_size(["id", "price", "id", "stock", "id"], items)
+    found, tracked = [], []
+    with transaction.atomic(using=db):
+        for start in range(0, len(items), batch_size):
+            batch = dict(items[start:start + batch_size])
+            ids = []
+            for id, quantity in (
+                Product.objects.using(db).filter(id__in=list(batch)).select_for_update().values_list("id", "quantity")
+            ):
+                if quantity is not None and "stock" in batch[id]:
+                    tracked.append(id)
+                else:
+                    ids.append(id)
+            updates = {
+                name: Case(
+                    *[
+                        When(id=id, then=Value(batch[id][name], output_field=Product._meta.get_field(name)))
+                        for id in ids if name in batch[id]
+                    ],
+                    default=F(name),
+                )
+                for name in ("price", "stock")
+                if any(name in batch[id] for id in ids)
+            }
+            if updates:
+                Product.objects.using(db).filter(id__in=ids).update(**updates)
+            found += ids
+
+    for id in tracked:
+        results[id] = {"id": id, "status": "invalid", "errors": {
+            "stock": ["The stock of this product follows its quantity, it can't be set."]
+        }}
+    for id in found:
+        results[id] = {"id": id, "status": "updated"}
+        if "price" in valid[id]:
+            results[id]["price"] = f"{valid[id]['price']:.2f}"
+        if "stock" in valid[id]:
+            results[id]["stock"] = valid[id]["stock"]
+
+    if found:
+        # one new catalog version (and one cache round trip) for the whole batch
+        bump_catalog_version(ids=sorted(found))
+        product_details_cache.delete_many(found)
+    return unidentified + list(results.values())
@@ -0,0 +1,214 @@
+import time
+import uuid
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from my_project.cache import LocalLRUCache
+
+
+# The catalog version changes on every write to the products table. Read views
+# derive their ETag / Last-Modified from it (answering 304s without touching the
+# ORM) and the catalog snapshot uses it to know when it has to catch up. The list
+# reads a copy of it kept in the process (local_catalog_version), the shared
+# cache is asked again every CATALOG_VERSION_LOCAL_TTL seconds.
+
+CATALOG_VERSION_KEY = "catalog:version"
+CATALOG_DATA_TIMEOUT = 60 * 60
+
+# (state, trusted until) of the last version this process read or made
+_local_version = (None, 0)
+
+
+def _remember(state):
+    global _local_version
+    _local_version = (state, time.time() + settings.CATALOG_VERSION_LOCAL_TTL)
+    return state
+
+
+def catalog_version():
+    """Return the current catalog version as {"version": str, "modified": timestamp}."""
+    state = cache.get(CATALOG_VERSION_KEY)
+    if state is None:
+        # cache was flushed (or this is the first read), start a new version
+        cache.add(CATALOG_VERSION_KEY, {"version": uuid.uuid4().hex, "modified": int(time.time())}, None)
+        state = cache.get(CATALOG_VERSION_KEY)
+    return _remember(state)
+
+
+def local_catalog_version():
+    """catalog_version() from the copy of this process while it is trusted, this process' own changes show at once."""
+    state, until = _local_version
+    if state is None or time.time() >= until:
+        state = catalog_version()
+    return state
+
+
+def _change_key(version):
+    return f"catalog:change:{version}"
+
+
+def _new_catalog_version(ids):
+    # every version records which products changed since the version before it,
+    # so a reader holding an older copy of the catalog (the snapshot) can catch
+    # up by re-reading just those rows. cache.add makes only one writer able to
+    # succeed a version, which keeps the chain linear when writers race.
+    new = {"version": uuid.uuid4().hex, "modified": int(time.time())}
+    for _ in range(50):
+        old = catalog_version()
+        if cache.add(_change_key(old["version"]), {"next": new["version"], "ids": ids}, CATALOG_DATA_TIMEOUT):
+            break
+        time.sleep(0.01)
+    # if the chain could not be extended, readers of older versions rebuild from scratch
+    cache.set(CATALOG_VERSION_KEY, new, None)
+    _remember(new)
+
+
+def bump_catalog_version(ids=None, instance=None, **kwargs):
+    """
+    Start a new catalog version, ids are the changed products (None means unknown).
+    Connected to Product post_save / post_delete (the saved instance is the change).
+    """
+    if instance is not None:
+        ids = [instance.pk]
+    _new_catalog_version(ids)
+    # bump again once the write is visible, otherwise a read that runs before the
+    # commit could cache the old rows under the new version
+    transaction.on_commit(lambda: _new_catalog_version(ids))
+
+
+def catalog_changes(since):
+    """
+    Return (ids, version): the products changed between version since and the current
+    version, ids is None when the changes are not known anymore.
+    """
+    version = catalog_version()["version"]
+    ids = set()
+    while since != version:
+        change = cache.get(_change_key(since))
+        if change is None or change["ids"] is None:
+            return None, version
+        ids.update(change["ids"])
+        since = change["next"]
+    return ids, version
+
+
+def catalog_etag(request, pk=None):
+    version = local_catalog_version()["version"]
+    return version if pk is None else f"{version}-{pk}"
+
+
+def catalog_last_modified(request, pk=None):
+    return datetime.fromtimestamp(local_catalog_version()["modified"], tz=timezone.utc)
+
+
+# Two tier cache (in-process LRU in front of the shared cache) for hot single
+# objects like product details. Concurrent misses for one key in a process are
+# coalesced into a single load, and expired entries keep being served for a
+# while (stale-while-revalidate) while one background load refreshes them.
+
+class TwoTierCache:
+    """
+    get(key, loader) returns the value for key, calling loader() at most once per
+    process at a time for the same key.
+
+    ttl: seconds a loaded value is fresh
+    stale_ttl: seconds after that it is still served while it is refreshed in the background
+    local_ttl: seconds the in-process copy is trusted before the shared cache is asked again
+    (this bounds how long other processes can serve a value that was invalidated)
+    """
+
+    refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+
+    def __init__(self, prefix, ttl, stale_ttl, local_ttl, local_size=1024, shared=cache):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.local_ttl = local_ttl
+        self.local = LocalLRUCache(local_size)
+        self.shared = shared
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    def _key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def get(self, key, loader):
+        key = self._key(key)
+        now = time.time()
+
+        entry = self.local.get(key)
+        if entry is None or now >= entry["local_until"]:
+            entry = self.shared.get(key)
+            if entry is not None:
+                self.local.set(key, dict(entry, local_until=now + self.local_ttl))
+
+        if entry is None:
+            return self._load(key, loader).result()
+
+        if now >= entry["fresh_until"]:
+            self._refresh(key, loader)
+        return entry["value"]
+
+    def delete(self, key):
+        key = self._key(key)
+        self.local.delete(key)
+        self.shared.delete(key)
+
+    def delete_many(self, keys):
+        keys = [self._key(key) for key in keys]
+        for key in keys:
+            self.local.delete(key)
+        self.shared.delete_many(keys)
+
+    def _flight(self, key):
+        # returns (future, leader), only the leader of a flight runs the loader
+        with self._flights_lock:
+            future = self._flights.get(key)
+            if future is not None:
+                return future, False
+            future = self._flights[key] = Future()
+            return future, True
+
+    def _load(self, key, loader):
+        future, leader = self._flight(key)
+        if leader:
+            self._run(key, loader, future)
+        return future
+
+    def _refresh(self, key, loader):
+        future, leader = self._flight(key)
+        if leader:
+            self.refresh_executor.submit(self._run_in_background, key, loader, future)
+
+    def _run_in_background(self, key, loader, future):
+        try:
+            self._run(key, loader, future)
+        finally:
+            # database connections are per thread, don't leak the pool thread's one
+            connections.close_all()
+
+    def _run(self, key, loader, future):
+        try:
+            value = loader()
+            now = time.time()
+            entry = {"value": value, "fresh_until": now + self.ttl}
+            self.shared.set(key, entry, self.ttl + self.stale_ttl)
+            self.local.set(key, dict(entry, local_until=now + self.local_ttl))
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+
+
+product_details_cache = TwoTierCache("product", ttl=5 * 60, stale_ttl=60 * 60, local_ttl=5)
+
+
+def invalidate_product_details(sender, instance, **kwargs):
+    """Drop the cached details of a product (connected to Product post_save / post_delete)."""
+    product_details_cache.delete(instance.pk)
+    transaction.on_commit(lambda: product_details_cache.delete(instance.pk))
@@ -0,0 +1,100 @@
+from decimal import Decimal, InvalidOperation
+from django.core.cache import cache
+from django.db.models import Count, Q, Value
+from rest_framework.exceptions import ValidationError
+from .cache import CATALOG_DATA_TIMEOUT, catalog_version
+from .models import Product
+
+
+# Server side filtering, sorting and facet counts for the products list.
+# Every ordering ends with id so it is unique (keyset pagination needs that),
+# and each one is backed by an index declared on Product.
+
+FILTER_PARAMS = ("min_price", "max_price", "in_stock", "ordering", "facets")
+ORDERINGS = {
+    "id": ("id",),
+    "price": ("price", "id"),
+    "-price": ("-price", "-id"),
+    "name": ("name", "id"),
+    "-name": ("-name", "-id"),
+}
+PRICE_BUCKETS = [(0, 50), (50, 100), (100, 500), (500, 1000), (1000, None)]
+TRUE_VALUES, FALSE_VALUES = ("true", "1"), ("false", "0")
+
+
+def parse_filters(query_params):
+    """Return the filters of a products list request, raising ValidationError (400) for bad values."""
+    filters, errors = {}, {}
+
+    for name in ("min_price", "max_price"):
+        if query_params.get(name):
+            try:
+                filters[name] = Decimal(query_params[name])
+            except InvalidOperation:
+                errors[name] = ["A valid number is required."]
+
+    for name in ("in_stock", "facets"):
+        value = query_params.get(name, "").lower()
+        if value in TRUE_VALUES:
+            filters[name] = True
+        elif value in FALSE_VALUES:
+            filters[name] = False
+        elif value:
+            errors[name] = ["Must be true or false."]
+
+    filters["ordering"] = query_params.get("ordering", "id")
+    if filters["ordering"] not in ORDERINGS:
+        errors["ordering"] = [f"Must be one of: {', '.join(ORDERINGS)}."]
+
+    if errors:
+        raise ValidationError(errors)
+    return filters
+
+
+def price_q(filters):
+    q = Q()
+    if "min_price" in filters:
+        q &= Q(price__gte=filters["min_price"])
+    if "max_price" in filters:
+        q &= Q(price__lte=filters["max_price"])
+    return q
+
+
+def stock_q(filters):
+    # compared as "stock = %s" rather than a bare boolean column, which sqlite can't
+    # match against the (stock, price, id) index
+    return Q(stock=Value(filters["in_stock"])) if "in_stock" in filters else Q()
+
+
+def filter_products(filters):
+    return Product.objects.filter(price_q(filters) & stock_q(filters))
+
+
+def product_facets(filters):
+    """
+    Counts of in / out of stock products and of products per price bucket. Each facet is
+    counted with the other filters applied but not its own, so the counts show what
+    choosing another value would return. Cached per catalog version.
+    """
+    key = "catalog:facets:{}:{}:{}:{}".format(
+        catalog_version()["version"], filters.get("min_price"), filters.get("max_price"), filters.get("in_stock")
+    )
+    facets = cache.get(key)
+    if facets is None:
+        stock = Product.objects.filter(price_q(filters)).aggregate(
+            in_stock=Count("id", filter=Q(stock=True)),
+            out_of_stock=Count("id", filter=Q(stock=False)),
+        )
+        buckets = Product.objects.filter(stock_q(filters)).aggregate(**{
+            str(index): Count("id", filter=Q(price__gte=low) & (Q(price__lt=high) if high else Q()))
+            for index, (low, high) in enumerate(PRICE_BUCKETS)
+        })
+        facets = {
+            "stock": stock,
+            "price": [
+                {"min": low, "max": high, "count": buckets[str(index)]}
+                for index, (low, high) in enumerate(PRICE_BUCKETS)
+            ],
+        }
+        cache.set(key, facets, CATALOG_DATA_TIMEOUT)
+    return facets
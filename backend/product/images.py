@@ -0,0 +1,92 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+from .cache import bump_catalog_version, product_details_cache
+
+
+# Resized copies of Product.image (WebP plus a JPEG fallback) generated in a
+# background process pool after an upload, so the product grid downloads and
+# decodes a thumbnail instead of the full size original.
+
+VARIANTS = {"thumbnail": 160, "medium": 480, "large": 1024}  # max width in px
+DERIVATIVES_DIR = "derivatives"
+
+_executor = None
+
+
+def render_derivatives(source, media_root):
+    """
+    Write every variant of the image at path source under media_root/derivatives.
+    Runs in the pool, so it only uses Pillow and the filesystem.
+    Returns {variant: {"width", "webp", "jpeg"}} with names relative to media_root.
+    """
+    stem = os.path.splitext(os.path.basename(source))[0]
+    os.makedirs(os.path.join(media_root, DERIVATIVES_DIR), exist_ok=True)
+
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original).convert("RGB")
+        variants = {}
+        for variant, width in VARIANTS.items():
+            image = original.copy()
+            # never upscale, only the width is bounded
+            image.thumbnail((width, image.height), Image.LANCZOS)
+            names = {
+                "webp": f"{DERIVATIVES_DIR}/{stem}_{variant}.webp",
+                "jpeg": f"{DERIVATIVES_DIR}/{stem}_{variant}.jpg",
+            }
+            image.save(os.path.join(media_root, names["webp"]), "WEBP", quality=80, method=4)
+            image.save(os.path.join(media_root, names["jpeg"]), "JPEG", quality=82, optimize=True, progressive=True)
+            variants[variant] = {"width": image.width, **names}
+    return variants
+
+
+def image_srcset(variants):
+    """Variant names of a product (Product.image_variants) as urls."""
+    return {
+        variant: {
+            "width": files["width"],
+            "webp": default_storage.url(files["webp"]),
+            "jpeg": default_storage.url(files["jpeg"]),
+        }
+        for variant, files in (variants or {}).items()
+    }
+
+
+def save_derivatives(product_class, pk, image, variants):
+    # only attach the variants if the product still has the image they were made from
+    updated = product_class.objects.filter(id=pk, image=image).update(image_variants=variants)
+    if updated:
+        # update() skips post_save, the cached reads still need to see the srcset
+        bump_catalog_version(ids=[pk])
+        product_details_cache.delete(pk)
+
+
+def schedule_derivatives(product):
+    """Generate the image variants of product in the background once the current transaction commits."""
+    if not product.image:
+        return
+
+    product_class, pk, image = type(product), product.pk, product.image.name
+    source = default_storage.path(image)
+    media_root = os.path.abspath(settings.MEDIA_ROOT)
+
+    def done(future):
+        try:
+            save_derivatives(product_class, pk, image, future.result())
+        except Exception:
+            # the product keeps serving its original image
+            pass
+        finally:
+            # runs on the pool's result thread, don't leak its database connection
+            connections.close_all()
+
+    def submit():
+        global _executor
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_DERIVATIVE_WORKERS)
+        _executor.submit(render_derivatives, source, media_root).add_done_callback(done)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,130 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import F, Value
+from django.utils import timezone
+from .cache import bump_catalog_version, product_details_cache
+from .models import Product, StockReservation
+
+
+# Inventory of products with a tracked quantity. Units are taken with one
+# conditional UPDATE ("SET quantity = quantity - n WHERE id = ? AND quantity >= n"),
+# so concurrent checkouts of the same product can't oversell it, and no lock is
+# held while the payment runs: the units sit in a StockReservation until the
+# payment succeeds (confirm) or fails (release). Reservations of checkouts that
+# never finished expire and their units go back (release_expired).
+
+RELEASE_BATCH_SIZE = 500
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def _take(db, product_id, quantity):
+    """Take units in a single UPDATE, returns None (not enough units), "taken" or "sold_out"."""
+    products = Product.objects.using(db).filter(id=product_id)
+    if products.filter(quantity__gt=quantity).update(quantity=F("quantity") - quantity):
+        return "taken"
+    # the last units, the product goes out of stock
+    if products.filter(quantity=quantity).update(quantity=0, stock=False):
+        return "sold_out"
+    return None
+
+
+def _changed(product_ids, sold_out_or_restocked):
+    # update() skips the model signals, the quantity is part of the cached details
+    # and the stock flag of the catalog (list, snapshot, facets)
+    product_details_cache.delete_many(product_ids)
+    if sold_out_or_restocked:
+        bump_catalog_version(ids=sorted(product_ids))
+
+
+def reserve(product_id, quantity=1, ttl=None):
+    """
+    Take quantity units of a product and return the StockReservation holding them, or None
+    when the product is in stock but its inventory isn't tracked. Raises OutOfStock.
+    """
+    if quantity < 1:
+        raise ValueError("quantity must be at least 1")
+    ttl = settings.STOCK_RESERVATION_TTL if ttl is None else ttl
+    db = router.db_for_write(Product)
+
+    for attempt in range(2):
+        with transaction.atomic(using=db):
+            taken = _take(db, product_id, quantity)
+            if taken:
+                reservation = StockReservation.objects.using(db).create(
+                    product_id=product_id, quantity=quantity, expires_at=timezone.now() + timedelta(seconds=ttl)
+                )
+        if taken:
+            _changed([product_id], taken == "sold_out")
+            return reservation
+
+        if Product.objects.using(db).filter(id=product_id, quantity__isnull=True, stock=True).exists():
+            return None
+        # units held by abandoned checkouts may be enough, give them back and try again
+        if attempt or not release_expired(product_id=product_id):
+            break
+    raise OutOfStock(f"not enough units of product {product_id}")
+
+
+def confirm(reservation):
+    """
+    The payment of a reservation went through, its units are sold. Returns False when the
+    reservation had expired already and its units could not be taken again.
+    """
+    db = router.db_for_write(Product)
+    if StockReservation.objects.using(db).filter(id=reservation.id).delete()[0]:
+        return True
+    # the hold expired (and was released) while the payment was running
+    with transaction.atomic(using=db):
+        taken = _take(db, reservation.product_id, reservation.quantity)
+    if taken:
+        _changed([reservation.product_id], taken == "sold_out")
+    return taken is not None
+
+
+def release(reservation):
+    """The payment of a reservation failed, give its units back. Releasing twice is a no-op."""
+    return _release(StockReservation.objects.filter(id=reservation.id)) > 0
+
+
+def release_expired(product_id=None):
+    """Give back the units of every expired reservation (of one product), returns how many were released."""
+    expired = StockReservation.objects.filter(expires_at__lte=timezone.now())
+    if product_id is not None:
+        expired = expired.filter(product_id=product_id)
+    released = 0
+    while True:
+        count = _release(expired)
+        released += count
+        if count < RELEASE_BATCH_SIZE:
+            return released
+
+
+def _release(reservations):
+    db = router.db_for_write(Product)
+    with transaction.atomic(using=db):
+        # only the transaction that locks and deletes a reservation gives its units back
+        rows = list(
+            reservations.using(db).select_for_update(skip_locked=True).order_by("id")
+            .values_list("id", "product_id", "quantity")[:RELEASE_BATCH_SIZE]
+        )
+        if not rows:
+            return 0
+        StockReservation.objects.using(db).filter(id__in=[id for id, _, _ in rows]).delete()
+
+        units = {}
+        for _, product_id, quantity in rows:
+            units[product_id] = units.get(product_id, 0) + quantity
+        # in product order, so concurrent releases lock the rows in the same order
+        restocked = False
+        for product_id in sorted(units):
+            products = Product.objects.using(db).filter(id=product_id, quantity__isnull=False)
+            if not products.filter(stock=True).update(quantity=F("quantity") + units[product_id]):
+                # the product was sold out, it is back in stock
+                restocked |= bool(products.update(quantity=F("quantity") + units[product_id], stock=Value(True)))
+
+    _changed(list(units), restocked)
+    return len(rows)
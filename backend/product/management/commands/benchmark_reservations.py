@@ -0,0 +1,84 @@
+import time
+import random
+import threading
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+from product.inventory import OutOfStock, confirm, release, reserve
+from product.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark concurrent checkouts of a single hot product: threads reserve and confirm "
+        "(or release, for failed payments) units until it sells out, then report the throughput "
+        "and check nothing was oversold. Run it against the real database (postgres)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quantity", type=int, default=2000, help="units of the hot product")
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--units", type=int, default=1, help="units per checkout")
+        parser.add_argument("--fail-rate", type=float, default=0.1, help="share of payments that fail")
+
+    def handle(self, *args, **options):
+        product = Product.objects.create(
+            name="benchmark hot product", price=1, stock=True, quantity=options["quantity"]
+        )
+        lock = threading.Lock()
+        stats = {"sold": 0, "released": 0, "out_of_stock": 0, "errors": 0, "latencies": []}
+
+        def checkout():
+            latencies, failures = [], 0
+            try:
+                while failures < 100:
+                    start = time.perf_counter()
+                    try:
+                        reservation = reserve(product.id, options["units"])
+                    except OutOfStock:
+                        with lock:
+                            stats["out_of_stock"] += 1
+                        break
+                    except DatabaseError:
+                        # lock timeouts and the like, give up after too many in a row
+                        failures += 1
+                        with lock:
+                            stats["errors"] += 1
+                        continue
+                    failures = 0
+                    failed = random.random() < options["fail_rate"]
+                    if failed:
+                        release(reservation)
+                    else:
+                        confirm(reservation)
+                    latencies.append(time.perf_counter() - start)
+                    with lock:
+                        stats["released" if failed else "sold"] += options["units"]
+            finally:
+                with lock:
+                    stats["latencies"] += latencies
+                connections.close_all()
+
+        threads = [threading.Thread(target=checkout) for _ in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        latencies = sorted(stats["latencies"])
+        checkouts = len(latencies)
+        oversold = stats["sold"] + product.quantity - options["quantity"]
+        product.delete()
+
+        def percentile(p):
+            return latencies[min(checkouts - 1, int(checkouts * p))] * 1000 if checkouts else 0
+
+        self.stdout.write(
+            f"threads: {options['threads']}, checkouts: {checkouts} in {elapsed:.2f}s "
+            f"({checkouts / elapsed:.0f}/s), sold: {stats['sold']}, released: {stats['released']}, "
+            f"errors: {stats['errors']}"
+        )
+        self.stdout.write(f"latency ms p50: {percentile(0.5):.2f}, p95: {percentile(0.95):.2f}, p99: {percentile(0.99):.2f}")
+        self.stdout.write(f"left: {product.quantity}, oversold: {oversold}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from product.bulk import FORMATS, export_products
+
+
+class Command(BaseCommand):
+    help = "Export the whole catalog as .csv or .jsonl (to stdout or a file)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file-format", choices=FORMATS, default="csv")
+        parser.add_argument("--output", help="defaults to stdout")
+
+    def handle(self, *args, **options):
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as output:
+                output.writelines(export_products(options["file_format"]))
+        else:
+            for line in export_products(options["file_format"]):
+                self.stdout.write(line, ending="")
@@ -0,0 +1,34 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from product.images import render_derivatives, save_derivatives
+from product.models import Product
+
+
+class Command(BaseCommand):
+    help = "Generate the resized image variants of products that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="regenerate the variants of every product")
+        parser.add_argument("--workers", type=int, default=settings.IMAGE_DERIVATIVE_WORKERS)
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image="").exclude(image__isnull=True)
+        if not options["all"]:
+            products = products.filter(image_variants={})
+        media_root = os.path.abspath(settings.MEDIA_ROOT)
+
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            jobs = {
+                executor.submit(render_derivatives, default_storage.path(image), media_root): (pk, image)
+                for pk, image in products.values_list("id", "image").iterator()
+            }
+            for job in as_completed(jobs):
+                pk, image = jobs[job]
+                try:
+                    save_derivatives(Product, pk, image, job.result())
+                    self.stdout.write(f"{image}: done")
+                except Exception as e:
+                    self.stderr.write(f"{image}: {e}")
@@ -0,0 +1,24 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from product.bulk import CHUNK_SIZE, FORMATS, import_products, read_rows
+
+
+class Command(BaseCommand):
+    help = "Import products from a .csv or .jsonl file (rows with an id update that product)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--file-format", choices=FORMATS, help="defaults to the file extension")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        file_format = options["file_format"] or os.path.splitext(options["path"])[1].lstrip(".").lower()
+        if file_format not in FORMATS:
+            raise CommandError(f"file format must be one of: {', '.join(FORMATS)}")
+
+        with open(options["path"], encoding="utf-8-sig", newline="") as stream:
+            report = import_products(read_rows(stream, file_format), chunk_size=options["chunk_size"])
+
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(f"created: {report['created']}, updated: {report['updated']}, failed: {report['failed']}")
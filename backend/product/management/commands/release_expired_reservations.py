@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from product.inventory import release_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Give back the units held by expired stock reservations (checkouts whose payment never completed), "
+        "once or, with --every, until stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--every", type=float, help="seconds between two releases, runs until stopped")
+
+    def handle(self, *args, **options):
+        released = 0
+        try:
+            while True:
+                released += release_expired()
+                if options["every"] is None:
+                    break
+                time.sleep(options["every"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"released {released} reservations")
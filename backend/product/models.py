@@ -6,7 +6,32 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=8, decimal_places=2)
     stock = models.BooleanField(default=False)
+    # units on hand, None when the product's inventory is not tracked (stock alone says
+    # if it can be sold). When tracked, stock is kept equal to quantity > 0 (see inventory.py)
+    quantity = models.PositiveIntegerField(null=True, blank=True)
     image = models.ImageField(null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True)  # resized copies of image (see images.py)
+
+    class Meta:
+        # composite indexes for the filtered / sorted products list (see filters.py),
+        # each ends with id so a keyset page is a range scan in index order
+        indexes = [
+            models.Index(fields=["price", "id"], name="product_price_idx"),
+            models.Index(fields=["name", "id"], name="product_name_idx"),
+            models.Index(fields=["stock", "price", "id"], name="product_stock_price_idx"),
+            models.Index(fields=["stock", "name", "id"], name="product_stock_name_idx"),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class StockReservation(models.Model):
+    """Units of a product held for a checkout until its payment succeeds or the hold expires."""
+    product = models.ForeignKey(Product, related_name="reservations", on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f"{self.quantity} x {self.product_id}"
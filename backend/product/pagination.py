@@ -0,0 +1,92 @@
+import json
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination
+
+
+# keyset (cursor) pagination for the products list, the cursor is opaque to the
+# client and every page is fetched with "WHERE id > last_seen ORDER BY id LIMIT n"
+# so the cost of a page does not depend on how deep the client has paged
+class ProductCursorPagination(CursorPagination):
+    page_size = 24
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = "id"
+
+
+# keyset pagination for a sorted (and filtered) products list. The ordering is a
+# column followed by id (unique), the cursor holds both values of the row it
+# starts after and a page is fetched with
+# "WHERE col >= v AND (col > v OR id > last_id) ORDER BY col, id LIMIT n",
+# which is a range scan on the (col, id) index
+class ProductSortedCursorPagination(ProductCursorPagination):
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        fields = [name.lstrip("-") for name in self.ordering]
+        descending = self.ordering[0].startswith("-")
+
+        ordering = self.ordering if not reverse else [self._invert(name) for name in self.ordering]
+        queryset = queryset.order_by(*ordering)
+        if self.cursor and self.cursor.position is not None:
+            values = self._decode_position(queryset.model, fields, self.cursor.position)
+            queryset = queryset.filter(self._after(fields, values, "lt" if descending != reverse else "gt"))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = self.cursor.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, bool(self.cursor and self.cursor.position is not None)
+
+        self.next_position = self._encode_position(self.page[-1], fields) if self.page else None
+        self.previous_position = self._encode_position(self.page[0], fields) if self.page else None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or self.next_position is None:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous or self.previous_position is None:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    @staticmethod
+    def _invert(name):
+        return name[1:] if name.startswith("-") else f"-{name}"
+
+    @staticmethod
+    def _after(fields, values, lookup):
+        # rows strictly after (lookup="gt") or before (lookup="lt") the position
+        if len(fields) == 1:
+            return Q(**{f"{fields[0]}__{lookup}": values[0]})
+        (field, id), (value, last_id) = fields, values
+        # the leading >= / <= lets the database range scan the index on (field, id)
+        return Q(**{f"{field}__{lookup}e": value}) & (Q(**{f"{field}__{lookup}": value}) | Q(**{f"{id}__{lookup}": last_id}))
+
+    @staticmethod
+    def _encode_position(instance, fields):
+        return json.dumps([getattr(instance, name) for name in fields], default=str)
+
+    def _decode_position(self, model, fields, position):
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError(position)
+            return [model._meta.get_field(name).to_python(value) for name, value in zip(fields, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+
+# search results are ordered by rank (not by a unique column) so they are paged by number
+class ProductSearchPagination(PageNumberPagination):
+    page_size = 24
+    page_size_query_param = "page_size"
+    max_page_size = 100
@@ -0,0 +1,94 @@
+import re
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import OperationalError
+from .models import Product
+
+
+# text index over Product.name and Product.description
+# postgres: GIN index on a weighted tsvector expression (name ranks above description)
+# sqlite: external content FTS5 table kept in sync with product_product by triggers
+
+PG_SEARCH_INDEX = "product_product_search_idx"
+PG_SEARCH_DOCUMENT = (
+    "(setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B'))"
+)
+PG_SEARCH_QUERY = "plainto_tsquery('english', %s)"
+
+SQLITE_SEARCH_TABLE = "product_product_fts"
+SQLITE_SEARCH_SETUP = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_SEARCH_TABLE}
+        USING fts5(name, description, content='product_product', content_rowid='id')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_SEARCH_TABLE}_ai AFTER INSERT ON product_product BEGIN
+        INSERT INTO {SQLITE_SEARCH_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_SEARCH_TABLE}_ad AFTER DELETE ON product_product BEGIN
+        INSERT INTO {SQLITE_SEARCH_TABLE}({SQLITE_SEARCH_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_SEARCH_TABLE}_au AFTER UPDATE ON product_product BEGIN
+        INSERT INTO {SQLITE_SEARCH_TABLE}({SQLITE_SEARCH_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {SQLITE_SEARCH_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    # index the rows that existed before the table was created
+    f"INSERT INTO {SQLITE_SEARCH_TABLE}({SQLITE_SEARCH_TABLE}) VALUES ('rebuild')",
+]
+
+
+def create_search_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Create the text index for the products table (connected to post_migrate)."""
+    connection = connections[using]
+    if Product._meta.db_table not in connection.introspection.table_names():
+        return
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {PG_SEARCH_INDEX} ON product_product USING GIN ({PG_SEARCH_DOCUMENT})"
+            )
+        elif connection.vendor == "sqlite":
+            if SQLITE_SEARCH_TABLE in connection.introspection.table_names():
+                return
+            try:
+                for statement in SQLITE_SEARCH_SETUP:
+                    cursor.execute(statement)
+            except OperationalError:
+                # sqlite was built without FTS5, search falls back to LIKE
+                pass
+
+
+def fts5_query(terms):
+    # quote every word so user input can never be parsed as FTS5 syntax,
+    # words are ANDed together and the last one is prefix matched
+    words = re.findall(r"\w+", terms)
+    return " ".join(f'"{word}"' for word in words[:-1]) + (f' "{words[-1]}"*' if words else "")
+
+
+def search_products(terms, using=DEFAULT_DB_ALIAS):
+    """Return the products matching terms, best match first (annotated with rank)."""
+    connection = connections[using]
+    products = Product.objects.using(using)
+
+    if connection.vendor == "postgresql":
+        return products.extra(
+            select={"rank": f"ts_rank({PG_SEARCH_DOCUMENT}, {PG_SEARCH_QUERY})"},
+            select_params=[terms],
+            where=[f"{PG_SEARCH_DOCUMENT} @@ {PG_SEARCH_QUERY}"],
+            params=[terms],
+        ).order_by("-rank", "id")
+
+    if connection.vendor == "sqlite" and SQLITE_SEARCH_TABLE in connection.introspection.table_names():
+        query = fts5_query(terms)
+        if not query:
+            return products.none()
+        # bm25 is lower for better matches, name hits weigh 10x description hits
+        return products.extra(
+            select={"rank": f"-bm25({SQLITE_SEARCH_TABLE}, 10.0, 1.0)"},
+            tables=[SQLITE_SEARCH_TABLE],
+            where=[f"{SQLITE_SEARCH_TABLE}.rowid = product_product.id", f"{SQLITE_SEARCH_TABLE} MATCH %s"],
+            params=[query],
+        ).order_by("-rank", "id")
+
+    # no text index available on this database
+    return products.filter(name__icontains=terms).order_by("id")
@@ -1,9 +1,28 @@
 from rest_framework import serializers
 from .models import Product
+from .images import image_srcset
 
 
 class ProductSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'stock', 'image']
+        fields = ['id', 'name', 'description', 'price', 'stock', 'image', 'srcset']
+
+    def get_srcset(self, obj):
+        return image_srcset(obj.image_variants)
+
+
+# the quantity changes with every checkout so it is only part of the details (and the
+# admin's writes), not of the list rows that are cached for the whole catalog
+class ProductDetailSerializer(ProductSerializer):
+
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['quantity']
+
+    def validate(self, attrs):
+        # a tracked product is in stock while it has units
+        if attrs.get('quantity') is not None:
+            attrs['stock'] = attrs['quantity'] > 0
+        return attrs
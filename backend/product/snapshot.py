@@ -0,0 +1,180 @@
+import os
+import json
+import mmap
+import fcntl
+import heapq
+import shutil
+import struct
+import bisect
+import tempfile
+import threading
+from array import array
+from django.conf import settings
+from django.core.files.storage import default_storage
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor
+from .cache import catalog_changes, local_catalog_version
+from .images import image_srcset
+from .models import Product
+
+
+# The product list pre-rendered to compact JSON, one row per product ordered by
+# id, in a file that every worker on the host memory maps. A page of the list is
+# a slice of that file, so serving it costs the same for any catalog size and
+# never goes through the ORM or DRF serializers.
+#
+# file layout:
+#   header length (8 bytes) | header json {"version", "count"}
+#   ids (count int64) | row offsets into data (count + 1 int64) | data (rows, each followed by ",")
+#
+# When the catalog version moves on, the rows of the products that changed since
+# the snapshot's version are re-read and merged into a new file (the whole file
+# is rebuilt only when those changes are not known anymore).
+
+ROW_FIELDS = ("id", "name", "description", "price", "stock", "image", "image_variants")
+HEADER = struct.Struct("<q")
+
+
+def render_row(id, name, description, price, stock, image, image_variants):
+    # same representation as ProductSerializer
+    row = {
+        "id": id,
+        "name": name,
+        "description": description,
+        "price": f"{price:.2f}",
+        "stock": stock,
+        "image": default_storage.url(image) if image else None,
+        "srcset": image_srcset(image_variants),
+    }
+    return json.dumps(row, separators=(",", ":")).encode() + b","
+
+
+def render_rows(queryset):
+    for values in queryset.order_by("id").values_list(*ROW_FIELDS).iterator(chunk_size=2000):
+        yield values[0], render_row(*values)
+
+
+class SnapshotFile:
+    """A mapped snapshot file (the map stays alive while a request still uses an older file)."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        (header_length,) = HEADER.unpack_from(view)
+        header = json.loads(bytes(view[HEADER.size:HEADER.size + header_length]))
+        self.version = header["version"]
+
+        count = header["count"]
+        start = HEADER.size + header_length
+        self.ids = view[start:start + 8 * count].cast("q")
+        start += 8 * count
+        self.offsets = view[start:start + 8 * (count + 1)].cast("q")
+        self.data = view[start + 8 * (count + 1):]
+
+    def rows(self):
+        for index, id in enumerate(self.ids):
+            yield id, bytes(self.data[self.offsets[index]:self.offsets[index + 1]])
+
+    def page(self, paginator, request):
+        """Render one page of the list (same body as ProductCursorPagination) as bytes."""
+        page_size = paginator.get_page_size(request)
+        paginator.base_url = request.build_absolute_uri()
+        cursor = paginator.decode_cursor(request)
+        try:
+            position = int(cursor.position) if cursor and cursor.position is not None else None
+        except ValueError:
+            raise NotFound(paginator.invalid_cursor_message)
+
+        count = len(self.ids)
+        if cursor and cursor.reverse:
+            end = bisect.bisect_left(self.ids, position) if position is not None else count
+            end = max(0, end - cursor.offset)
+            start = max(0, end - page_size)
+        else:
+            start = bisect.bisect_right(self.ids, position) if position is not None else 0
+            start = min(count, start + (cursor.offset if cursor else 0))
+            end = min(count, start + page_size)
+
+        next = None
+        if end < count:
+            position = str(self.ids[end - 1]) if end > 0 else None
+            next = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+        previous = None
+        if start > 0:
+            previous = paginator.encode_cursor(Cursor(offset=0, reverse=True, position=str(self.ids[start])))
+
+        # every row ends with "," so the last one is dropped from the slice
+        rows = bytes(self.data[self.offsets[start]:self.offsets[end] - 1]) if end > start else b""
+        return b"".join([
+            b'{"next":', json.dumps(next).encode(),
+            b',"previous":', json.dumps(previous).encode(),
+            b',"results":[', rows, b"]}",
+        ])
+
+
+class CatalogSnapshot:
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.file = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """Return the snapshot file brought up to the catalog version (as this process knows it)."""
+        version = local_catalog_version()["version"]
+        file = self.file
+        if file is None or file.version != version:
+            with self._lock:
+                if self.file is None or self.file.version != version:
+                    self._update(version)
+                file = self.file
+        return file
+
+    def _open(self):
+        try:
+            self.file = SnapshotFile(self.path)
+        except FileNotFoundError:
+            self.file = None
+        return self.file.version if self.file else None
+
+    def _update(self, version):
+        # another worker may have brought the file up to date already
+        if self._open() == version:
+            return
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            file_version = self._open()
+            if file_version == version:
+                return
+
+            ids, version = catalog_changes(file_version) if file_version else (None, version)
+            if ids is None:
+                rows = render_rows(Product.objects.all())
+            else:
+                changed = render_rows(Product.objects.filter(id__in=ids))
+                kept = ((id, row) for id, row in self.file.rows() if id not in ids)
+                rows = heapq.merge(kept, changed)
+            self._write(version, rows)
+            self._open()
+
+    def _write(self, version, rows):
+        ids, offsets = array("q"), array("q", [0])
+        directory = os.path.dirname(self.path)
+        with tempfile.TemporaryFile(dir=directory) as data:
+            for id, row in rows:
+                ids.append(id)
+                offsets.append(offsets[-1] + data.write(row))
+            header = json.dumps({"version": version, "count": len(ids)}).encode()
+
+            # write next to the old file and swap it in, readers keep their old map
+            fd, path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(len(header)) + header)
+                f.write(ids.tobytes())
+                f.write(offsets.tobytes())
+                data.seek(0)
+                shutil.copyfileobj(data, f)
+            os.replace(path, self.path)
+
+
+catalog_snapshot = CatalogSnapshot(settings.CATALOG_SNAPSHOT_PATH)
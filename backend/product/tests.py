@@ -1,12 +1,32 @@
+import io
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from PIL import Image
 from account import views
 from django.http import response
-from .models import Product
-from django.test import TestCase, Client
+from .models import Product, StockReservation
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, override_settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework.test import force_authenticate
 from rest_framework.test import APIRequestFactory
 from .views import ProductCreateView, ProductDeleteView, ProductEditView
+from .cache import TwoTierCache, catalog_version
+from .serializers import ProductSerializer
+from .images import render_derivatives, save_derivatives
+from .bulk import import_products, read_rows, update_prices_and_stock
+from .filters import filter_products
+from .inventory import OutOfStock, confirm, release, release_expired, reserve
+from .pagination import ProductSortedCursorPagination
+from django.db import connection
+from django.core.management import call_command
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 
@@ -202,3 +222,734 @@ class ProductApisAuthTest(ProductApisSetUp):
         response = view(request, 1)
         self.assertEqual(response.status_code, 403) # Forbidden
 
+
+
+class ProductPaginationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+        # setting up a catalog bigger than one page
+        for i in range(5):
+            Product.objects.create(
+                name=f'Product {i}',
+                description='Great product',
+                price=10 + i,
+                stock=True,
+            )
+
+    def test_products_list_is_paginated(self):
+        response = self.client.get("/api/products/?page_size=2")
+        self.assertEqual(response.status_code, 200)
+        page = json.loads(response.content)
+        self.assertEqual(len(page["results"]), 2)
+        self.assertIsNotNone(page["next"])
+
+    def test_products_list_next_cursor_walks_whole_catalog(self):
+        names = []
+        url = "/api/products/?page_size=2"
+        while url:
+            page = json.loads(self.client.get(url).content)
+            names += [product["name"] for product in page["results"]]
+            url = page["next"]
+        self.assertEqual(names, [f'Product {i}' for i in range(5)])
+
+    def test_products_list_page_size_is_capped(self):
+        response = self.client.get("/api/products/?page_size=100000")
+        self.assertEqual(response.status_code, 200)
+        page = json.loads(response.content)
+        self.assertEqual(len(page["results"]), 5)
+        self.assertIsNone(page["next"])
+
+    def test_products_list_with_invalid_cursor(self):
+        response = self.client.get("/api/products/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductSearchTest(TestCase):
+
+    def setUp(self):
+
+        # setting up products to search through
+        Product.objects.create(name='Apple Watch', description='Great Watch', price=399.99, stock=True)
+        Product.objects.create(name='Watch Strap', description='Fits the apple watch', price=19.99, stock=True)
+        Product.objects.create(name='Computer Chair', description='Comfortable chair', price=99.99, stock=True)
+
+    def test_search_without_term(self):
+        response = self.client.get(reverse("products-search"))
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_matches_name_and_description(self):
+        response = self.client.get(reverse("products-search"), {"q": "apple"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 2)
+        # name matches rank above description matches
+        self.assertEqual(response.data["results"][0]["name"], "Apple Watch")
+        self.assertNotContains(response, "Computer Chair")
+
+    def test_search_matches_word_prefix(self):
+        response = self.client.get(reverse("products-search"), {"q": "comp"})
+        self.assertEqual([p["name"] for p in response.data["results"]], ["Computer Chair"])
+
+    def test_search_ignores_query_syntax(self):
+        response = self.client.get(reverse("products-search"), {"q": '"chair (*'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 1)
+
+    def test_search_sees_edited_and_deleted_products(self):
+        chair = Product.objects.get(name='Computer Chair')
+        chair.name = 'Gaming Chair'
+        chair.save()
+        response = self.client.get(reverse("products-search"), {"q": "gaming"})
+        self.assertEqual(response.data["count"], 1)
+
+        chair.delete()
+        response = self.client.get(reverse("products-search"), {"q": "chair"})
+        self.assertEqual(response.data["count"], 0)
+
+    def test_search_is_paginated(self):
+        response = self.client.get(reverse("products-search"), {"q": "watch", "page_size": 1})
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNotNone(response.data["next"])
+
+
+class ProductConditionalGetTest(TestCase):
+
+    def setUp(self):
+
+        # setting up a new product
+        self.product = Product.objects.create(
+            name='Apple Watch',
+            description='Great Watch',
+            price=399.99,
+            stock=True,
+        )
+
+    def test_products_list_has_etag_and_last_modified(self):
+        response = self.client.get(reverse("products-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header("ETag"))
+        self.assertTrue(response.has_header("Last-Modified"))
+
+    def test_products_list_not_modified_without_queries(self):
+        etag = self.client.get(reverse("products-list"))["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("products-list"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_details_not_modified_without_queries(self):
+        url = reverse("product-details", args=[self.product.id])
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_read_is_served_without_queries(self):
+        self.client.get(reverse("products-list"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("products-list"))
+        self.assertContains(response, "Apple Watch")
+
+    def test_catalog_write_changes_etag_and_data(self):
+        url = reverse("product-details", args=[self.product.id])
+        etag = self.client.get(url)["ETag"]
+
+        self.product.price = 299.99
+        self.product.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertContains(response, "299.99")
+
+
+class TwoTierCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.shared = LocMemCache("two-tier-test", {})
+        self.shared.clear()
+        self.cache = TwoTierCache("test", ttl=60, stale_ttl=60, local_ttl=5, shared=self.shared)
+        self.loads = 0
+
+    def loader(self, value="value", delay=0):
+        def load():
+            self.loads += 1
+            time.sleep(delay)
+            return value
+        return load
+
+    def test_second_get_is_served_from_cache(self):
+        self.assertEqual(self.cache.get("key", self.loader()), "value")
+        self.assertEqual(self.cache.get("key", self.loader()), "value")
+        self.assertEqual(self.loads, 1)
+
+    def test_local_tier_is_filled_from_shared_tier(self):
+        self.cache.get("key", self.loader())
+        self.cache.local.clear()
+        self.assertEqual(self.cache.get("key", self.loader("other")), "value")
+        self.assertEqual(self.loads, 1)
+
+    def test_concurrent_misses_load_once(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get("key", self.loader(delay=0.2))))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["value"] * 10)
+        self.assertEqual(self.loads, 1)
+
+    def test_failed_load_is_raised_to_every_waiter_and_not_cached(self):
+        def fail():
+            raise ValueError("boom")
+        with self.assertRaises(ValueError):
+            self.cache.get("key", fail)
+        self.assertEqual(self.cache.get("key", self.loader()), "value")
+
+    def test_expired_entry_is_served_stale_while_refreshing(self):
+        self.cache.get("key", self.loader("old"))
+        with mock.patch("product.cache.time.time", return_value=time.time() + 90):
+            self.assertEqual(self.cache.get("key", self.loader("new")), "old")
+        self.cache.refresh_executor.submit(lambda: None).result()
+        self.assertEqual(self.loads, 2)
+        self.assertEqual(self.cache.get("key", self.loader("newer")), "new")
+
+    def test_delete_drops_both_tiers(self):
+        self.cache.get("key", self.loader("old"))
+        self.cache.delete("key")
+        self.assertEqual(self.cache.get("key", self.loader("new")), "new")
+
+
+class ProductDetailsCacheTest(TestCase):
+
+    def setUp(self):
+
+        # setting up a new product
+        self.product = Product.objects.create(
+            name='Apple Watch',
+            description='Great Watch',
+            price=399.99,
+            stock=True,
+        )
+        self.url = reverse("product-details", args=[self.product.id])
+
+    def test_product_details_served_without_queries(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, "Apple Watch")
+
+    def test_product_edit_invalidates_product_details(self):
+        self.client.get(self.url)
+        self.product.name = 'Apple Watch SE'
+        self.product.save()
+        self.assertContains(self.client.get(self.url), "Apple Watch SE")
+
+
+class CatalogSnapshotTest(TestCase):
+
+    def setUp(self):
+        # start from an unknown catalog version, so the snapshot is rebuilt from scratch
+        cache.clear()
+        for i in range(5):
+            Product.objects.create(
+                name=f'Product {i}',
+                description='Great product',
+                price=10 + i,
+                stock=i % 2 == 0,
+                image='apple.png' if i % 2 else None,
+            )
+
+    def test_snapshot_rows_match_serializer(self):
+        response = self.client.get(reverse("products-list"))
+        self.assertEqual(response["Content-Type"], "application/json")
+        expected = ProductSerializer(Product.objects.order_by("id"), many=True).data
+        self.assertEqual(json.loads(response.content)["results"], json.loads(json.dumps(expected)))
+
+    def test_products_list_served_without_queries(self):
+        self.client.get(reverse("products-list"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("products-list"))
+        self.assertContains(response, "Product 4")
+
+    @override_settings(CATALOG_VERSION_LOCAL_TTL=5)
+    def test_catalog_version_is_read_once_per_interval(self):
+        self.client.get(reverse("products-list"))
+        with mock.patch("product.cache.cache.get", wraps=cache.get) as shared_get:
+            self.client.get(reverse("products-list"))
+        shared_get.assert_not_called()
+        # a change made by this process shows at once
+        Product.objects.create(name='New Product', description='', price=1, stock=True)
+        self.assertContains(self.client.get(reverse("products-list")), "New Product")
+
+    def test_edit_only_reads_changed_product(self):
+        self.client.get(reverse("products-list"))
+        product = Product.objects.get(name='Product 2')
+        product.name = 'Edited Product'
+        product.save()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("products-list"))
+        names = [p["name"] for p in json.loads(response.content)["results"]]
+        self.assertEqual(names, ['Product 0', 'Product 1', 'Edited Product', 'Product 3', 'Product 4'])
+
+    def test_created_and_deleted_products_are_merged(self):
+        self.client.get(reverse("products-list"))
+        Product.objects.get(name='Product 1').delete()
+        Product.objects.create(name='New Product', description='', price=1, stock=True)
+
+        response = self.client.get(reverse("products-list"))
+        names = [p["name"] for p in json.loads(response.content)["results"]]
+        self.assertEqual(names, ['Product 0', 'Product 2', 'Product 3', 'Product 4', 'New Product'])
+
+    def test_previous_cursor_walks_back(self):
+        first = json.loads(self.client.get("/api/products/?page_size=2").content)
+        self.assertIsNone(first["previous"])
+        second = json.loads(self.client.get(first["next"]).content)
+        back = json.loads(self.client.get(second["previous"]).content)
+        self.assertEqual(back["results"], first["results"])
+
+
+class ProductImageDerivativesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.source = os.path.join(self.media_root, "chair.png")
+        Image.new("RGBA", (2000, 1000), (255, 0, 0, 255)).save(self.source)
+
+        self.product = Product.objects.create(
+            name='Computer Chair',
+            description='Comfortable chair',
+            price=99.99,
+            stock=True,
+            image='chair.png',
+        )
+
+    def test_render_derivatives(self):
+        variants = render_derivatives(self.source, self.media_root)
+        self.assertEqual(set(variants), {"thumbnail", "medium", "large"})
+        self.assertEqual(variants["thumbnail"]["width"], 160)
+
+        with Image.open(os.path.join(self.media_root, variants["medium"]["webp"])) as image:
+            self.assertEqual(image.format, "WEBP")
+            self.assertEqual(image.size, (480, 240))
+        with Image.open(os.path.join(self.media_root, variants["large"]["jpeg"])) as image:
+            self.assertEqual(image.format, "JPEG")
+
+    def test_small_images_are_not_upscaled(self):
+        Image.new("RGB", (100, 50)).save(self.source)
+        variants = render_derivatives(self.source, self.media_root)
+        self.assertEqual(variants["large"]["width"], 100)
+
+    def test_saved_derivatives_show_up_in_srcset(self):
+        variants = render_derivatives(self.source, self.media_root)
+        save_derivatives(Product, self.product.id, "chair.png", variants)
+
+        response = self.client.get(reverse("product-details", args=[self.product.id]))
+        self.assertEqual(response.data["srcset"]["thumbnail"]["webp"], "/images/derivatives/chair_thumbnail.webp")
+
+        page = json.loads(self.client.get(reverse("products-list")).content)
+        self.assertEqual(page["results"][-1]["srcset"], response.data["srcset"])
+
+    def test_derivatives_of_a_replaced_image_are_dropped(self):
+        variants = render_derivatives(self.source, self.media_root)
+        save_derivatives(Product, self.product.id, "old_chair.png", variants)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_variants, {})
+
+    def test_product_create_schedules_derivatives(self):
+        user = User.objects.create_superuser(username="admin", email="admin@gmail.com", password="admin1234")
+        upload = io.BytesIO()
+        Image.new("RGB", (10, 10)).save(upload, "JPEG")
+        image = SimpleUploadedFile("phone.jpg", content=upload.getvalue(), content_type='image/jpeg')
+
+        request = APIRequestFactory().post('/api/product-create/', {
+            "name": "smart phone",
+            "description": "great phone",
+            "price": "400.99",
+            "stock": "True",
+            "image": image,
+        })
+        force_authenticate(request, user=user)
+        with self.settings(MEDIA_ROOT=self.media_root), mock.patch("product.views.schedule_derivatives") as schedule:
+            response = ProductCreateView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(schedule.call_args[0][0].name, "smart phone")
+
+
+class ProductBulkImportExportTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin_user = User.objects.create_superuser(
+            username = "admin",
+            email = "admin@gmail.com",
+            password = "admin1234"
+        )
+        self.product = Product.objects.create(
+            name='Apple Watch',
+            description='Great Watch',
+            price=399.99,
+            stock=True,
+        )
+
+    def upload(self, name, content):
+        self.client.force_authenticate(user=self.admin_user)
+        upload = SimpleUploadedFile(name, content.encode())
+        return self.client.post(reverse("products-import"), {"file": upload}, format="multipart")
+
+    def test_import_csv_creates_and_updates(self):
+        response = self.upload("products.csv", (
+            "id,name,description,price,stock,image\n"
+            f"{self.product.id},Apple Watch SE,Cheaper watch,199.99,True,\n"
+            ",Computer Chair,,99.99,False,chair.png\n"
+            ",Gaming Chair,Comfortable,149.00,,\n"
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["updated"], 1)
+        self.assertEqual(response.data["failed"], 0)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.name, "Apple Watch SE")
+        self.assertEqual(f"{self.product.price}", "199.99")
+        self.assertFalse(Product.objects.get(name="Gaming Chair").stock)
+
+    def test_import_jsonl_reports_invalid_rows(self):
+        response = self.upload("products.jsonl", (
+            '{"name": "Phone", "price": "400.99", "stock": true}\n'
+            '{"name": "", "price": "abc"}\n'
+            'not json\n'
+            '{"name": "Tablet", "price": 1000000000}\n'
+            '{"name": "Laptop", "price": 999.5}\n'
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["failed"], 3)
+        self.assertEqual([error["row"] for error in response.data["errors"]], [2, 3, 4])
+        self.assertEqual(set(response.data["errors"][0]["errors"]), {"name", "price"})
+
+    def test_import_jsonl_updates_only_the_fields_of_the_row(self):
+        Product.objects.filter(id=self.product.id).update(quantity=3)
+        response = self.upload("products.jsonl", (
+            f'{{"id": {self.product.id}, "price": "349.99"}}\n'
+            '{"price": "10.00"}\n'
+        ))
+        self.assertEqual(response.data["updated"], 1)
+        self.assertEqual([error["errors"] for error in response.data["errors"]], [{"name": ["This field is required."]}])
+
+        self.product.refresh_from_db()
+        self.assertEqual(f"{self.product.price}", "349.99")
+        self.assertEqual(self.product.name, "Apple Watch")
+        self.assertEqual(self.product.description, "Great Watch")
+        self.assertEqual(self.product.quantity, 3)
+        self.assertTrue(self.product.stock)
+
+    def test_import_is_visible_in_products_list(self):
+        self.client.get(reverse("products-list"))
+        self.upload("products.jsonl", '{"name": "Phone", "price": "400.99"}\n')
+        self.assertContains(self.client.get(reverse("products-list")), "Phone")
+
+    def test_import_with_unknown_file_type(self):
+        response = self.upload("products.xml", "<products/>")
+        self.assertEqual(response.status_code, 400)
+
+    def test_import_without_admin_credentials(self):
+        user = User.objects.create_user(username="testuser", email="testuser@gmail.com", password="testuser1234")
+        self.client.force_authenticate(user=user)
+        upload = SimpleUploadedFile("products.csv", b"name,price\nPhone,1\n")
+        response = self.client.post(reverse("products-import"), {"file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_round_trips_through_import(self):
+        self.client.force_authenticate(user=self.admin_user)
+        for file_format in ["csv", "jsonl"]:
+            response = self.client.get(reverse("products-export"), {"file_format": file_format})
+            self.assertEqual(response.status_code, 200)
+            content = b"".join(response.streaming_content).decode()
+
+            report = import_products(read_rows(io.StringIO(content, newline=""), file_format))
+            self.assertEqual((report["created"], report["updated"], report["failed"]), (0, 1, 0))
+
+    def test_import_and_export_commands(self):
+        path = os.path.join(tempfile.mkdtemp(), "products.csv")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command("export_products", "--output", path)
+        Product.objects.all().delete()
+
+        out = io.StringIO()
+        call_command("import_products", path, stdout=out)
+        self.assertIn("created: 1", out.getvalue())
+        self.assertEqual(Product.objects.get().name, "Apple Watch")
+
+
+class ProductBatchUpdateTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin_user = User.objects.create_superuser(
+            username = "admin",
+            email = "admin@gmail.com",
+            password = "admin1234"
+        )
+        self.products = [
+            Product.objects.create(name=f'Product {i}', description='', price=10 + i, stock=True)
+            for i in range(3)
+        ]
+        self.client.force_authenticate(user=self.admin_user)
+
+    def test_batch_update_prices_and_stock(self):
+        first, second, third = self.products
+        response = self.client.patch(reverse("products-batch-update"), [
+            {"id": first.id, "price": "5.5"},
+            {"id": second.id, "stock": False},
+            {"id": third.id, "price": 1, "stock": False},
+        ], format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [
+            {"id": first.id, "status": "updated", "price": "5.50"},
+            {"id": second.id, "status": "updated", "stock": False},
+            {"id": third.id, "status": "updated", "price": "1.00", "stock": False},
+        ])
+
+        values = list(Product.objects.order_by("id").values_list("price", "stock"))
+        self.assertEqual([(f"{price}", stock) for price, stock in values], [("5.50", True), ("11.00", False), ("1.00", False)])
+
+    def test_batch_update_reports_unknown_and_invalid_ids(self):
+        response = self.client.patch(reverse("products-batch-update"), [
+            {"id": 999, "price": "1.00"},
+            {"id": self.products[0].id, "price": "abc"},
+            {"id": self.products[1].id},
+            {"price": "1.00"},
+        ], format="json")
+        statuses = [result["status"] for result in response.data]
+        self.assertEqual(statuses, ["invalid", "not_found", "invalid", "invalid"])
+        self.assertEqual(f"{Product.objects.get(id=self.products[0].id).price}", "10.00")
+
+    def test_batch_update_rejects_stock_of_tracked_products(self):
+        first, second, _ = self.products
+        Product.objects.filter(id__in=[first.id, second.id]).update(quantity=2)
+        response = self.client.patch(reverse("products-batch-update"), [
+            {"id": first.id, "price": "1.00", "stock": False},
+            {"id": second.id, "price": "2.00"},
+        ], format="json")
+        self.assertEqual([result["status"] for result in response.data], ["invalid", "updated"])
+        self.assertEqual(set(response.data[0]["errors"]), {"stock"})
+
+        values = list(Product.objects.order_by("id").values_list("price", "stock")[:2])
+        self.assertEqual([(f"{price}", stock) for price, stock in values], [("10.00", True), ("2.00", True)])
+
+    def test_batch_update_is_set_based(self):
+        changes = [{"id": product.id, "price": "1.00"} for product in self.products]
+        # savepoint, select of the matching ids, one update, release savepoint
+        with self.assertNumQueries(4):
+            update_prices_and_stock(changes)
+
+    def test_batch_update_invalidates_cached_reads(self):
+        product = self.products[0]
+        self.client.get(reverse("products-list"))
+        self.client.get(reverse("product-details", args=[product.id]))
+
+        self.client.patch(reverse("products-batch-update"), [{"id": product.id, "price": "1.00"}], format="json")
+
+        self.assertContains(self.client.get(reverse("product-details", args=[product.id])), '"price":"1.00"')
+        self.assertContains(self.client.get(reverse("products-list")), '"price":"1.00"')
+
+    def test_batch_update_without_admin_credentials(self):
+        user = User.objects.create_user(username="testuser", email="testuser@gmail.com", password="testuser1234")
+        self.client.force_authenticate(user=user)
+        response = self.client.patch(reverse("products-batch-update"), [{"id": 1, "price": "1.00"}], format="json")
+        self.assertEqual(response.status_code, 403)
+
+
+class ProductFilterTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+        # prices 20, 40, ..., 200 (two products share each price), every third one is out of stock
+        for i in range(10):
+            Product.objects.create(
+                name=f'Product {9 - i}',
+                description='',
+                price=20 * (i // 2 + 1),
+                stock=i % 3 != 0,
+            )
+
+    def get_all(self, url):
+        results = []
+        while url:
+            page = json.loads(self.client.get(url).content)
+            results += page["results"]
+            url = page["next"]
+        return results
+
+    def test_filter_on_price_range_and_stock(self):
+        results = self.get_all("/api/products/?min_price=40&max_price=100&in_stock=true")
+        self.assertEqual(len(results), 5)
+        for product in results:
+            self.assertTrue(40 <= float(product["price"]) <= 100)
+            self.assertTrue(product["stock"])
+
+    def test_sort_by_price_pages_through_ties(self):
+        results = self.get_all("/api/products/?ordering=-price&page_size=3")
+        expected = list(Product.objects.order_by("-price", "-id").values_list("id", flat=True))
+        self.assertEqual([product["id"] for product in results], expected)
+
+    def test_sort_by_name(self):
+        results = self.get_all("/api/products/?ordering=name&page_size=4")
+        self.assertEqual([product["name"] for product in results], [f'Product {i}' for i in range(10)])
+
+    def test_previous_cursor_returns_previous_page(self):
+        first = json.loads(self.client.get("/api/products/?ordering=price&page_size=3").content)
+        second = json.loads(self.client.get(first["next"]).content)
+        previous = json.loads(self.client.get(second["previous"]).content)
+        self.assertEqual(previous["results"], first["results"])
+        self.assertIsNone(previous["previous"])
+
+    def test_facet_counts(self):
+        response = self.client.get("/api/products/?max_price=100&facets=true")
+        facets = response.json()["facets"]
+        # stock counts follow the price filter
+        self.assertEqual(facets["stock"], {"in_stock": 6, "out_of_stock": 4})
+        # price buckets ignore the price filter itself
+        self.assertEqual([bucket["count"] for bucket in facets["price"]], [4, 4, 2, 0, 0])
+
+    def test_invalid_filters(self):
+        self.assertEqual(self.client.get("/api/products/?min_price=abc").status_code, 400)
+        self.assertEqual(self.client.get("/api/products/?in_stock=maybe").status_code, 400)
+        self.assertEqual(self.client.get("/api/products/?ordering=description").status_code, 400)
+        self.assertEqual(self.client.get("/api/products/?ordering=price&cursor=not-a-cursor").status_code, 404)
+
+
+class ProductQueryPlanTest(TestCase):
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf"USING (COVERING )?INDEX {index}\b")
+        # no full table scan, no sort of the rows
+        self.assertNotRegex(plan, r"SCAN (TABLE )?product_product(?! USING)")
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def setUp(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("the plans below are sqlite's")
+
+    def test_price_range_sorted_by_price_uses_index(self):
+        queryset = filter_products({"min_price": 10, "max_price": 100}).order_by("price", "id")
+        self.assertUsesIndex(queryset, "product_price_idx")
+
+    def test_stock_and_price_range_uses_index(self):
+        queryset = filter_products({"in_stock": True, "min_price": 10, "max_price": 100}).order_by("price", "id")
+        self.assertUsesIndex(queryset, "product_stock_price_idx")
+
+    def test_sorted_by_name_uses_index(self):
+        self.assertUsesIndex(Product.objects.order_by("-name", "-id"), "product_name_idx")
+
+    def test_stock_sorted_by_name_uses_index(self):
+        queryset = filter_products({"in_stock": False}).order_by("name", "id")
+        self.assertUsesIndex(queryset, "product_stock_name_idx")
+
+    def test_keyset_page_uses_index(self):
+        after = ProductSortedCursorPagination._after(["price", "id"], [50, 7], "gt")
+        queryset = Product.objects.filter(after).order_by("price", "id")[:24]
+        self.assertUsesIndex(queryset, "product_price_idx")
+
+
+class ProductInventoryTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Hot Product', description='', price=10, stock=True, quantity=3)
+
+    def test_reserve_takes_units(self):
+        reservation = reserve(self.product.id, 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 1)
+        self.assertTrue(self.product.stock)
+        self.assertEqual(reservation.quantity, 2)
+
+    def test_reserve_never_oversells(self):
+        reserve(self.product.id, 2)
+        with self.assertRaises(OutOfStock):
+            reserve(self.product.id, 2)
+        reserve(self.product.id, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 0)
+        self.assertFalse(self.product.stock)
+
+    def test_reserve_is_a_single_conditional_update(self):
+        # savepoint, update, insert of the reservation, release savepoint
+        with self.assertNumQueries(4):
+            reserve(self.product.id, 1)
+
+    def test_release_gives_units_back_once(self):
+        reservation = reserve(self.product.id, 3)
+        self.assertTrue(release(reservation))
+        self.assertFalse(release(reservation))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 3)
+        self.assertTrue(self.product.stock)
+
+    def test_release_bumps_the_catalog_only_when_restocking(self):
+        reservation = reserve(self.product.id, 1)
+        version = catalog_version()["version"]
+        release(reservation)
+        self.assertEqual(catalog_version()["version"], version)
+
+        reservation = reserve(self.product.id, 3)
+        version = catalog_version()["version"]
+        release(reservation)
+        self.assertNotEqual(catalog_version()["version"], version)
+
+    def test_confirm_keeps_units_sold(self):
+        reservation = reserve(self.product.id, 1)
+        self.assertTrue(confirm(reservation))
+        self.assertFalse(StockReservation.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 2)
+
+    def test_expired_reservations_are_released(self):
+        reserve(self.product.id, 3, ttl=-1)
+        self.assertEqual(release_expired(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 3)
+
+    def test_reserve_reclaims_expired_reservations(self):
+        reserve(self.product.id, 3, ttl=-1)
+        reserve(self.product.id, 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 1)
+
+    def test_untracked_product(self):
+        product = Product.objects.create(name='Untracked', description='', price=10, stock=True)
+        self.assertIsNone(reserve(product.id))
+        product.stock = False
+        product.save()
+        with self.assertRaises(OutOfStock):
+            reserve(product.id)
+
+    def test_sold_out_product_leaves_the_in_stock_list(self):
+        self.client.get("/api/products/?in_stock=true")
+        reserve(self.product.id, 3)
+        response = self.client.get("/api/products/?in_stock=true")
+        self.assertEqual(response.json()["results"], [])
+        self.assertContains(self.client.get(reverse("product-details", args=[self.product.id])), '"quantity":0')
+
+
+# the benchmark's threads need to see the committed product
+class ProductInventoryBenchmarkTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command("benchmark_reservations", quantity=20, threads=1, fail_rate=0.5, stdout=out)
+        self.assertIn("left: 0, oversold: 0", out.getvalue())
+        self.assertFalse(Product.objects.exists())
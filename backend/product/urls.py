@@ -4,6 +4,10 @@ from product import views
 
 urlpatterns = [
     path('products/', views.ProductView.as_view(), name="products-list"),
+    path('products/search/', views.ProductSearchView.as_view(), name="products-search"),
+    path('products/import/', views.ProductImportView.as_view(), name="products-import"),
+    path('products/export/', views.ProductExportView.as_view(), name="products-export"),
+    path('products/batch/', views.ProductBatchUpdateView.as_view(), name="products-batch-update"),
     path('product/<str:pk>/', views.ProductDetailView.as_view(), name="product-details"),
     path('product-create/', views.ProductCreateView.as_view(), name="product-create"),
     path('product-update/<str:pk>/', views.ProductEditView.as_view(), name="product-update"),
@@ -1,8 +1,26 @@
+import io
+import os
+import json
+import time
+import hashlib
 from .models import Product
 from rest_framework import status
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework.views import APIView
-from .serializers import ProductSerializer
+from .serializers import ProductDetailSerializer, ProductSerializer
+from .search import search_products
+from .cache import catalog_etag, catalog_last_modified, product_details_cache
+from .snapshot import catalog_snapshot
+from .images import schedule_derivatives
+from .bulk import FORMATS, MAX_BATCH_CHANGES, export_products, import_products, read_rows, update_prices_and_stock
+from .filters import FILTER_PARAMS, ORDERINGS, filter_products, parse_filters, product_facets
+from .pagination import ProductCursorPagination, ProductSearchPagination, ProductSortedCursorPagination
 from rest_framework.response import Response
 from rest_framework import authentication, permissions
 from rest_framework.decorators import permission_classes
@@ -10,18 +28,66 @@ from rest_framework.decorators import permission_classes
 
 class ProductView(APIView):
 
+    pagination_class = ProductCursorPagination
+    filtered_pagination_class = ProductSortedCursorPagination
+
+    @method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified))
     def get(self, request):
-        products = Product.objects.all()
+        if any(name in request.query_params for name in FILTER_PARAMS):
+            return self.get_filtered(request)
+
+        # pages are cut from the pre-rendered catalog snapshot, no ORM or serializer involved
+        page = catalog_snapshot.current().page(self.pagination_class(), request)
+        return HttpResponse(page, content_type="application/json", status=status.HTTP_200_OK)
+
+    def get_filtered(self, request):
+        # ?min_price=&max_price=&in_stock=&ordering=&facets=true, see filters.py
+        filters = parse_filters(request.query_params)
+        paginator = self.filtered_pagination_class()
+        paginator.ordering = ORDERINGS[filters["ordering"]]
+
+        products = paginator.paginate_queryset(filter_products(filters), request, view=self)
         serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        data = paginator.get_paginated_response(serializer.data).data
+        if filters.get("facets"):
+            data["facets"] = product_facets(filters)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class ProductSearchView(APIView):
+
+    pagination_class = ProductSearchPagination
+
+    def get(self, request):
+        terms = request.query_params.get("q", "").strip()
+        if not terms:
+            return Response({"detail": "search term cannot be empty"}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = self.pagination_class()
+        products = paginator.paginate_queryset(search_products(terms), request, view=self)
+        serializer = ProductSerializer(products, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class ProductDetailView(APIView):
 
     def get(self, request, pk):
-        product = Product.objects.get(id=pk)
-        serializer = ProductSerializer(product, many=False)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        def build():
+            product = Product.objects.get(id=pk)
+            serializer = ProductDetailSerializer(product, many=False)
+            data = serializer.data
+            etag = hashlib.md5(json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest()
+            return {"data": data, "etag": quote_etag(etag), "modified": int(time.time())}
+
+        # served from the two tier cache, the validators come from the cached entry
+        # so a 304 is answered without touching the ORM
+        details = product_details_cache.get(pk, build)
+        response = get_conditional_response(request, etag=details["etag"], last_modified=details["modified"])
+        if response is None:
+            response = Response(details["data"], status=status.HTTP_200_OK)
+            response["ETag"] = details["etag"]
+            response["Last-Modified"] = http_date(details["modified"])
+        return response
 
 
 class ProductCreateView(APIView):
@@ -37,12 +103,13 @@ class ProductCreateView(APIView):
             "description": data["description"],
             "price": data["price"],
             "stock": data["stock"],
+            "quantity": data.get("quantity"),
             "image": data["image"],
         }
 
-        serializer = ProductSerializer(data=product, many=False)
+        serializer = ProductDetailSerializer(data=product, many=False)
         if serializer.is_valid():
-            serializer.save()
+            schedule_derivatives(serializer.save())
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
             return Response({"detail": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
@@ -74,12 +141,71 @@ class ProductEditView(APIView):
             "description": data["description"] if data["description"] else product.description,
             "price": data["price"] if data["price"] else product.price,
             "stock": data["stock"],
+            "quantity": data.get("quantity", product.quantity),
             "image": data["image"] if data["image"] else product.image,
         }
 
-        serializer = ProductSerializer(product, data=updated_product)
+        image = product.image.name
+        serializer = ProductDetailSerializer(product, data=updated_product)
         if serializer.is_valid():
-            serializer.save()
+            product = serializer.save()
+            # a new image gets new variants, until they are ready the original is used
+            if product.image.name != image:
+                product.image_variants = {}
+                product.save(update_fields=["image_variants"])
+                schedule_derivatives(product)
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
             return Response({"detail": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+
+# bulk import of products from an uploaded .csv or .jsonl file
+class ProductImportView(APIView):
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"detail": "file is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        file_format = os.path.splitext(upload.name)[1].lstrip(".").lower()
+        if file_format not in FORMATS:
+            return Response({"detail": f"file must be one of: {', '.join(FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # the upload is spooled to disk by django, rows are read from it as a stream
+        stream = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+        report = import_products(read_rows(stream, file_format))
+        return Response(report, status=status.HTTP_200_OK)
+
+
+# bulk export of the whole catalog, streamed a row at a time
+class ProductExportView(APIView):
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in FORMATS:
+            return Response({"detail": f"file_format must be one of: {', '.join(FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_type = "text/csv" if file_format == "csv" else "application/x-ndjson"
+        response = StreamingHttpResponse(export_products(file_format), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="products.{file_format}"'
+        return response
+
+
+# change the price and / or stock of many products at once
+class ProductBatchUpdateView(APIView):
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def patch(self, request):
+        changes = request.data
+        if not isinstance(changes, list):
+            return Response({"detail": "expected a list of {id, price, stock} changes"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(changes) > MAX_BATCH_CHANGES:
+            return Response({"detail": f"at most {MAX_BATCH_CHANGES} changes per request"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = update_prices_and_stock(changes)
+        return Response(results, status=status.HTTP_200_OK)
@@ -2,9 +2,28 @@
 
 set -e
 
+# the same image runs the workers of the app, their compose services give the role as argument
+case "$1" in
+    charge-worker)
+        # the charges of the checkouts (see payments/charges.py)
+        exec python manage.py process_charge_jobs
+        ;;
+    event-worker)
+        # the events stripe sent to the webhook (see payments/events.py)
+        exec python manage.py process_stripe_events
+        ;;
+    reservation-releaser)
+        # the units held by checkouts that never finished (see product/inventory.py)
+        exec python manage.py release_expired_reservations --every 60
+        ;;
+esac
+
 if [ "$RUN_MIGRATIONS" = "true" ]; then
     echo "Running database migrations..."
     python manage.py migrate
+    python manage.py createcachetable
+    # the seed data (db.sqlite3) gets the tables of the current models before it is dumped
+    python manage.py rebuild_sqlite_seed
     python manage.py dumpdata --database=sqlite --natural-foreign --natural-primary -e contenttypes -e auth.Permission --indent 4 > datadump.json
     python manage.py loaddata datadump.json
     rm -f db.sqlite3
@@ -28,19 +28,50 @@ import {
 import axios from 'axios'
 
 
-// products list
-export const getProductsList = () => async (dispatch) => {
+// products list (pass the "next" url of the previous page to load the following page)
+export const getProductsList = (next = null) => async (dispatch) => {
     try {
         dispatch({
-            type: PRODUCTS_LIST_REQUEST
+            type: PRODUCTS_LIST_REQUEST,
+            append: Boolean(next)
+        })
+
+        // call api (only the query string of the next url is used, it holds the opaque cursor)
+        const { data } = await axios.get(`/api/products/${next ? new URL(next).search : ""}`)
+
+        dispatch({
+            type: PRODUCTS_LIST_SUCCESS,
+            payload: data.results,
+            next: data.next,
+            append: Boolean(next)
+        })
+    } catch (error) {
+        dispatch({
+            type: PRODUCTS_LIST_FAIL,
+            payload: error.message
+        })
+    }
+}
+
+
+// products search (ranked server side, pass the "next" url of the previous page to load the following page)
+export const searchProducts = (searchTerm, next = null) => async (dispatch) => {
+    try {
+        dispatch({
+            type: PRODUCTS_LIST_REQUEST,
+            append: Boolean(next)
         })
 
         // call api
-        const { data } = await axios.get("/api/products/")
+        const { data } = next
+            ? await axios.get(`/api/products/search/${new URL(next).search}`)
+            : await axios.get("/api/products/search/", { params: { q: searchTerm } })
 
         dispatch({
             type: PRODUCTS_LIST_SUCCESS,
-            payload: data
+            payload: data.results,
+            next: data.next,
+            append: Boolean(next)
         })
     } catch (error) {
         dispatch({
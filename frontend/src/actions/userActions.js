@@ -490,10 +490,11 @@ export const deleteUserAddress = (id) => async (dispatch, getState) => {
 }
 
 // get all orders
-export const getAllOrders = () => async (dispatch, getState) => {
+export const getAllOrders = (filters = {}, next = null) => async (dispatch, getState) => {
     try {
         dispatch({
-            type: GET_ALL_ORDERS_REQUEST
+            type: GET_ALL_ORDERS_REQUEST,
+            append: Boolean(next)
         })
 
         const {
@@ -504,18 +505,22 @@ export const getAllOrders = () => async (dispatch, getState) => {
             headers: {
                 "Content-Type": "application/json",
                 Authorization: `Bearer ${userInfo.token}`
-            }
+            },
+            // searched and paged server side, the "next" url of a page holds the filters and the cursor
+            params: next ? {} : { page_size: 50, ...filters }
         }
 
         // call api
         const { data } = await axios.get(
-            `/account/all-orders-list/`,
+            `/account/all-orders-list/${next ? new URL(next).search : ""}`,
             config
         )
 
         dispatch({
             type: GET_ALL_ORDERS_SUCCESS,
-            payload: data
+            payload: data.results,
+            next: data.next,
+            append: Boolean(next)
         })
 
     } catch (error) {
@@ -18,7 +18,7 @@ const ChargeCardComponent = ({ product, match, selectedAddressId, addressSelecte
 
     // charge card reducer
     const chargeCardReducer = useSelector(state => state.chargeCardReducer)
-    const { success: chargeSuccessfull, error: chargeError, loading: chargingStatus } = chargeCardReducer
+    const { success: chargeSuccessfull, job: chargeJob, error: chargeError, loading: chargingStatus } = chargeCardReducer
 
     // get single address reducer    
     const getSingleAddressReducer = useSelector(state => state.getSingleAddressReducer)
@@ -41,6 +41,7 @@ const ChargeCardComponent = ({ product, match, selectedAddressId, addressSelecte
             "card_number": cardData.card_data.last4,
             "address": address_detail,
             "ordered_item": product.name,
+            "product_id": product.id,
             "paid_status": true,
             "total_price": product.price,
             "is_delivered": false,
@@ -49,10 +50,11 @@ const ChargeCardComponent = ({ product, match, selectedAddressId, addressSelecte
         dispatch(chargeCustomer(data))
     }
 
+    // the payment is queued, the status page follows it until it is done
     if (chargeSuccessfull) {
         history.push({
             pathname: '/payment-status/',
-            state: { detail: product }
+            state: { detail: product, jobId: chargeJob.job_id }
         })
         window.location.reload()
     }
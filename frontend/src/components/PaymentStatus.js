@@ -1,17 +1,95 @@
-import React from 'react'
-import { Card } from 'react-bootstrap'
+import React, { useEffect, useState } from 'react'
+import axios from 'axios'
+import { Card, Spinner } from 'react-bootstrap'
+import { useSelector } from 'react-redux'
 import { useLocation } from "react-router-dom";
 import { Link } from 'react-router-dom'
 import Message from "./Message"
 
+// the payment is charged by a worker, its status is asked every POLL_INTERVAL ms until it is done
+const POLL_INTERVAL = 1500
+
 const PaymentStatus = () => {
     const location = useLocation()
+    const jobId = location.state && location.state.jobId
+
+    // login reducer
+    const userLoginReducer = useSelector(state => state.userLoginReducer)
+    const { userInfo } = userLoginReducer
+
+    const [job, setJob] = useState(null)
+    const [pollError, setPollError] = useState("")
+
+    useEffect(() => {
+        if (!jobId || !userInfo) {
+            return
+        }
+        let timer = null
+        let cancelled = false
+
+        const config = {
+            headers: {
+                "Content-Type": "application/json",
+                Authorization: `Bearer ${userInfo.token}`
+            }
+        }
+
+        const poll = async () => {
+            try {
+                const { data } = await axios.get(`/payments/charge-jobs/${jobId}/`, config)
+                if (cancelled) return
+                setJob(data)
+                if (data.status === "queued" || data.status === "running") {
+                    timer = setTimeout(poll, POLL_INTERVAL)
+                }
+            } catch (error) {
+                if (cancelled) return
+                setPollError(error.response && error.response.data.detail ? error.response.data.detail : error.message)
+            }
+        }
+        poll()
+
+        return () => {
+            cancelled = true
+            clearTimeout(timer)
+        }
+    }, [jobId, userInfo])
 
     const renderData = () => {
 
         try {
             const boughtData = location.state.detail
 
+            if (pollError) {
+                return <Message variant='danger'>{pollError}</Message>
+            }
+
+            if (jobId && (!job || job.status === "queued" || job.status === "running")) {
+                return (
+                    <div>
+                        <h3 className="text-info">Processing your payment</h3>
+                        <Card className="p-3">
+                            <span style={{ display: "flex" }}>
+                                <Spinner animation="border" size="sm" className="mr-2 mt-1" />
+                                Please wait, {boughtData.name} is being paid for.
+                            </span>
+                        </Card>
+                    </div>
+                )
+            }
+
+            if (job && job.status === "failed") {
+                return (
+                    <div>
+                        <h3 className="text-danger">Payment Failed</h3>
+                        <Card className="p-3">
+                            {job.error || "Your payment could not be completed."}
+                            <Link to={`/product/${boughtData.id}/`}>Try again</Link>
+                        </Card>
+                    </div>
+                )
+            }
+
             return (
                 <div>
                     <h3 className="text-success">Payment was Successfull</h3>
@@ -3,6 +3,11 @@ import { Link } from 'react-router-dom'
 
 import React from 'react'
 
+// "url width" pairs of the resized copies of the product image (for the srcSet attribute)
+const srcSet = (srcset, format) => Object.values(srcset || {})
+    .map((variant) => `${variant[format]} ${variant.width}w`)
+    .join(", ")
+
 function Product({ product }) {
     return (
         <div>
@@ -10,7 +15,17 @@ function Product({ product }) {
 
                 <Card.Body>
                 <Link to={`/product/${product.id}`}>
-                    <Card.Img variant="top" src={product.image} height="162" />
+                    <picture>
+                        <source type="image/webp" srcSet={srcSet(product.srcset, "webp")} sizes="(min-width: 1200px) 25vw, (min-width: 768px) 50vw, 100vw" />
+                        <Card.Img
+                            variant="top"
+                            src={product.image}
+                            srcSet={srcSet(product.srcset, "jpeg") || undefined}
+                            sizes="(min-width: 1200px) 25vw, (min-width: 768px) 50vw, 100vw"
+                            height="162"
+                            loading="lazy"
+                        />
+                    </picture>
                 </Link>
                     <Link to={`/product/${product.id}`}>
                         <Card.Title as="div">
@@ -28,7 +28,7 @@ function OrdersListPage() {
 
     // get all orders reducer
     const getAllOrdersReducer = useSelector(state => state.getAllOrdersReducer)
-    const { orders, loading: loadingOrders } = getAllOrdersReducer
+    const { orders, next, loading: loadingOrders } = getAllOrdersReducer
 
     // change delivery status reducer
     const changeDeliveryStatusReducer = useSelector(state => state.changeDeliveryStatusReducer)
@@ -68,11 +68,13 @@ function OrdersListPage() {
         dispatch({
             type: CHANGE_DELIVERY_STATUS_RESET
         })
-        dispatch(getAllOrders())
+        dispatch(getAllOrders(cloneSearchTerm ? { q: cloneSearchTerm } : {}))
     }
 
+    // searched server side (customer name, address or ordered item)
     const handleSearchTerm = (term) => {
         setCloneSearchTerm(term)
+        dispatch(getAllOrders(term ? { q: term } : {}))
     };
 
 
@@ -105,18 +107,7 @@ function OrdersListPage() {
                         </tr>
                     </thead>
 
-                    {/* filter orders by name, address or ordered item */}
-
-                    {orders.filter((item) => (
-
-                        item.name.toLowerCase().includes(cloneSearchTerm)
-                        ||
-                        item.ordered_item.toLowerCase().includes(cloneSearchTerm)
-                        ||
-                        item.address.toLowerCase().includes(cloneSearchTerm)
-                    )
-
-                    ).map((order, idx) => (
+                    {orders.map((order, idx) => (
                         <tbody key={idx}>
                             <tr className="text-center">
                                 <td>
@@ -175,6 +166,13 @@ function OrdersListPage() {
                     ))}
                 </Table>
                 : <Message variant="info">No orders yet.</Message> }
+                {next && !loadingOrders && <div className="text-center my-3">
+                    <button
+                        className="btn btn-primary button-focus-css"
+                        onClick={() => dispatch(getAllOrders({}, next))}
+                    >Load more
+                    </button>
+                </div>}
         </div>
     )
 }
@@ -17,6 +17,7 @@ const ProductCreatePage = () => {
     const [description, setDescription] = useState("")
     const [price, setPrice] = useState("")
     const [stock, setStock] = useState(false)
+    const [quantity, setQuantity] = useState("")
     const [image, setImage] = useState(null)
 
     // login reducer
@@ -46,6 +47,7 @@ const ProductCreatePage = () => {
         form_data.append('description', description)
         form_data.append('price', price)
         form_data.append('stock', stock)
+        form_data.append('quantity', quantity)
         form_data.append('image', image)
 
         dispatch(createProduct(form_data))
@@ -128,6 +130,22 @@ const ProductCreatePage = () => {
                     </Form.Control>
                 </Form.Group>
 
+                <Form.Group controlId='quantity'>
+                    <Form.Label>
+                        <b>
+                            Quantity
+                        </b>
+                    </Form.Label>
+                    <Form.Control
+                        type="number"
+                        min="0"
+                        value={quantity}
+                        placeholder="leave empty to not track inventory"
+                        onChange={(e) => setQuantity(e.target.value)}
+                    >
+                    </Form.Control>
+                </Form.Group>
+
                 <span style={{ display: "flex" }}>
                     <label>In Stock</label>
                     <input
@@ -28,6 +28,7 @@ const ProductUpdatePage = ({ match }) => {
     const [description, setDescription] = useState("")
     const [price, setPrice] = useState("")
     const [stock, setStock] = useState(product.stock)
+    const [quantity, setQuantity] = useState(product.quantity ?? "")
     const [image, setImage] = useState("")
 
     let history = useHistory()
@@ -68,6 +69,7 @@ const ProductUpdatePage = ({ match }) => {
         form_data.append('description', description)
         form_data.append('price', price)
         form_data.append('stock', stock)
+        form_data.append('quantity', quantity)
         form_data.append('image', image)
 
         dispatch(updateProduct(productId, form_data))
@@ -208,6 +210,22 @@ const ProductUpdatePage = ({ match }) => {
                     </Form.Control>
                 </Form.Group>
 
+                <Form.Group controlId='quantity'>
+                    <Form.Label>
+                        <b>
+                            Quantity
+                        </b>
+                    </Form.Label>
+                    <Form.Control
+                        type="number"
+                        min="0"
+                        defaultValue={product.quantity}
+                        placeholder="leave empty to not track inventory"
+                        onChange={(e) => setQuantity(e.target.value)}
+                    >
+                    </Form.Control>
+                </Form.Group>
+
                 <span style={{ display: "flex" }}>
                     <label>In Stock</label>
                     <input
@@ -1,6 +1,6 @@
 import React, { useEffect } from 'react'
 import { useDispatch, useSelector } from 'react-redux'
-import { getProductsList } from '../actions/productActions'
+import { getProductsList, searchProducts } from '../actions/productActions'
 import Message from '../components/Message'
 import { Spinner, Row, Col } from 'react-bootstrap'
 import Product from '../components/Product'
@@ -11,20 +11,20 @@ import { CREATE_PRODUCT_RESET } from '../constants'
 function ProductsListPage() {
 
     let history = useHistory()
-    let searchTerm = history.location.search
+    let searchTerm = new URLSearchParams(history.location.search).get("searchTerm")
     const dispatch = useDispatch()
 
     // products list reducer
     const productsListReducer = useSelector(state => state.productsListReducer)
-    const { loading, error, products } = productsListReducer
+    const { loading, error, products, next } = productsListReducer
 
     useEffect(() => {
-        dispatch(getProductsList())
+        dispatch(searchTerm ? searchProducts(searchTerm) : getProductsList())
         dispatch({
             type: CREATE_PRODUCT_RESET
         })
         //dispatch(checkTokenValidation())
-    }, [dispatch])
+    }, [dispatch, searchTerm])
 
     const showNothingMessage = () => {
         return (
@@ -46,15 +46,11 @@ function ProductsListPage() {
             <div>
                 <Row>
 
-                    {/* If length of the filter result is equal to 0 then show 'nothing found' message
-                        with help of showNothingMessage function else show the filtered result on the
-                        webpage and then run the map function */}
+                    {/* If there are no products (or no search results, search is done by the server)
+                        then show 'nothing found' message with help of showNothingMessage function
+                        else show the products on the webpage and then run the map function */}
 
-                    {(products.filter((item) =>
-                        item.name.toLowerCase().includes(searchTerm !== "" ? searchTerm.split("=")[1] : "")
-                    )).length === 0 ? showNothingMessage() : (products.filter((item) =>
-                        item.name.toLowerCase().includes(searchTerm !== "" ? searchTerm.split("=")[1] : "")
-                    )).map((product, idx) => (
+                    {products.length === 0 ? showNothingMessage() : products.map((product, idx) => (
                         <Col key={product.id} sm={12} md={6} lg={4} xl={3}>
                             <div className="mx-2"> 
                                 <Product product={product} />
@@ -63,6 +59,13 @@ function ProductsListPage() {
                     )
                     )}
                 </Row>
+                {next && !loading && <div className="text-center my-3">
+                    <button
+                        className="btn btn-primary button-focus-css"
+                        onClick={() => dispatch(searchTerm ? searchProducts(searchTerm, next) : getProductsList(next))}
+                    >Load more
+                    </button>
+                </div>}
             </div>
         </div>
     )
@@ -80,6 +80,7 @@ export const chargeCardReducer = (state = {}, action) => {
                 ...state,
                 loading: false,
                 success: true,
+                job: action.payload,
                 error: ""
             }
         case CHARGE_CARD_FAIL:
@@ -32,20 +32,21 @@ import {
 
 
 // products list
-export const productsListReducer = (state = { products: [] }, action) => {
+export const productsListReducer = (state = { products: [], next: null }, action) => {
     switch (action.type) {
         case PRODUCTS_LIST_REQUEST:
             return {
                 ...state,
                 loading: true,
-                products: [],   // always pass the object during the request
+                products: action.append ? state.products : [],   // always pass the object during the request
                 error: ""
             }
         case PRODUCTS_LIST_SUCCESS:
             return {
                 ...state,
                 loading: false,
-                products: action.payload,
+                products: action.append ? [...state.products, ...action.payload] : action.payload,
+                next: action.next,
                 error: ""
             }
         case PRODUCTS_LIST_FAIL:
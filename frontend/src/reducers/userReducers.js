@@ -441,20 +441,21 @@ export const deleteUserAddressReducer = (state = {}, action) => {
 }
 
 // get all orders reducer
-export const getAllOrdersReducer = (state = {orders: []}, action) => {
+export const getAllOrdersReducer = (state = {orders: [], next: null}, action) => {
     switch(action.type) {
         case GET_ALL_ORDERS_REQUEST:
             return {
                 ...state, 
                 loading: true,
-                orders: [],
+                orders: action.append ? state.orders : [],
                 error: ""
             }
         case GET_ALL_ORDERS_SUCCESS:
             return {
                 ...state, 
                 loading: false,
-                orders: action.payload,
+                orders: action.append ? [...state.orders, ...action.payload] : action.payload,
+                next: action.next,
                 error: ""
             }
         case GET_ALL_ORDERS_FAIL: